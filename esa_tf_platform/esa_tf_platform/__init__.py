@@ -14,7 +14,13 @@
 
 __version__ = "1.5.9-osf"
 
+from .hub_health import get_hubs_health
 from .logger_setup import logger_setup
-from .workflows import get_all_workflows, run_workflow
+from .workflows import (
+    get_all_workflows,
+    get_workflows_registry,
+    invalidate_workflows_registry,
+    run_workflow,
+)
 
 logger_setup()
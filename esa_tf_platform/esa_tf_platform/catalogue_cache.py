@@ -0,0 +1,165 @@
+import concurrent.futures
+import functools
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import cachetools
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+DEFAULT_SIZE = 1024
+
+
+class CatalogueCache:
+    """
+    Cache of the product info resolved by the hub catalogues (download URL, checksum and
+    size), keyed by hub URL and product name. The entries are kept in memory in a TTL cache
+    with least recently used eviction; if ``cache_dir`` is given, they are also written in
+    ``cache_dir`` as JSON files, so that they are shared by the workers of a host.
+    """
+
+    def __init__(self, maxsize=DEFAULT_SIZE, ttl=DEFAULT_TTL, cache_dir=None):
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.memory = cachetools.TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_path(self, hub, product):
+        key = hashlib.sha1(f"{hub}\n{product}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, hub, product):
+        """Return the cached product info, or None if it is missing or expired."""
+        with self._lock:
+            product_info = self.memory.get((hub, product))
+        if product_info is not None or not self.cache_dir:
+            return product_info
+        try:
+            with open(self.entry_path(hub, product)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            return None
+        with self._lock:
+            self.memory[(hub, product)] = entry["product_info"]
+        return entry["product_info"]
+
+    def put(self, hub, product, product_info):
+        with self._lock:
+            self.memory[(hub, product)] = product_info
+        if not self.cache_dir:
+            return
+        entry = {"product_info": product_info, "expires_at": time.time() + self.ttl}
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self.entry_path(hub, product))
+        except OSError:
+            logger.exception(
+                f"not able to write the catalogue cache entry of {product}"
+            )
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def invalidate(self, hub, product):
+        with self._lock:
+            self.memory.pop((hub, product), None)
+        if self.cache_dir:
+            try:
+                os.remove(self.entry_path(hub, product))
+            except FileNotFoundError:
+                pass
+
+
+class BatchResolver:
+    """
+    Coalesce the lookups of different products requested concurrently with calls of
+    ``resolve_batch(products)``, which returns a dictionary product -> product info.
+    With ``window`` 0 a lookup is resolved at once if no call is running, otherwise it
+    waits for the running calls and the lookups queued in the meantime are resolved
+    together. With ``window`` > 0 the products requested within ``window`` seconds from
+    the first one are resolved with a single call.
+    The lookup of the products missing from the result returns None.
+    """
+
+    def __init__(self, resolve_batch, window, max_batch_size):
+        self.resolve_batch = resolve_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.pending = {}
+        self.running = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, product):
+        flush = False
+        with self._lock:
+            future = self.pending.get(product) or self.running.get(product)
+            if future is None:
+                future = concurrent.futures.Future()
+                self.pending[product] = future
+                if self.window > 0 and len(self.pending) == 1:
+                    timer = threading.Timer(self.window, self.flush)
+                    timer.daemon = True
+                    timer.start()
+                flush = len(self.pending) >= self.max_batch_size or (
+                    self.window <= 0 and not self.running
+                )
+        if flush:
+            self.flush()
+        return future.result()
+
+    def flush(self):
+        with self._lock:
+            batch, self.pending = self.pending, {}
+            self.running.update(batch)
+        if not batch:
+            return
+        try:
+            products_info = self.resolve_batch(list(batch))
+        except Exception as ex:
+            for future in batch.values():
+                future.set_exception(ex)
+        else:
+            for product, future in batch.items():
+                future.set_result(products_info.get(product))
+        finally:
+            with self._lock:
+                for product, future in batch.items():
+                    if self.running.get(product) is future:
+                        del self.running[product]
+                queued = self.window <= 0 and self.pending and not self.running
+            # without window the lookups queued during the call are resolved now, in
+            # another thread not to delay the caller
+            if queued:
+                thread = threading.Thread(target=self.flush, daemon=True)
+                thread.start()
+
+
+@functools.lru_cache()
+def _catalogue_cache(maxsize, ttl, cache_dir):
+    return CatalogueCache(maxsize=maxsize, ttl=ttl, cache_dir=cache_dir)
+
+
+def get_catalogue_cache():
+    """
+    Return the catalogue cache configured with the environment variables
+    ``CATALOGUE_CACHE_TTL`` (seconds, default 300, 0 disables the cache),
+    ``CATALOGUE_CACHE_SIZE`` (default 1024 entries) and ``CATALOGUE_CACHE_DIR``
+    (on-disk tier, disabled by default). Return None if the cache is disabled.
+    """
+    ttl = float(os.getenv("CATALOGUE_CACHE_TTL", DEFAULT_TTL))
+    if ttl <= 0:
+        return None
+    maxsize = int(os.getenv("CATALOGUE_CACHE_SIZE", DEFAULT_SIZE))
+    cache_dir = os.getenv("CATALOGUE_CACHE_DIR") or None
+    return _catalogue_cache(maxsize, ttl, cache_dir)
@@ -3,9 +3,12 @@ import logging
 import os
 import pathlib
 import subprocess
+import zipfile
 
 import pkg_resources
 
+from . import extraction
+
 logger = logging.getLogger(__name__)
 
 store_suffix = {"zarr": "zarr", "cog": "cog", "netcdf": "nc"}
@@ -65,6 +68,19 @@ PRODUCT_TYPE_NC = [
 ]
 
 
+def input_product_url(product_path):
+    """
+    Return the path of the product read by EOPF. For a zip file, return the fsspec URL of
+    the product folder (e.g. ``S2A_MSIL1C_...SAFE``) at the top level of the archive, so
+    that EOPF reads the product directly from the zip file.
+    """
+    if not product_path.endswith(".zip"):
+        return product_path
+    with zipfile.ZipFile(product_path) as zf:
+        folder = extraction.product_folder(zf.infolist())
+    return f"zip://{folder}::file://{os.path.abspath(product_path)}"
+
+
 def run_processing(
     product_path, *, workflow_options, processing_dir, output_dir, target_store="zarr"
 ):
@@ -74,10 +90,11 @@ def run_processing(
     eopf_convert_cli = pkg_resources.resource_filename(
         __package__, os.path.join("resources", "eopf_convert_cli.py")
     )
+    input_path = input_product_url(product_path)
     cmd = (
         f"conda run -n eopf python "
         f"{eopf_convert_cli} "
-        f"{product_path} "
+        f"{input_path} "
         f"{output_product} "
         f"{target_store} "
         f'"{workflow_options.__repr__()}"'
@@ -136,6 +153,7 @@ eopf_to_zarr_workflow_api = {
     "Description": "EOPF plugin for converting Sentinel-1, Sentinel-2 and "
     "Sentinel-3 SAFE in zarr format",
     "Execute": "esa_tf_platform.esa_tf_plugin_eopf.convert_to_zarr_run_processing",
+    "InputProductAccess": "zip",
     "InputProductType": PRODUCT_TYPE_ZARR,
     "OutputProductType": None,
     "WorkflowVersion": "0.3",
@@ -170,6 +188,7 @@ eopf_to_netcdf_workflow_api = {
     "Description": "EOPF plugin for converting Sentinel-1, Sentinel-2 and "
     "Sentinel-3 SAFE in netcdf format",
     "Execute": "esa_tf_platform.esa_tf_plugin_eopf.convert_to_netcdf_run_processing",
+    "InputProductAccess": "zip",
     "InputProductType": PRODUCT_TYPE_NC,
     "OutputProductType": None,
     "WorkflowVersion": "0.3",
@@ -203,6 +222,7 @@ eopf_to_cog_workflow_api = {
     "Description": "EOPF plugin for converting Sentinel-1, Sentinel-2 and "
     "Sentinel-3 SAFE in COG format",
     "Execute": "esa_tf_platform.esa_tf_plugin_eopf.convert_to_cog_run_processing",
+    "InputProductAccess": "zip",
     "InputProductType": PRODUCT_TYPE_COG,
     "OutputProductType": None,
     "WorkflowVersion": "0.3",
@@ -0,0 +1,123 @@
+import concurrent.futures
+import fnmatch
+import heapq
+import logging
+import os
+import pathlib
+import shutil
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTRACTION_THREADS = 4
+COPY_BUFFER_SIZE = 1024**2
+
+
+def member_path(processing_dir, name):
+    """Return the extraction path of the member ``name``, dropping absolute paths and
+    parent directory references as ``zipfile`` does."""
+    parts = [
+        part
+        for part in name.replace("\\", "/").split("/")
+        if part not in ("", ".", "..")
+    ]
+    return os.path.join(processing_dir, *parts)
+
+
+def product_folder(infolist):
+    """Return the name of the product folder, the first component of the first member."""
+    return pathlib.Path(infolist[0].filename).parts[0]
+
+
+def select_members(infolist, patterns):
+    """
+    Return the members matching at least one of the glob ``patterns``, matched against the
+    member names relative to the product folder (e.g. ``GRANULE/*/IMG_DATA/*_B04.jp2``).
+    The directories are always selected.
+    """
+    selected = []
+    for info in infolist:
+        relative_name = info.filename.split("/", 1)[-1]
+        if info.is_dir() or any(
+            fnmatch.fnmatchcase(relative_name, pattern) for pattern in patterns
+        ):
+            selected.append(info)
+    return selected
+
+
+def split_members(infolist, bins):
+    """
+    Split the members in ``bins`` lists with similar total size: the members are assigned
+    from the largest to the smallest to the list with the smallest total size.
+    """
+    heap = [(0, index) for index in range(bins)]
+    lists = [[] for _ in range(bins)]
+    for info in sorted(infolist, key=lambda info: info.file_size, reverse=True):
+        total, index = heapq.heappop(heap)
+        lists[index].append(info)
+        heapq.heappush(heap, (total + info.file_size, index))
+    return [members for members in lists if members]
+
+
+def preallocate(f, size):
+    if size <= 0 or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError:
+        # preallocation is not supported by all the file systems
+        pass
+
+
+def extract_files(product_zip_file, members, processing_dir):
+    """Extract ``members`` opening ``product_zip_file`` once."""
+    with zipfile.ZipFile(product_zip_file, "r") as product_zip:
+        for info in members:
+            target = member_path(processing_dir, info.filename)
+            with product_zip.open(info) as source, open(target, "wb") as out:
+                preallocate(out, info.file_size)
+                shutil.copyfileobj(source, out, COPY_BUFFER_SIZE)
+
+
+def extract_members(product_zip_file, processing_dir, members=None, threads=None):
+    """
+    Extract the members of ``product_zip_file`` in ``processing_dir`` with ``threads``
+    threads (default ``EXTRACTION_THREADS`` environment variable), each one opening the
+    zip file once and extracting a share of the members with similar total size.
+
+    :param list members: ``ZipInfo`` of the members to extract, all of them by default
+    :return str: the path of the extracted product folder
+    """
+    if threads is None:
+        threads = int(os.getenv("EXTRACTION_THREADS", DEFAULT_EXTRACTION_THREADS))
+    with zipfile.ZipFile(product_zip_file, "r") as product_zip:
+        infolist = product_zip.infolist()
+    folder = os.path.join(processing_dir, product_folder(infolist))
+    if members is None:
+        members = infolist
+
+    files = []
+    directories = {folder}
+    for info in members:
+        target = member_path(processing_dir, info.filename)
+        if info.is_dir():
+            directories.add(target)
+        else:
+            directories.add(os.path.dirname(target))
+            files.append(info)
+    for directory in sorted(directories):
+        os.makedirs(directory, exist_ok=True)
+
+    bins = split_members(files, max(threads, 1))
+    if len(bins) <= 1:
+        for members_bin in bins:
+            extract_files(product_zip_file, members_bin, processing_dir)
+        return folder
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(bins)) as pool:
+        futures = [
+            pool.submit(extract_files, product_zip_file, members_bin, processing_dir)
+            for members_bin in bins
+        ]
+        for future in futures:
+            future.result()
+    return folder
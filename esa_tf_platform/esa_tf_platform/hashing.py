@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import mmap
+import os
+import queue
+import threading
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+logger = logging.getLogger(__name__)
+
+# checksum algorithms in order of preference, the fastest first
+ALGORITHMS_PREFERENCE = ("blake3", "xxh3", "xxh128", "xxh64", "sha256", "md5")
+# multihash codes of the supported algorithms, see https://github.com/multiformats/multicodec
+MULTIHASH_CODES = {0xD5: "md5", 0x12: "sha256", 0x1E: "blake3"}
+# number of chunks that the download can enqueue before waiting for the hasher thread
+HASHER_QUEUE_SIZE = 256
+MMAP_BLOCK_SIZE = 16 * 1024**2
+
+
+def normalize_algorithm(algorithm):
+    """Return the algorithm name in lower case without separators, e.g. SHA-256 -> sha256."""
+    return algorithm.lower().replace("-", "").replace("_", "")
+
+
+def new_hash(algorithm):
+    """Return a new hash object of ``algorithm``, or None if it is not available."""
+    algorithm = normalize_algorithm(algorithm)
+    if algorithm in ("md5", "sha256"):
+        return hashlib.new(algorithm)
+    if algorithm == "blake3" and blake3 is not None:
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    if algorithm in ("xxh3", "xxh64", "xxh128") and xxhash is not None:
+        return getattr(xxhash, algorithm if algorithm != "xxh3" else "xxh3_64")()
+    return None
+
+
+def is_available(algorithm):
+    return new_hash(algorithm) is not None
+
+
+def select_checksum(checksums):
+    """
+    Select among the ``{algorithm: value}`` checksums of a product the one with the
+    fastest available algorithm. Return ``(algorithm, value)``, ``(None, None)`` if none
+    of the algorithms is available.
+    """
+    checksums = {
+        normalize_algorithm(algorithm): value
+        for algorithm, value in checksums.items()
+        if value
+    }
+    for algorithm in ALGORITHMS_PREFERENCE:
+        if algorithm in checksums and is_available(algorithm):
+            return algorithm, checksums[algorithm].lower()
+    logger.warning(
+        f"none of the checksum algorithms {list(checksums)} is available, "
+        f"the supported ones are {[a for a in ALGORITHMS_PREFERENCE if is_available(a)]}"
+    )
+    return None, None
+
+
+def read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def parse_multihash(multihash):
+    """
+    Return ``(algorithm, hexdigest)`` of the hexadecimal ``multihash`` (as the STAC
+    ``file:checksum``), ``algorithm`` is None if the hash function is not supported.
+    """
+    data = bytes.fromhex(multihash)
+    code, position = read_varint(data, 0)
+    length, position = read_varint(data, position)
+    digest = data[position : position + length]
+    if len(digest) != length:
+        raise ValueError(f"invalid multihash {multihash!r}")
+    return MULTIHASH_CODES.get(code), digest.hex()
+
+
+class BackgroundHasher:
+    """
+    Compute the checksum of the chunks passed to ``update`` in a separate thread, so
+    that the hashing does not slow down the thread reading from the network. The chunks
+    are passed through a queue of at most ``maxsize`` chunks.
+    """
+
+    def __init__(self, algorithm, maxsize=HASHER_QUEUE_SIZE):
+        self.hash = new_hash(algorithm)
+        if self.hash is None:
+            raise ValueError(f"checksum algorithm {algorithm!r} not available")
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            try:
+                self.hash.update(chunk)
+            except Exception as ex:
+                self.error = ex
+
+    def update(self, chunk):
+        self.queue.put(chunk)
+
+    def close(self):
+        """Stop the hasher thread, waiting for the queued chunks to be hashed."""
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+
+    def hexdigest(self):
+        self.close()
+        if self.error is not None:
+            raise self.error
+        return self.hash.hexdigest()
+
+
+class FileHasher:
+    """
+    Compute the checksum of a file while it is written out of order, e.g. by the
+    segments of a download: ``update(watermark)`` reports that the first ``watermark``
+    bytes of the file are written, they are read back, from the page cache, and hashed in
+    offset order by a separate thread.
+    """
+
+    def __init__(self, path, algorithm, block_size=MMAP_BLOCK_SIZE):
+        self.path = path
+        self.hash = new_hash(algorithm)
+        if self.hash is None:
+            raise ValueError(f"checksum algorithm {algorithm!r} not available")
+        self.block_size = block_size
+        self.watermark = 0
+        self.position = 0
+        self.error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        fd = None
+        try:
+            while True:
+                with self._condition:
+                    while self.watermark <= self.position and not self._closed:
+                        self._condition.wait()
+                    watermark = self.watermark
+                    if watermark <= self.position:
+                        return
+                if fd is None:
+                    fd = os.open(self.path, os.O_RDONLY)
+                while self.position < watermark:
+                    size = min(self.block_size, watermark - self.position)
+                    block = os.pread(fd, size, self.position)
+                    if not block:
+                        raise EOFError(f"{self.path} truncated at {self.position}")
+                    self.hash.update(block)
+                    self.position += len(block)
+        except Exception as ex:
+            self.error = ex
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def update(self, watermark):
+        with self._condition:
+            if watermark > self.watermark:
+                self.watermark = watermark
+                self._condition.notify()
+
+    def close(self):
+        """Stop the hasher thread, waiting for the bytes written to be hashed."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def hexdigest(self):
+        self.close()
+        if self.error is not None:
+            raise self.error
+        return self.hash.hexdigest()
+
+
+def file_checksum(path, algorithm="md5", block_size=MMAP_BLOCK_SIZE):
+    """Return the checksum of the file in ``path`` reading it with ``mmap``."""
+    hash_object = new_hash(algorithm)
+    if hash_object is None:
+        raise ValueError(f"checksum algorithm {algorithm!r} not available")
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return hash_object.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for start in range(0, size, block_size):
+                    hash_object.update(view[start : start + block_size])
+    return hash_object.hexdigest()
@@ -0,0 +1,160 @@
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# number of recent downloads used to compute the success rate
+WINDOW_SIZE = 20
+# consecutive failures opening the circuit of a hub
+FAILURE_THRESHOLD = 3
+# time (s) a hub with open circuit is skipped before being tried again
+OPEN_DURATION = 300
+EWMA_WEIGHT = 0.3
+
+
+def ewma(previous, value, weight=EWMA_WEIGHT):
+    if previous is None:
+        return value
+    return weight * value + (1 - weight) * previous
+
+
+class HubHealth:
+    """
+    Health of a hub as seen by the current worker: success rate of the recent downloads,
+    moving averages of download throughput and time to first byte, and a circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit is opened and the hub is
+    skipped for ``open_duration`` seconds. Then the circuit is half-open: a single download
+    is allowed, if it succeeds the circuit is closed, otherwise it is opened again.
+    """
+
+    def __init__(
+        self,
+        window_size=WINDOW_SIZE,
+        failure_threshold=FAILURE_THRESHOLD,
+        open_duration=OPEN_DURATION,
+    ):
+        self.failure_threshold = failure_threshold
+        self.open_duration = open_duration
+        self.outcomes = collections.deque(maxlen=window_size)
+        self.throughput = None
+        self.ttfb = None
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if self.probing or time.monotonic() - self.opened_at >= self.open_duration:
+            return HALF_OPEN
+        return OPEN
+
+    @property
+    def success_rate(self):
+        if not self.outcomes:
+            return 1.0
+        return sum(self.outcomes) / len(self.outcomes)
+
+    def allow_request(self):
+        """Return True if a download can be attempted on the hub. In half-open state only
+        one download at time is allowed."""
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def available(self):
+        """Return True if the circuit is not open, without reserving the half-open probe."""
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and not self.probing)
+
+    def record_success(self, throughput=None):
+        with self._lock:
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probing = False
+            if throughput is not None:
+                self.throughput = ewma(self.throughput, throughput)
+
+    def record_failure(self):
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            if self.probing or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release(self):
+        """Release the half-open probe reserved by ``allow_request`` when the download
+        was not attempted or did not tell anything about the hub health."""
+        with self._lock:
+            self.probing = False
+
+    def record_ttfb(self, ttfb):
+        with self._lock:
+            self.ttfb = ewma(self.ttfb, ttfb)
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "success_rate": self.success_rate,
+            "downloads": len(self.outcomes),
+            "consecutive_failures": self.consecutive_failures,
+            "throughput": self.throughput,
+            "ttfb": self.ttfb,
+        }
+
+
+HUBS_HEALTH = {}
+_hubs_health_lock = threading.Lock()
+
+
+def get_hub_health(hub_name):
+    """Return the health of the hub, it is created the first time the hub is used."""
+    with _hubs_health_lock:
+        if hub_name not in HUBS_HEALTH:
+            HUBS_HEALTH[hub_name] = HubHealth()
+        return HUBS_HEALTH[hub_name]
+
+
+def synchronize_hubs(hub_names):
+    """Forget the health of the hubs that are no more configured."""
+    with _hubs_health_lock:
+        for hub_name in HUBS_HEALTH.keys() - set(hub_names):
+            HUBS_HEALTH.pop(hub_name)
+
+
+def order_hubs(hub_names):
+    """
+    Sort the hubs putting first the ones with closed circuit, then by success rate.
+    The hubs with the same health keep the configuration order. The hubs with open circuit
+    are put at the end: they are tried only if all the others fail.
+    """
+    return sorted(
+        hub_names,
+        key=lambda hub_name: (
+            not get_hub_health(hub_name).available(),
+            -get_hub_health(hub_name).success_rate,
+        ),
+    )
+
+
+def get_hubs_health():
+    """Return the health statistics of the hubs used by the current worker."""
+    with _hubs_health_lock:
+        hubs_health = dict(HUBS_HEALTH)
+    return {hub_name: health.to_dict() for hub_name, health in hubs_health.items()}
@@ -0,0 +1,46 @@
+import glob
+import logging
+import os
+import pathlib
+
+import dask.distributed
+
+from . import product_cache
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_LOCALITY_TOPIC = "esa_tf-product-locality"
+
+
+def local_products():
+    """
+    Return the names of the input products available on the host of the worker: the
+    products in the product cache and, in debug mode, the ones kept in the processing dirs.
+    """
+    products = set()
+    cache = product_cache.get_product_cache()
+    if cache is not None:
+        products.update(product for _, _, product in cache.entries())
+    if int(os.getenv("TF_DEBUG", 0)):
+        working_dir = os.getenv("WORKING_DIR", "/working_dir")
+        for path in glob.glob(os.path.join(working_dir, "*", "*.zip")):
+            products.add(pathlib.Path(path).stem)
+    return sorted(products)
+
+
+def report_products(products, held=True):
+    """
+    Publish on the ``PRODUCT_LOCALITY_TOPIC`` Dask topic that the host of the current
+    worker holds (``held=True``) or no more holds (``held=False``) the ``products``.
+    It does nothing outside a Dask worker.
+    """
+    try:
+        worker = dask.distributed.get_worker()
+    except ValueError:
+        return
+    products = [pathlib.Path(product).stem for product in products]
+    logger.debug(f"reporting products {products!r} held={held} on host {worker.ip}")
+    worker.log_event(
+        PRODUCT_LOCALITY_TOPIC,
+        {"host": worker.ip, "products": products, "held": held},
+    )
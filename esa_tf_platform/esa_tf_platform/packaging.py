@@ -0,0 +1,460 @@
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import stat
+import struct
+import tempfile
+import time
+import zlib
+
+from . import hashing
+
+logger = logging.getLogger(__name__)
+
+# extensions of the files already compressed, stored in the zip without compression
+DEFAULT_STORED_EXTENSIONS = (
+    ".jp2",
+    ".j2k",
+    ".tif",
+    ".tiff",
+    ".nc",
+    ".h5",
+    ".hdf5",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gz",
+    ".zip",
+    ".zst",
+)
+DEFAULT_COMPRESSION_LEVEL = 6
+DEFAULT_PACKAGING_THREADS = 4
+DEFAULT_CHECKSUM_ALGORITHM = "sha256"
+MANIFEST_SUFFIX = ".manifest.json"
+# compressed data kept in memory before spilling to a temporary file
+SPOOL_SIZE = 16 * 1024**2
+COPY_BUFFER_SIZE = 1024**2
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+# sizes, offsets and number of members above these limits require the ZIP64 extensions
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# values written in the 32 and 16 bit fields replaced by ZIP64 fields
+MAX_UINT32 = 0xFFFFFFFF
+MAX_UINT16 = 0xFFFF
+ZIP64_VERSION = 45
+DEFAULT_VERSION = 20
+UTF8_FLAG = 0x800
+CREATE_SYSTEM_UNIX = 3
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+END_RECORD = struct.Struct("<4s4H2LH")
+ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+ZIP64_END_LOCATOR = struct.Struct("<4sLQL")
+
+CompressedMember = collections.namedtuple(
+    "CompressedMember", ["data", "crc", "compress_size", "file_size", "checksum"]
+)
+
+
+class ZipMember:
+    """Entry of the zip archive being written."""
+
+    __slots__ = (
+        "path",
+        "name",
+        "is_dir",
+        "mode",
+        "mtime",
+        "method",
+        "crc",
+        "compress_size",
+        "file_size",
+        "header_offset",
+        "checksum",
+    )
+
+    def __init__(self, path, name, st, method):
+        self.path = path
+        self.name = name
+        self.is_dir = stat.S_ISDIR(st.st_mode)
+        self.mode = st.st_mode
+        self.mtime = st.st_mtime
+        self.method = method
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+        self.header_offset = 0
+        self.checksum = None
+
+    @property
+    def zip64(self):
+        return self.file_size >= ZIP64_LIMIT or self.compress_size >= ZIP64_LIMIT
+
+    def dos_datetime(self):
+        t = time.localtime(self.mtime)
+        year = min(max(t.tm_year, 1980), 2107)
+        dos_date = (year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+        dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+        return dos_time, dos_date
+
+    def encoded_name(self):
+        try:
+            return self.name.encode("ascii"), 0
+        except UnicodeEncodeError:
+            return self.name.encode("utf-8"), UTF8_FLAG
+
+    def local_header(self):
+        name, flags = self.encoded_name()
+        dos_time, dos_date = self.dos_datetime()
+        extra = b""
+        compress_size, file_size = self.compress_size, self.file_size
+        if self.zip64:
+            extra = struct.pack("<2H2Q", 1, 16, file_size, compress_size)
+            compress_size = file_size = MAX_UINT32
+        return (
+            LOCAL_HEADER.pack(
+                b"PK\x03\x04",
+                ZIP64_VERSION if self.zip64 else DEFAULT_VERSION,
+                flags,
+                self.method,
+                dos_time,
+                dos_date,
+                self.crc,
+                compress_size,
+                file_size,
+                len(name),
+                len(extra),
+            )
+            + name
+            + extra
+        )
+
+    def central_header(self):
+        name, flags = self.encoded_name()
+        dos_time, dos_date = self.dos_datetime()
+        sizes = [self.file_size, self.compress_size, self.header_offset]
+        zip64_fields = [value for value in sizes if value >= ZIP64_LIMIT]
+        extra = b""
+        if zip64_fields:
+            extra = struct.pack(
+                f"<2H{len(zip64_fields)}Q", 1, 8 * len(zip64_fields), *zip64_fields
+            )
+            sizes = [MAX_UINT32 if value >= ZIP64_LIMIT else value for value in sizes]
+        version = ZIP64_VERSION if zip64_fields else DEFAULT_VERSION
+        external_attr = (self.mode & 0xFFFF) << 16
+        if self.is_dir:
+            external_attr |= 0x10
+        return (
+            CENTRAL_HEADER.pack(
+                b"PK\x01\x02",
+                CREATE_SYSTEM_UNIX << 8 | version,
+                version,
+                flags,
+                self.method,
+                dos_time,
+                dos_date,
+                self.crc,
+                sizes[1],
+                sizes[0],
+                len(name),
+                len(extra),
+                0,
+                0,
+                0,
+                external_attr,
+                sizes[2],
+            )
+            + name
+            + extra
+        )
+
+
+def is_stored(name, stored_extensions):
+    """Return True if the member is already compressed: its extension is in
+    ``stored_extensions`` or it is a chunk of a Zarr store."""
+    if os.path.splitext(name)[1].lower() in stored_extensions:
+        return True
+    return any(part.endswith(".zarr") for part in name.split("/")[:-1])
+
+
+def list_members(folder, stored_extensions):
+    """Return the members of the zip of ``folder``, the folder itself first, with paths
+    relative to the parent of ``folder`` as ``zip -r``. The symbolic links are followed,
+    a folder already listed, e.g. a link to one of its parents, is skipped."""
+    folder = folder.rstrip("/")
+    parent = os.path.dirname(folder)
+    members = []
+    visited = set()
+    for dirpath, dirnames, filenames in os.walk(folder, followlinks=True):
+        st = os.stat(dirpath)
+        visited.add((st.st_dev, st.st_ino))
+        for dirname in list(dirnames):
+            dir_st = os.stat(os.path.join(dirpath, dirname))
+            if (dir_st.st_dev, dir_st.st_ino) in visited:
+                logger.warning(
+                    f"{os.path.join(dirpath, dirname)!r} skipped: folder already packaged"
+                )
+                dirnames.remove(dirname)
+            else:
+                visited.add((dir_st.st_dev, dir_st.st_ino))
+        dirnames.sort()
+        relative_dir = os.path.relpath(dirpath, parent).replace(os.sep, "/")
+        members.append(ZipMember(dirpath, f"{relative_dir}/", st, ZIP_STORED))
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            name = f"{relative_dir}/{filename}"
+            method = ZIP_STORED if is_stored(name, stored_extensions) else ZIP_DEFLATED
+            members.append(ZipMember(path, name, os.stat(path), method))
+    return members
+
+
+def compress_file(path, level, checksum_algorithm=DEFAULT_CHECKSUM_ALGORITHM):
+    """Deflate the file in ``path`` in a spooled temporary file, computing its CRC-32
+    and checksum."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    hash_object = hashing.new_hash(checksum_algorithm)
+    data = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    crc = file_size = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+            crc = zlib.crc32(block, crc)
+            hash_object.update(block)
+            file_size += len(block)
+            data.write(compressor.compress(block))
+    data.write(compressor.flush())
+    compress_size = data.tell()
+    data.seek(0)
+    return CompressedMember(
+        data, crc, compress_size, file_size, hash_object.hexdigest()
+    )
+
+
+class ZipWriter:
+    """
+    Write a zip archive whose members sizes and CRC-32 are written in the local headers
+    (no data descriptors), using the ZIP64 extensions when needed. The deflated members
+    are compressed before being written, the stored members are read once: their local
+    header is completed once their data is written. The central directory is written by
+    ``close``.
+
+    The checksum of the archive is computed by a background hasher reading back, from the
+    page cache, the members completely written, and is available in ``checksum`` after
+    ``close``.
+    """
+
+    def __init__(self, path, checksum_algorithm=DEFAULT_CHECKSUM_ALGORITHM):
+        self.path = path
+        self.fp = open(path, "wb")
+        self.members = []
+        self.size = 0
+        self.checksum = None
+        self.checksum_algorithm = checksum_algorithm
+        self.hasher = hashing.FileHasher(path, checksum_algorithm)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.hasher.close()
+            self.fp.close()
+
+    def write(self, data):
+        self.fp.write(data)
+        self.size += len(data)
+
+    def add_member(self, member):
+        """Add the member written, its bytes are passed to the hasher of the archive."""
+        self.members.append(member)
+        self.fp.flush()
+        self.hasher.update(self.size)
+
+    def write_compressed(self, member, compressed):
+        member.header_offset = self.size
+        member.crc = compressed.crc
+        member.file_size = compressed.file_size
+        member.compress_size = compressed.compress_size
+        member.checksum = compressed.checksum
+        self.write(member.local_header())
+        with compressed.data:
+            for block in iter(lambda: compressed.data.read(COPY_BUFFER_SIZE), b""):
+                self.write(block)
+        self.add_member(member)
+
+    def write_stored(self, member):
+        """Write the member without compression, computing its CRC-32 and checksum while
+        its data is copied."""
+        member.header_offset = self.size
+        if member.is_dir:
+            self.write(member.local_header())
+            self.add_member(member)
+            return
+        hash_object = hashing.new_hash(self.checksum_algorithm)
+        crc = 0
+        with open(member.path, "rb") as f:
+            # the size decides the length of the header, written before the data
+            member.file_size = member.compress_size = os.fstat(f.fileno()).st_size
+            self.write(member.local_header())
+            data_offset = self.size
+            for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+                crc = zlib.crc32(block, crc)
+                hash_object.update(block)
+                self.write(block)
+        if self.size - data_offset != member.file_size:
+            raise RuntimeError(f"{member.path!r} changed while packaging")
+        member.crc = crc
+        member.checksum = hash_object.hexdigest()
+        self.fp.seek(member.header_offset)
+        self.fp.write(member.local_header())
+        self.fp.seek(self.size)
+        self.add_member(member)
+
+    def close(self):
+        start_dir = self.size
+        for member in self.members:
+            self.write(member.central_header())
+        end_dir = self.size
+        size_dir = end_dir - start_dir
+        count = len(self.members)
+        if (
+            count >= ZIP64_COUNT_LIMIT
+            or start_dir >= ZIP64_LIMIT
+            or size_dir >= ZIP64_LIMIT
+        ):
+            self.write(
+                ZIP64_END_RECORD.pack(
+                    b"PK\x06\x06",
+                    ZIP64_END_RECORD.size - 12,
+                    CREATE_SYSTEM_UNIX << 8 | ZIP64_VERSION,
+                    ZIP64_VERSION,
+                    0,
+                    0,
+                    count,
+                    count,
+                    size_dir,
+                    start_dir,
+                )
+            )
+            self.write(ZIP64_END_LOCATOR.pack(b"PK\x06\x07", 0, end_dir, 1))
+            count, size_dir, start_dir = MAX_UINT16, MAX_UINT32, MAX_UINT32
+        self.write(
+            END_RECORD.pack(b"PK\x05\x06", 0, 0, count, count, size_dir, start_dir, 0)
+        )
+        self.fp.close()
+        self.hasher.update(self.size)
+        self.checksum = self.hasher.hexdigest()
+
+
+def checksum_list(algorithm, value):
+    """Return the checksum in the format of the CSC ``Checksum`` attribute."""
+    return [{"Algorithm": algorithm.upper(), "Value": value}]
+
+
+def build_manifest(writer, checksum_algorithm):
+    """Return the manifest of the archive written by ``writer``: size and checksum of the
+    archive, size, CRC-32 and checksum of each member."""
+    members = []
+    for member in writer.members:
+        entry = {"Name": member.name}
+        if not member.is_dir:
+            entry.update(
+                {
+                    "Size": member.file_size,
+                    "CompressedSize": member.compress_size,
+                    "CRC32": f"{member.crc:08x}",
+                    "Checksum": checksum_list(checksum_algorithm, member.checksum),
+                }
+            )
+        members.append(entry)
+    return {
+        "Reference": os.path.basename(writer.path),
+        "Size": writer.size,
+        "Checksum": checksum_list(checksum_algorithm, writer.checksum),
+        "Members": members,
+    }
+
+
+def manifest_path(zip_path):
+    return zip_path + MANIFEST_SUFFIX
+
+
+def write_manifest(manifest, path):
+    """Write the manifest in ``path``, atomically."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def package_folder(
+    folder,
+    zip_path,
+    compression_level=DEFAULT_COMPRESSION_LEVEL,
+    stored_extensions=DEFAULT_STORED_EXTENSIONS,
+    threads=None,
+    checksum_algorithm=None,
+):
+    """
+    Package ``folder`` in the zip file ``zip_path``. The files with extension in
+    ``stored_extensions`` are stored, the others are deflated with ``compression_level``
+    by ``threads`` threads (default ``PACKAGING_THREADS`` environment variable).
+    The checksums of the members and of the archive are computed while packaging with
+    ``checksum_algorithm`` (default ``OUTPUT_CHECKSUM_ALGORITHM`` environment variable,
+    or sha256).
+
+    :return dict: the manifest of the archive, see ``build_manifest``
+    """
+    if threads is None:
+        threads = int(os.getenv("PACKAGING_THREADS", DEFAULT_PACKAGING_THREADS))
+    if checksum_algorithm is None:
+        checksum_algorithm = os.getenv(
+            "OUTPUT_CHECKSUM_ALGORITHM", DEFAULT_CHECKSUM_ALGORITHM
+        )
+    checksum_algorithm = hashing.normalize_algorithm(checksum_algorithm)
+    if not hashing.is_available(checksum_algorithm):
+        raise ValueError(f"checksum algorithm {checksum_algorithm!r} not available")
+    stored_extensions = tuple(extension.lower() for extension in stored_extensions)
+    members = list_members(folder, stored_extensions)
+    # the compression of the following members is started while the previous ones are
+    # written, limiting the number of compressed members waiting to be written
+    window = 4 * max(threads, 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        futures = collections.deque()
+        pending = iter(members)
+
+        def submit_next():
+            for member in pending:
+                future = None
+                if member.method == ZIP_DEFLATED:
+                    future = pool.submit(
+                        compress_file,
+                        member.path,
+                        compression_level,
+                        checksum_algorithm,
+                    )
+                futures.append((member, future))
+                if len(futures) >= window:
+                    return
+
+        with ZipWriter(zip_path, checksum_algorithm=checksum_algorithm) as writer:
+            submit_next()
+            while futures:
+                member, future = futures.popleft()
+                if member.method == ZIP_DEFLATED:
+                    writer.write_compressed(member, future.result())
+                else:
+                    writer.write_stored(member)
+                submit_next()
+    return build_manifest(writer, checksum_algorithm)
@@ -0,0 +1,21 @@
+"""
+Dask worker preload module building the workflows registry when the worker starts:
+
+    dask-worker --preload esa_tf_platform.preload ...
+"""
+
+import logging
+
+from . import workflows
+
+logger = logging.getLogger(__name__)
+
+
+def dask_setup(worker):
+    version, registry = workflows.get_workflows_registry()
+    logger.info(
+        f"worker {worker.name!r}: {len(registry)} workflows registered, "
+        f"registry version {version}"
+    )
+    # the event is sent to the scheduler as soon as the worker is connected
+    workflows.publish_registry_version(version, worker=worker)
@@ -0,0 +1,310 @@
+import contextlib
+import fcntl
+import functools
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from . import hashing, locality
+
+logger = logging.getLogger(__name__)
+
+B_TO_GB = 9.313225746154785 * 1e-10
+
+
+class ProductCache:
+    """
+    Cache of the input products shared by the workers of a host.
+
+    The products are stored in ``<cache_dir>/products`` as ``<product>.zip`` with a
+    ``<product>.json`` metadata file recording the size and the checksum of the product.
+    The entries are keyed by product name and, if a checksum is given, they are required to
+    match it: a product re-published with a different checksum, or whose cached file has
+    been corrupted, is downloaded again.
+    The fill of an entry is serialized among processes with a lock file, the least recently
+    used entries are evicted when the cache exceeds ``max_size`` bytes. The entries linked
+    by running orders are not evicted: a hardlink raises the link count of the cached file,
+    a symbolic link is registered in a file of ``<cache_dir>/users/<product>``, dropped
+    once the symbolic link is gone.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.products_dir = os.path.join(cache_dir, "products")
+        self.locks_dir = os.path.join(cache_dir, "locks")
+        self.staging_dir = os.path.join(cache_dir, "staging")
+        self.users_dir = os.path.join(cache_dir, "users")
+        for directory in [
+            self.products_dir,
+            self.locks_dir,
+            self.staging_dir,
+            self.users_dir,
+        ]:
+            os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._counters_lock = threading.Lock()
+
+    def product_path(self, product):
+        return os.path.join(self.products_dir, f"{product}.zip")
+
+    def metadata_path(self, product):
+        return os.path.join(self.products_dir, f"{product}.json")
+
+    @contextlib.contextmanager
+    def lock(self, product, blocking=True):
+        """Acquire the exclusive inter-process lock of a cache entry."""
+        flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+        with open(os.path.join(self.locks_dir, f"{product}.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, flags)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, product, checksum=None, algorithm="md5"):
+        """Return the path of the cached product, or None if it is not in the cache
+        or its checksum does not match ``checksum``. If the checksum of the entry is not
+        known, or the file changed since it was verified, it is computed with
+        ``algorithm`` and recorded in the metadata.
+        """
+        product_path = self.product_path(product)
+        try:
+            with open(self.metadata_path(product)) as f:
+                metadata = json.load(f)
+            signature = file_signature(product_path)
+        except (OSError, ValueError):
+            return None
+        if metadata.get("size") not in (None, signature[-1]):
+            logger.info(f"cached product {product!r} size does not match")
+            return None
+        if checksum:
+            checksum = checksum.lower()
+            algorithm = hashing.normalize_algorithm(algorithm)
+            # the checksum is computed again if the file changed since its verification
+            if (
+                not metadata.get("checksum")
+                or metadata.get("checksum_algorithm", "md5") != algorithm
+                or metadata.get("verified") != signature
+            ):
+                metadata["checksum"] = hashing.file_checksum(product_path, algorithm)
+                metadata["checksum_algorithm"] = algorithm
+                metadata["verified"] = signature
+                self._write_metadata(product, metadata)
+            if metadata["checksum"] != checksum:
+                logger.info(
+                    f"cached product {product!r} checksum does not match {checksum}"
+                )
+                return None
+        # the modification time of the metadata file is used for the LRU eviction
+        os.utime(self.metadata_path(product))
+        return product_path
+
+    def recorded_checksum(self, product):
+        """Return ``(algorithm, checksum)`` recorded in the metadata of the cached product,
+        ``(None, None)`` if the product is not cached or its checksum is not known."""
+        try:
+            with open(self.metadata_path(product)) as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if not metadata.get("checksum"):
+            return None, None
+        return metadata.get("checksum_algorithm", "md5"), metadata["checksum"]
+
+    def _write_metadata(self, product, metadata):
+        tmp_path = f"{self.metadata_path(product)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, self.metadata_path(product))
+
+    def fetch(self, product, directory_path, fill, checksum=None, algorithm="md5"):
+        """Return a link in ``directory_path`` to the cached product. In case of cache miss,
+        ``fill(staging_dir)`` is called to download the product in a staging directory and
+        the downloaded file is added to the cache.
+
+        :param str product: product name, without extension
+        :param str directory_path: folder where to create the link to the cached product
+        :param callable fill: function downloading the product, it returns the file path
+        :param str checksum: expected checksum of the product, if known
+        :param str algorithm: algorithm of ``checksum``
+        :return str: path of the link to the cached product
+        """
+        # the lock waits for a concurrent fill of the same product and prevents the
+        # eviction of the entry before the link is created
+        with self.lock(product):
+            cached_path = self.get(product, checksum=checksum, algorithm=algorithm)
+            self._count(hit=cached_path is not None)
+            if cached_path is None:
+                cached_path = self._fill(
+                    product, fill, checksum=checksum, algorithm=algorithm
+                )
+            link_path = link_product(cached_path, directory_path)
+            if os.path.islink(link_path):
+                self._add_user(product, link_path)
+        self.evict()
+        return link_path
+
+    def _add_user(self, product, link_path):
+        """Register the symbolic link ``link_path`` to the cached product, so that the
+        entry is not evicted while the link exists. Called with the entry lock held."""
+        users_dir = os.path.join(self.users_dir, product)
+        os.makedirs(users_dir, exist_ok=True)
+        user = os.path.join(users_dir, hashlib.sha1(link_path.encode()).hexdigest())
+        with open(user, "w") as f:
+            f.write(link_path)
+
+    def _release_users(self, product):
+        """Drop the users of the cached product whose symbolic link no longer points to it
+        and return the number of the remaining ones. Called with the entry lock held."""
+        users_dir = os.path.join(self.users_dir, product)
+        product_path = self.product_path(product)
+        users = 0
+        for user in glob.glob(os.path.join(users_dir, "*")):
+            try:
+                with open(user) as f:
+                    link_path = f.read()
+            except FileNotFoundError:
+                continue
+            if os.path.islink(link_path) and os.readlink(link_path) == product_path:
+                users += 1
+            else:
+                os.remove(user)
+        return users
+
+    def _fill(self, product, fill, checksum=None, algorithm="md5"):
+        # the staging dir is not removed on failure: the partial downloads in it are resumed
+        # by the next fill of the same product
+        staging_dir = os.path.join(self.staging_dir, product)
+        os.makedirs(staging_dir, exist_ok=True)
+        downloaded_path = fill(staging_dir)
+        product_path = self.product_path(product)
+        os.chmod(downloaded_path, 0o444)
+        os.replace(downloaded_path, product_path)
+        metadata = {
+            "product": product,
+            "checksum": checksum.lower() if checksum else None,
+            "checksum_algorithm": hashing.normalize_algorithm(algorithm),
+            "size": os.path.getsize(product_path),
+            # the product downloaded with a checksum has been verified by the download
+            "verified": file_signature(product_path) if checksum else None,
+            "added": time.time(),
+        }
+        self._write_metadata(product, metadata)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        logger.info(f"product {product!r} added to the cache {self.cache_dir!r}")
+        return product_path
+
+    def _count(self, hit):
+        with self._counters_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        logger.info(
+            f"product cache {'hit' if hit else 'miss'}: "
+            f"hits={self.hits}, misses={self.misses}"
+        )
+
+    def entries(self):
+        """Return the list of ``(last_access_time, size, product)`` of the cached products."""
+        entries = []
+        for filename in os.listdir(self.products_dir):
+            product, ext = os.path.splitext(filename)
+            if ext != ".zip":
+                continue
+            try:
+                size = os.path.getsize(self.product_path(product))
+                last_access = os.path.getmtime(self.metadata_path(product))
+            except OSError:
+                continue
+            entries.append((last_access, size, product))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove the least recently used products until the cache size is within
+        ``max_size``. The products that are being filled or that are linked by a running
+        order are not removed. Return the list of the evicted products.
+        """
+        entries = sorted(self.entries())
+        total_size = sum(size for _, size, _ in entries)
+        evicted = []
+        for _, size, product in entries:
+            if total_size <= self.max_size:
+                break
+            product_path = self.product_path(product)
+            try:
+                with self.lock(product, blocking=False):
+                    users = self._release_users(product)
+                    if users or os.stat(product_path).st_nlink > 1:
+                        continue
+                    os.remove(self.metadata_path(product))
+                    os.remove(product_path)
+                    shutil.rmtree(
+                        os.path.join(self.users_dir, product), ignore_errors=True
+                    )
+            except (BlockingIOError, FileNotFoundError):
+                continue
+            total_size -= size
+            evicted.append(product)
+            logger.info(f"product {product!r} evicted from the cache")
+        if evicted:
+            locality.report_products(evicted, held=False)
+        return evicted
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "products": len(entries),
+            "size_gb": sum(size for _, size, _ in entries) * B_TO_GB,
+            "max_size_gb": self.max_size * B_TO_GB,
+        }
+
+
+def file_signature(path):
+    """Return the inode, modification time and size of the file, that change when the
+    file is written or replaced."""
+    stat = os.stat(path)
+    return [stat.st_ino, stat.st_mtime_ns, stat.st_size]
+
+
+def link_product(cached_path, directory_path):
+    """Create in ``directory_path`` a hardlink to the cached product, or a symbolic link
+    if the cache is on a different file system.
+    """
+    link_path = os.path.join(directory_path, os.path.basename(cached_path))
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    try:
+        os.link(cached_path, link_path)
+    except OSError:
+        os.symlink(cached_path, link_path)
+    return link_path
+
+
+@functools.lru_cache()
+def _product_cache(cache_dir, max_size):
+    return ProductCache(cache_dir, max_size)
+
+
+def get_product_cache():
+    """
+    Return the product cache configured with the environment variables ``PRODUCT_CACHE_DIR``
+    and ``PRODUCT_CACHE_SIZE_GB`` (default 50), or None if the cache is not enabled.
+    """
+    cache_dir = os.getenv("PRODUCT_CACHE_DIR")
+    if not cache_dir:
+        return None
+    max_size = int(float(os.getenv("PRODUCT_CACHE_SIZE_GB", 50)) / B_TO_GB)
+    return _product_cache(cache_dir, max_size)
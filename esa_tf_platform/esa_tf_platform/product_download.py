@@ -1,26 +1,63 @@
+import concurrent.futures
+import functools
+import glob
 import hashlib
+import json
 import logging
 import os
 import pathlib
+import threading
 import time
 import urllib
 
 import cachetools
 import requests
+import urllib3
 import sentinelsat
 import yaml
 from urllib.parse import urlunsplit
 
 from authlib.integrations.requests_client import OAuth2Session
 
+from . import catalogue_cache, hashing, hub_health, product_cache
+
 logger = logging.getLogger(__name__)
 
 SESSION_LIST = {}
+# configuration of the hubs in SESSION_LIST
+HUBS_CONFIG = {}
+HUB_SELECTIONS = ("sequential", "race")
+# time waited for the slower catalogues once the first hub has found the product (s)
+RACE_GRACE_PERIOD = 2
 CDSE_REDIRECTION_STATUS_CODES = (301, 302, 303, 307)
 PERMANENT_REDIRECT_STATUS_CODE = 308
+DEFAULT_CHUNK_SIZE = 8192
+# "stream": checksum computed while downloading, "post": computed after the download
+CHECKSUM_MODES = ("stream", "post")
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# the OAuth2 token is refreshed when it expires within this margin (s)
+TOKEN_REFRESH_MARGIN = 60
+# maximum number of products resolved with a single catalogue query
+CATALOGUE_BATCH_SIZE = 20
+# time waited to collect the concurrent lookups resolved with a single query (s)
+DEFAULT_CATALOGUE_BATCH_WINDOW = 0
+MIN_SEGMENT_SIZE = 8 * 1024**2
+CHECKPOINT_SIZE = 64 * 1024**2
+PART_SUFFIX = ".part"
+PART_STATE_SUFFIX = ".part.json"
+# suffix used by sentinelsat for the incomplete downloads, they are resumed by sentinelsat
+DHUS_PART_SUFFIX = ".incomplete"
+# errors counted as hub failures by the hub health, the ValueError raised when a hub
+# does not publish a product is not a failure
+HUB_ERRORS = (OSError, RuntimeError, sentinelsat.SentinelAPIError)
 
 
 class CscApi:
+    health = None
+
     def __init__(self, **hub_config):
         hub_credentials = hub_config["credentials"]
         self.query_api = hub_config.get("query_api", "odata")
@@ -29,6 +66,32 @@ class CscApi:
         self.auth = hub_config["auth"].lower()
         self.query_auth = hub_config["query_auth"]
         self.download_auth = hub_config["download_auth"]
+        self.download_segments = int(hub_config.get("download_segments", 1))
+        self.download_chunk_size = int(
+            hub_config.get("download_chunk_size", DEFAULT_CHUNK_SIZE)
+        )
+        self.resume_download = bool(hub_config.get("resume_download", False))
+        self.checksum_mode = hub_config.get("checksum_mode", "stream")
+        if self.checksum_mode not in CHECKSUM_MODES:
+            raise ValueError(
+                f"checksum_mode {self.checksum_mode!r} not supported, "
+                f"use one of {CHECKSUM_MODES}"
+            )
+        self.pool_size = int(
+            hub_config.get("pool_size", max(DEFAULT_POOL_SIZE, self.download_segments))
+        )
+        self.max_retries = int(hub_config.get("max_retries", DEFAULT_MAX_RETRIES))
+        self.retry_backoff_factor = float(
+            hub_config.get("retry_backoff_factor", DEFAULT_RETRY_BACKOFF_FACTOR)
+        )
+        self.catalogue_batch_window = float(
+            hub_config.get("catalogue_batch_window", DEFAULT_CATALOGUE_BATCH_WINDOW)
+        )
+        self.batch_resolver = catalogue_cache.BatchResolver(
+            self._query_products_info,
+            window=self.catalogue_batch_window,
+            max_batch_size=CATALOGUE_BATCH_SIZE,
+        )
 
         version = hub_credentials.get("version", "v1")
 
@@ -44,143 +107,233 @@ class CscApi:
         self.client_id = hub_credentials.get("client_id", None)
         self.token_endpoint = hub_credentials.get("token_endpoint", None)
 
+        # the sessions are shared by the threads of the worker: they keep alive the
+        # connections to the hub, the OAuth2 token is fetched at the first request
+        # and refreshed ahead of its expiry
+        self.session = self._mount_adapter(requests.Session())
+        self.token = None
+        self._token_lock = threading.Lock()
         if hub_config["query_auth"] or hub_config["download_auth"]:
-            self.auth_session, self.token = self._instantiate_auth_session(
-                hub_credentials
+            self.auth_session = self._mount_adapter(
+                self._instantiate_auth_session(hub_credentials)
             )
         else:
             self.auth_session = None
-            self.token = None
 
-    def _get_product_info(self, *args, **kwargs):
+    def get_product_info(self, product):
+        """
+        Return the download URL, checksum and size of the product. The product info is
+        read from the catalogue cache if available, otherwise the catalogue is queried;
+        the lookups of different products requested concurrently are done in one query.
+        """
+        product = os.path.splitext(product)[0]
+        cache = catalogue_cache.get_catalogue_cache()
+        if cache is not None:
+            product_info = cache.get(self.api_url, product)
+            if product_info is not None:
+                logger.info(f"{product} info found in the catalogue cache")
+                return product_info
+        product_info = self.batch_resolver.resolve(product)
+        if product_info is None:
+            raise ValueError(f"{product} not found in: {self.api_url}")
+        if cache is not None:
+            cache.put(self.api_url, product, product_info)
+        return product_info
+
+    def get_products_info(self, products):
+        """
+        Return a dictionary with the info of the ``products`` published by the hub,
+        querying the catalogue in batches of ``CATALOGUE_BATCH_SIZE`` products.
+        """
+        products = [os.path.splitext(product)[0] for product in products]
+        cache = catalogue_cache.get_catalogue_cache()
+        products_info = {}
+        missing = []
+        for product in products:
+            product_info = cache.get(self.api_url, product) if cache else None
+            if product_info is None:
+                missing.append(product)
+            else:
+                products_info[product] = product_info
+        for start in range(0, len(missing), CATALOGUE_BATCH_SIZE):
+            batch_info = self._query_products_info(
+                missing[start : start + CATALOGUE_BATCH_SIZE]
+            )
+            if cache is not None:
+                for product, product_info in batch_info.items():
+                    cache.put(self.api_url, product, product_info)
+            products_info.update(batch_info)
+        return products_info
+
+    def _query_products_info(self, products):
         if self.query_api == "odata":
             logger.info(f"Using ODATA api: {self.query_api}")
-            out = self._get_product_info = self._get_odata_product_info(*args, **kwargs)
+            out = self._get_odata_products_info(products)
         elif self.query_api == "stac":
-            out = self._get_product_info = self._get_stac_product_info(*args, **kwargs)
-        else:
             logger.info(f"Using STAC api: {self.query_api}")
+            out = self._get_stac_products_info(products)
+        else:
             raise ValueError(f"Query API f{self.query_api=} not supported")
         return out
 
+    def _mount_adapter(self, session):
+        """Mount on ``session`` an adapter with a connection pool of ``pool_size``
+        connections and retries with exponential backoff of the failed requests.
+        """
+        retry = urllib3.util.Retry(
+            total=self.max_retries,
+            backoff_factor=self.retry_backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=["GET", "HEAD"],
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retry,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
     def _instantiate_auth_session(self, hub_credentials):
         if self.auth == "oauth2":
             logger.info(f"using oauth2 authentication for {hub_credentials['api_url']}")
             session = OAuth2Session(
                 client_id=self.client_id, token_endpoint=self.token_endpoint
             )
-            token = session.fetch_token(
-                self.token_endpoint,
-                username=self.user,
-                password=self.password,
-            )
-            logger.debug(f"token updated")
         elif self.auth == "basic":
             logger.info(f"using basic authentication for {hub_credentials['api_url']}")
-            session = requests.session()
+            session = requests.Session()
             session.auth = (self.user, self.password)
-            token = None
         else:
             raise RuntimeError(
                 f"{self.auth} is not a valid authentication. 'auth' shell be basic or oauth2"
             )
-        return session, token
+        return session
 
     def _ensure_token(self):
+        """Fetch the OAuth2 token if it is missing or expires within
+        ``TOKEN_REFRESH_MARGIN`` seconds. The token is shared by the threads of the worker.
+        """
         if self.auth != "oauth2":
             return
-        if (self.token["expires_at"] - time.time() - 60) < 0:
-            self.token = self.auth_session.fetch_token(
-                token_url="https://your-token-endpoint.com/oauth/token",
-                username=self.user,
-                password=self.password,
-            )
+        with self._token_lock:
+            if (
+                self.token is None
+                or self.token["expires_at"] - time.time() < TOKEN_REFRESH_MARGIN
+            ):
+                self.token = self.auth_session.fetch_token(
+                    self.token_endpoint,
+                    username=self.user,
+                    password=self.password,
+                )
+                logger.debug(f"token updated")
 
     @staticmethod
     def find_checksum(product_info):
-        checksum_info_list = product_info.get("Checksum", [{}])
-        algorithms = []
-        target_checksum = None
-        for checksum_info in checksum_info_list:
-            algorithm = checksum_info.get("Algorithm", "")
-            logging.warning(f"algorithm {algorithm}")
-            if algorithm.lower() == "md5":
-                target_checksum = checksum_info.get("Value")
-            algorithms.append(algorithm)
+        """
+        Return ``(algorithm, value)`` of the checksum in the OData product info computed
+        with the fastest available algorithm, ``(None, None)`` if there is none.
+        """
+        checksums = {
+            checksum_info.get("Algorithm", ""): checksum_info.get("Value")
+            for checksum_info in product_info.get("Checksum", [])
+        }
+        algorithm, target_checksum = hashing.select_checksum(checksums)
         if target_checksum is None:
             logging.warning(
-                f"MD5 checksum algorithm not found in available algorithms {algorithms}"
-                "Only MD5 is supported; the checksum will be ignored."
+                f"no supported checksum algorithm found in available algorithms "
+                f"{list(checksums)}, the checksum will be ignored."
             )
-        return target_checksum
+        return algorithm, target_checksum
 
-    def _get_odata_product_info(self, product):
-        logger.info("Using ODATA api for catalogue search")
+    def _query_session(self):
         if self.query_auth:
             self._ensure_token()
-            session = self.auth_session
-        else:
-            session = requests.Session()
+            return self.auth_session
+        return self.session
 
-        product = os.path.splitext(product)[0]
-        query_url = urllib.parse.urljoin(
-            self.api_url, f"Products?$filter=startswith(Name,'{product}')"
+    @staticmethod
+    def match_product(name, products):
+        """Return the product in ``products`` that ``name`` starts with, if any."""
+        for product in products:
+            if name.startswith(product):
+                return product
+        return None
+
+    def _get_odata_products_info(self, products):
+        logger.info("Using ODATA api for catalogue search")
+        session = self._query_session()
+
+        query_filter = " or ".join(
+            f"startswith(Name,'{product}')" for product in products
         )
+        query = f"Products?$filter={query_filter}"
+        if len(products) > 1:
+            query += f"&$top={2 * len(products)}"
+        query_url = urllib.parse.urljoin(self.api_url, query)
         logger.debug(f"QUERY: {query_url}")
         response = session.get(query_url)
         response.raise_for_status()
 
-        product_info_list = response.json()["value"]
-        if len(product_info_list) == 0:
-            raise ValueError(f"{product} not found in: {self.api_url}")
-        product_info = product_info_list[0]
-
-        logger.info(f"{product} found in: {self.api_url}")
-        logger.debug(f"PRODUCT INFO {product_info}")
-        product_id = product_info["Id"]
-        download_url = urllib.parse.urljoin(
-            self.api_url, f"Products({product_id})/$value"
-        )
-        try:
-            target_checksum = self.find_checksum(product_info)
-        except Exception as ex:
-            target_checksum = None
-            logging.warning(
-                f"an error occurred trying to read product checksum: {ex}"
+        products_info = {}
+        for product_info in response.json()["value"]:
+            product = self.match_product(product_info.get("Name", ""), products)
+            if product is None or product in products_info:
+                continue
+            logger.info(f"{product} found in: {self.api_url}")
+            logger.debug(f"PRODUCT INFO {product_info}")
+            product_id = product_info["Id"]
+            download_url = urllib.parse.urljoin(
+                self.api_url, f"Products({product_id})/$value"
             )
+            try:
+                algorithm, target_checksum = self.find_checksum(product_info)
+            except Exception as ex:
+                algorithm, target_checksum = None, None
+                logging.warning(
+                    f"an error occurred trying to read product checksum: {ex}"
+                )
 
-        return {"download_url": download_url, "target_checksum": target_checksum}
+            products_info[product] = {
+                "download_url": download_url,
+                "target_checksum": target_checksum,
+                "checksum_algorithm": algorithm,
+                "size": product_info.get("ContentLength"),
+            }
+        return products_info
 
-    def _get_stac_product_info(self, product):
+    def _get_stac_products_info(self, products):
         logger.info("Using STAC api for catalogue search")
+        session = self._query_session()
 
-        if self.query_auth:
-            self._ensure_token()
-            session = self.auth_session
-        else:
-            session = requests.Session()
-
-        product = os.path.splitext(product)[0]
-        query_url = urllib.parse.urljoin(
-            self.api_url, f"search?ids={product},{product}.zip"
-        )
+        ids = ",".join(f"{product},{product}.zip" for product in products)
+        query_url = urllib.parse.urljoin(self.api_url, f"search?ids={ids}")
 
         logger.info(f"QUERY: {query_url}")
         response = session.get(query_url)
         response.raise_for_status()
 
-        product_info_list = response.json()["features"]
-        if len(product_info_list) == 0:
-            raise ValueError(f"{product} not found in: {self.api_url}")
-
-        product_info = product_info_list[0]
+        products_info = {}
+        for product_info in response.json()["features"]:
+            product = self.match_product(product_info.get("id", ""), products)
+            if product is None or product in products_info:
+                continue
+            products_info[product] = self._stac_product_info(product_info)
+        return products_info
 
+    @staticmethod
+    def _stac_product_info(product_info):
         if "product" in product_info["assets"]:
             product_dict = product_info["assets"]["product"]
         elif "Product" in product_info["assets"]:
             product_dict = product_info["assets"]["Product"]
         else:
-            raise ValueError(f"product / Product path not found in response {product_info=}")
+            raise ValueError(
+                f"product / Product path not found in response {product_info=}"
+            )
 
         download_url = product_dict["href"]
 
@@ -194,33 +347,106 @@ class CscApi:
         except KeyError:
             pass
 
+        algorithm = None
         if target_checksum is None:
             logging.warning(
                 f"an error occurred trying to read product checksum "
                 f"neither in assets/product/file:checksum nor"
                 f"properties/file:checksum"
             )
-        elif target_checksum[:2] != "d5":
-            logging.warning(
-                f"Unsupported checksum algorithm (multihash prefix: {target_checksum[:2]}). "
-                "Only prefix d5 (MD5) is supported; the checksum will be ignored."
-            )
-            target_checksum = None
         else:
-            target_checksum = target_checksum[6:]
+            try:
+                algorithm, target_checksum = hashing.parse_multihash(target_checksum)
+            except ValueError:
+                algorithm = None
+            if algorithm is None or not hashing.is_available(algorithm):
+                logging.warning(
+                    f"Unsupported checksum algorithm (multihash: {target_checksum}), "
+                    "the checksum will be ignored."
+                )
+                algorithm, target_checksum = None, None
 
-        return {"download_url": download_url, "target_checksum": target_checksum}
+        return {
+            "download_url": download_url,
+            "target_checksum": target_checksum,
+            "checksum_algorithm": algorithm,
+            "size": product_dict.get("file:size"),
+        }
 
-    def download(self, product, directory_path, chunk_size=8192, checksum=True):
+    def _open_download(self, session, download_url):
+        """Follow the hub redirections and return the streamed response of the download
+        together with the final URL and the keyword arguments used to reach it.
+        """
+        request_kwargs = {}
+        # the CDSE implemented a redirection to the URL "zipper.dataspace.copernicus.eu" during
+        # the download phase. Each client of the CDSE should support the redirection and the
+        # trusting of the source. This is possible using, as example, the option "--location" and
+        # "--location-trusted" on cURL command. The Python implementation of redirection is shown
+        # at https://documentation.dataspace.copernicus.eu/APIs/OData.html#:~:text=O%20example_odata.zip-,Python,-import%20requests%0Asession
+        start = time.perf_counter()
+        response = session.get(download_url, stream=True, allow_redirects=False)
+        while response.status_code in CDSE_REDIRECTION_STATUS_CODES:
+            download_url = urllib.parse.urljoin(
+                download_url, response.headers["Location"]
+            )
+            response.close()
+            response = session.get(download_url, stream=True, allow_redirects=False)
+        if response.status_code == PERMANENT_REDIRECT_STATUS_CODE:
+            request_kwargs = {"verify": False}
+            response.close()
+            response = session.get(download_url, stream=True, **request_kwargs)
+        response.raise_for_status()
+        if self.health is not None:
+            self.health.record_ttfb(time.perf_counter() - start)
+        return response, download_url, request_kwargs
+
+    def download(
+        self,
+        product,
+        directory_path,
+        chunk_size=None,
+        checksum=True,
+        product_info=None,
+        progress=None,
+    ):
+        try:
+            return self._download(
+                product,
+                directory_path,
+                chunk_size=chunk_size,
+                checksum=checksum,
+                product_info=product_info,
+                progress=progress,
+            )
+        except Exception:
+            # the cached product info may be stale (e.g. an expired download URL)
+            cache = catalogue_cache.get_catalogue_cache()
+            if cache is not None:
+                cache.invalidate(self.api_url, os.path.splitext(product)[0])
+            raise
+
+    def _download(
+        self,
+        product,
+        directory_path,
+        chunk_size=None,
+        checksum=True,
+        product_info=None,
+        progress=None,
+    ):
         if self.download_auth:
             session = self.auth_session
         else:
-            session = requests.Session()
+            session = self.session
+        if chunk_size is None:
+            chunk_size = self.download_chunk_size
 
-        product_info = self._get_product_info(product)
+        if product_info is None:
+            product_info = self.get_product_info(product)
 
         download_url = product_info["download_url"]
         target_checksum = product_info["target_checksum"]
+        algorithm = product_info.get("checksum_algorithm") or "md5"
         product_basename = os.path.splitext(product)[0]
         product_path = os.path.join(directory_path, f"{product_basename}.zip")
         if checksum:
@@ -231,45 +457,441 @@ class CscApi:
                     f"checksum cannot be verified, checksum not available in {self.api_url} product info"
                 )
                 checksum = False
-        logger.info(f"Target cheksum {target_checksum}")
-        if checksum:
-            hash_md5 = hashlib.md5()
+            elif not hashing.is_available(algorithm):
+                logging.warning(
+                    f"checksum cannot be verified, {algorithm} algorithm not available"
+                )
+                checksum = False
+        logger.info(f"Target cheksum {algorithm} {target_checksum}")
         logger.info(f"trying to download product {product}")
         self._ensure_token()
-        # the CDSE implemented a redirection to the URL "zipper.dataspace.copernicus.eu" during
-        # the download phase. Each client of the CDSE should support the redirection and the
-        # trusting of the source. This is possible using, as example, the option "--location" and
-        # "--location-trusted" on cURL command. The Python implementation of redirection is shown
-        # at https://documentation.dataspace.copernicus.eu/APIs/OData.html#:~:text=O%20example_odata.zip-,Python,-import%20requests%0Asession
-        response = session.get(download_url, stream=True, allow_redirects=False)
-        while response.status_code in CDSE_REDIRECTION_STATUS_CODES:
-            download_url = response.headers["Location"]
-            response = session.get(download_url, allow_redirects=False)
-        if response.status_code == PERMANENT_REDIRECT_STATUS_CODE:
-            response = session.get(download_url, stream=True, verify=False)
-        response.raise_for_status()
-        with open(product_path, "wb") as f:
-            k = 1
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if checksum:
-                    hash_md5.update(chunk)
-                f.write(chunk)
-                if k % 10 == 0:
-                    logger.debug(f"downloaded {8192 * k} bytes")
-                k += 1
+        response, download_url, request_kwargs = self._open_download(
+            session, download_url
+        )
+        size = int(response.headers.get("Content-Length", 0))
+        accept_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        resumable = self.resume_download and accept_ranges and size > 0
+
+        partial = PartialDownload(product_path, size, target_checksum)
+        if resumable:
+            partial.load()
+        else:
+            partial.discard()
+        hasher = None
+        try:
+            checkpoint = partial.add_range if resumable else None
+            segments = split_ranges(partial.missing_ranges(), self.download_segments)
+            segmented = accept_ranges and (partial.ranges or len(segments) > 1)
+            if segmented and checksum and self.checksum_mode == "stream":
+                # the segments are hashed in offset order while they are downloaded
+                hasher = hashing.FileHasher(partial.part_path, algorithm)
+            if progress or hasher:
+                progress = DownloadProgress(
+                    partial.part_path,
+                    watermark_callback(progress, hasher),
+                    ranges=[(start, end) for start, end, _ in partial.ranges],
+                ).update
+
+            if segmented:
+                response.close()
+                logger.info(
+                    f"downloading {sum(end - start for start, end in segments)} of {size} "
+                    f"bytes in {len(segments)} segments"
+                )
+                download_segments(
+                    session,
+                    download_url,
+                    partial.part_path,
+                    size,
+                    segments,
+                    chunk_size=chunk_size,
+                    checkpoint=checkpoint,
+                    progress=progress,
+                    **request_kwargs,
+                )
+                product_checksum = None
+                if hasher:
+                    product_checksum = hasher.hexdigest()
+                elif checksum:
+                    product_checksum = hashing.file_checksum(
+                        partial.part_path, algorithm
+                    )
+            else:
+                if self.download_segments > 1 and not accept_ranges:
+                    logger.info(
+                        f"{self.api_url} does not support range requests for {product}, "
+                        f"falling back to a single stream"
+                    )
+                # in post verification mode the checksum is computed after the download
+                stream_checksum = checksum and self.checksum_mode == "stream"
+                product_checksum = download_stream(
+                    response,
+                    partial.part_path,
+                    chunk_size=chunk_size,
+                    checksum=algorithm if stream_checksum else None,
+                    checkpoint=checkpoint,
+                    progress=progress,
+                )
+                if checksum and not stream_checksum:
+                    product_checksum = hashing.file_checksum(
+                        partial.part_path, algorithm
+                    )
+        except BaseException:
+            if hasher:
+                hasher.close()
+            # only the resumable downloads are kept for a retry of the order
+            if not resumable:
+                partial.discard()
+            raise
         if checksum:
-            product_checksum = hash_md5.hexdigest()
-            if not (product_checksum == target_checksum):
+            if not (product_checksum == target_checksum.lower()):
+                partial.discard()
                 raise RuntimeError(
                     f"Checksum does not match: "
                     f"target checksum is {target_checksum}, product checksum is {product_checksum},"
                     f"Failed to download product: {product}"
                 )
+        partial.finalize()
         logger.info(f"product {product} downloaded")
         return product_path
 
 
+class PartialDownload:
+    """
+    On-disk state of a download: the ``.part`` file and, when the download is resumable,
+    a JSON sidecar recording the byte ranges already written and the MD5 checksum of each
+    of them, so that an interrupted download can be resumed with range requests.
+    """
+
+    def __init__(self, product_path, size, target_checksum=None):
+        self.product_path = product_path
+        self.part_path = f"{product_path}{PART_SUFFIX}"
+        self.state_path = f"{product_path}{PART_STATE_SUFFIX}"
+        self.size = size
+        self.target_checksum = target_checksum
+        self.ranges = []
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Load the ranges recorded by a previous attempt, keeping only the ones whose
+        content on disk still matches the recorded checksum.
+        """
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            part_size = os.path.getsize(self.part_path)
+        except (OSError, ValueError):
+            self.discard()
+            return self.ranges
+        if (
+            state.get("size") != self.size
+            or state.get("target_checksum") != self.target_checksum
+            or part_size > self.size
+        ):
+            logger.info(f"discarding partial download {self.part_path!r}: outdated")
+            self.discard()
+            return self.ranges
+
+        with open(self.part_path, "rb") as f:
+            for start, end, md5 in state.get("ranges", []):
+                f.seek(start)
+                if hashlib.md5(f.read(end - start)).hexdigest() == md5:
+                    self.ranges.append((start, end, md5))
+        downloaded = sum(end - start for start, end, _ in self.ranges)
+        logger.info(
+            f"resuming download {self.part_path!r}: {downloaded} of {self.size} bytes "
+            f"already downloaded"
+        )
+        self.save()
+        return self.ranges
+
+    def missing_ranges(self):
+        """Return the ``(start, end)`` byte ranges not downloaded yet."""
+        missing = []
+        position = 0
+        for start, end, _ in sorted(self.ranges):
+            if start > position:
+                missing.append((position, start))
+            position = max(position, end)
+        if position < self.size:
+            missing.append((position, self.size))
+        return missing
+
+    def add_range(self, start, end, md5):
+        """Record that the bytes ``[start, end)`` with checksum ``md5`` are on disk."""
+        with self._lock:
+            self.ranges.append((start, end, md5))
+            self.save()
+
+    def save(self):
+        state = {
+            "size": self.size,
+            "target_checksum": self.target_checksum,
+            "ranges": self.ranges,
+        }
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def finalize(self):
+        os.replace(self.part_path, self.product_path)
+        remove_file(self.state_path)
+
+    def discard(self):
+        self.ranges = []
+        remove_file(self.part_path)
+        remove_file(self.state_path)
+
+
+class DownloadProgress:
+    """
+    Track the bytes written by the concurrent writers of a download and report with
+    ``callback(path, watermark)`` the number of contiguous bytes available from the
+    beginning of the file, each time it increases.
+    """
+
+    def __init__(self, path, callback, ranges=()):
+        self.path = path
+        self.callback = callback
+        self.watermark = 0
+        # start -> end of the written ranges beyond the watermark
+        self.ranges = {}
+        self._lock = threading.Lock()
+        for start, end in ranges:
+            self.update(start, end)
+
+    def update(self, start, end):
+        """Record that the bytes ``[start, end)`` have been written."""
+        with self._lock:
+            self.ranges[start] = max(end, self.ranges.get(start, end))
+            if start > self.watermark:
+                return
+            watermark = self.watermark
+            advanced = True
+            while advanced:
+                advanced = False
+                for range_start, range_end in self.ranges.items():
+                    if range_start <= watermark < range_end:
+                        watermark = range_end
+                        advanced = True
+            self.ranges = {
+                range_start: range_end
+                for range_start, range_end in self.ranges.items()
+                if range_end > watermark
+            }
+            if watermark <= self.watermark:
+                return
+            self.watermark = watermark
+        self.callback(self.path, watermark)
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def watermark_callback(progress=None, hasher=None):
+    """Return the ``DownloadProgress`` callback reporting the contiguous bytes written to
+    the ``progress`` callback and to the ``hashing.FileHasher``."""
+
+    def callback(path, watermark):
+        if hasher:
+            hasher.update(watermark)
+        if progress:
+            progress(path, watermark)
+
+    return callback
+
+
+def split_in_segments(size, n_segments, min_segment_size=None):
+    """Split the byte interval ``[0, size)`` in at most ``n_segments`` contiguous segments
+    of at least ``min_segment_size`` bytes.
+
+    :param int size: total number of bytes
+    :param int n_segments: maximum number of segments
+    :param int min_segment_size: minimum size of each segment, default ``MIN_SEGMENT_SIZE``
+    :return list: list of ``(start, end)`` tuples, ``end`` excluded
+    """
+    if min_segment_size is None:
+        min_segment_size = MIN_SEGMENT_SIZE
+    n_segments = max(1, min(n_segments, size // max(min_segment_size, 1)))
+    bounds = [size * k // n_segments for k in range(n_segments + 1)]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def split_ranges(ranges, n_segments, min_segment_size=None):
+    """Split the ``(start, end)`` byte ranges in about ``n_segments`` segments,
+    distributing the segments proportionally to the size of each range.
+    """
+    total = sum(end - start for start, end in ranges)
+    segments = []
+    for start, end in ranges:
+        range_segments = max(1, round(n_segments * (end - start) / total))
+        segments.extend(
+            (start + segment_start, start + segment_end)
+            for segment_start, segment_end in split_in_segments(
+                end - start, range_segments, min_segment_size=min_segment_size
+            )
+        )
+    return segments
+
+
+def write_chunks(chunks, fd, offset, checkpoint=None, progress=None):
+    """Write the ``chunks`` in the file descriptor ``fd`` starting from ``offset``.
+    If ``checkpoint`` is given, it is called with ``(start, end, md5)`` every
+    ``CHECKPOINT_SIZE`` bytes written and at the end of the chunks.
+    If ``progress`` is given, it is called with ``(start, end)`` after each chunk written,
+    where ``start`` is the initial offset.
+    Return the offset following the last byte written.
+    """
+    start = offset
+    block_start = offset
+    block_md5 = hashlib.md5()
+    for chunk in chunks:
+        os.pwrite(fd, chunk, offset)
+        offset += len(chunk)
+        if progress:
+            progress(start, offset)
+        if checkpoint:
+            block_md5.update(chunk)
+            if offset - block_start >= CHECKPOINT_SIZE:
+                checkpoint(block_start, offset, block_md5.hexdigest())
+                block_start, block_md5 = offset, hashlib.md5()
+    if checkpoint and offset > block_start:
+        checkpoint(block_start, offset, block_md5.hexdigest())
+    return offset
+
+
+def download_stream(
+    response,
+    path,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    checksum="md5",
+    checkpoint=None,
+    progress=None,
+):
+    """Write the content of a streamed response in ``path`` and return its checksum
+    computed with the ``checksum`` algorithm (``None`` if ``checksum`` is None).
+    The checksum is computed in a separate thread while the content is downloaded.
+    """
+    hasher = hashing.BackgroundHasher(checksum) if checksum else None
+
+    def chunks():
+        for k, chunk in enumerate(response.iter_content(chunk_size=chunk_size), 1):
+            if hasher:
+                hasher.update(chunk)
+            if k % 10 == 0:
+                logger.debug(f"downloaded {k} chunks of {chunk_size} bytes")
+            yield chunk
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        write_chunks(chunks(), fd, 0, checkpoint=checkpoint, progress=progress)
+    finally:
+        os.close(fd)
+        if hasher:
+            hasher.close()
+    return hasher.hexdigest() if hasher else None
+
+
+def download_range(
+    session,
+    url,
+    fd,
+    start,
+    end,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    checkpoint=None,
+    progress=None,
+    **kwargs,
+):
+    """Download the bytes ``[start, end)`` of ``url`` and write them at the same offsets
+    of the file descriptor ``fd``.
+    """
+    headers = {"Range": f"bytes={start}-{end - 1}"}
+    with session.get(url, headers=headers, stream=True, **kwargs) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RuntimeError(
+                f"range request bytes={start}-{end - 1} not honoured by {url}: "
+                f"status code {response.status_code}"
+            )
+        offset = write_chunks(
+            response.iter_content(chunk_size=chunk_size),
+            fd,
+            start,
+            checkpoint=checkpoint,
+            progress=progress,
+        )
+    if offset != end:
+        raise RuntimeError(
+            f"incomplete segment bytes={start}-{end - 1}: {offset - start} bytes received"
+        )
+    return offset - start
+
+
+def download_segments(
+    session,
+    url,
+    path,
+    size,
+    segments,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    checkpoint=None,
+    progress=None,
+    **kwargs,
+):
+    """Download ``segments`` of ``url`` in parallel, each one with a separate range request,
+    in the file ``path`` of ``size`` bytes. The file is preallocated if needed, the bytes
+    outside the ``segments`` are left untouched.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size != size:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, size)
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(segments), 1)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    download_range,
+                    session,
+                    url,
+                    fd,
+                    start,
+                    end,
+                    chunk_size=chunk_size,
+                    checkpoint=checkpoint,
+                    progress=progress,
+                    **kwargs,
+                )
+                for start, end in segments
+            ]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+    finally:
+        os.close(fd)
+    return path
+
+
+def partial_download_files(directory_path):
+    """Return the files of interrupted downloads found in ``directory_path``."""
+    partial_files = []
+    for suffix in (PART_SUFFIX, PART_STATE_SUFFIX, DHUS_PART_SUFFIX):
+        partial_files.extend(glob.glob(os.path.join(directory_path, f"*{suffix}")))
+    return partial_files
+
+
 class DhusApi:
+    health = None
+
     def __init__(self, **hub_config):
         hub_credentials = hub_config["credentials"]
         self.password = hub_credentials["password"]
@@ -281,6 +903,7 @@ class DhusApi:
             user=self.user,
             password=self.password,
         )
+        self.resume_download = bool(hub_config.get("resume_download", False))
 
     def _get_product_id(self, product):
         identifier = os.path.splitext(product)[0]
@@ -292,14 +915,32 @@ class DhusApi:
         uuid_product = products[0]["id"]
         return uuid_product
 
-    def download(self, product, directory_path, checksum=True):
-        uuid_product = self._get_product_id(product)
-        product_info = self.api.download(
-            uuid_product,
-            directory_path=directory_path,
-            checksum=checksum,
-            nodefilter=None,
-        )
+    def get_product_info(self, product):
+        return {"uuid": self._get_product_id(product), "size": None}
+
+    def download(
+        self, product, directory_path, checksum=True, product_info=None, progress=None
+    ):
+        # the download progress is not reported: the product is extracted when completed
+        if product_info is None:
+            product_info = self.get_product_info(product)
+        uuid_product = product_info["uuid"]
+        try:
+            product_info = self.api.download(
+                uuid_product,
+                directory_path=directory_path,
+                checksum=checksum,
+                nodefilter=None,
+            )
+        except BaseException:
+            # sentinelsat resumes the incomplete downloads, they are kept only if the
+            # hub is configured to resume them
+            if not self.resume_download:
+                for path in glob.glob(
+                    os.path.join(directory_path, f"*{DHUS_PART_SUFFIX}")
+                ):
+                    remove_file(path)
+            raise
         return product_info["path"]
 
 
@@ -330,10 +971,17 @@ def update_api_list(hubs_config_file):
     global SESSION_LIST
     for hub in SESSION_LIST.keys() - hubs_config.keys():
         SESSION_LIST.pop(hub, None)
+        HUBS_CONFIG.pop(hub, None)
+    hub_health.synchronize_hubs(hubs_config)
 
     apis = {"dhus-api": DhusApi, "csc-api": CscApi}
 
     for hub_name, hub_config in hubs_config.items():
+        # the API objects of the hubs with unchanged configuration are kept, together
+        # with their open connections and OAuth2 token
+        if hub_name in SESSION_LIST and HUBS_CONFIG.get(hub_name) == hub_config:
+            continue
+        SESSION_LIST.pop(hub_name, None)
         api_type = hub_config.get("api_type", None)
         if api_type is None:
             logger.warning(
@@ -351,6 +999,8 @@ def update_api_list(hubs_config_file):
         else:
             try:
                 SESSION_LIST[hub_name] = api(**hub_config)
+                HUBS_CONFIG[hub_name] = hub_config
+                SESSION_LIST[hub_name].health = hub_health.get_hub_health(hub_name)
             except Exception as ex:
                 logger.warning(
                     f"error instantiating {api_type} downloader for {hub_name}: {str(ex)}"
@@ -359,12 +1009,30 @@ def update_api_list(hubs_config_file):
 
 
 def download(
-    product, *, processing_dir, hubs_config_file, hub_name=None, order_id=None, checksum=True,
+    product,
+    *,
+    processing_dir,
+    hubs_config_file,
+    hub_name=None,
+    order_id=None,
+    checksum=True,
+    selection="sequential",
+    progress=None,
 ):
     """
-    Download the product from the first hub in the hubs_credentials_file that publishes the product
+    Download the product from the hubs in the hubs_credentials_file that publish the product.
+    With ``selection="sequential"`` the hubs are tried in the configuration order, with
+    ``selection="race"`` the catalogues of all the hubs are queried concurrently and the
+    hubs are tried from the fastest one.
+    If ``progress`` is given, it is called with ``(path, watermark)`` while the product
+    is downloaded, ``watermark`` being the number of contiguous bytes written from the
+    beginning of the file in ``path``.
     """
 
+    if selection not in HUB_SELECTIONS:
+        raise ValueError(
+            f"hub selection {selection!r} not supported, use one of {HUB_SELECTIONS}"
+        )
     product = pathlib.Path(product).stem
     if int(os.getenv("TF_DEBUG", 0)):
         product_path = f"processing_dir/{product}.zip"
@@ -378,21 +1046,267 @@ def download(
             raise ValueError(f"{hub_name} not found in {session_list}")
         session_list = {hub_name: session_list[hub_name]}
 
-    product_path = None
-    for hub_name, session in session_list.items():
-        logger.info(f"trying to download data from {hub_name}")
+    fill = functools.partial(
+        download_from_hubs,
+        product,
+        session_list,
+        checksum=checksum,
+        order_id=order_id,
+        selection=selection,
+        progress=progress,
+    )
+    cache = product_cache.get_product_cache()
+    if cache is None:
+        return fill(processing_dir)
+    algorithm, target_checksum = "md5", None
+    if checksum:
+        algorithm, target_checksum = resolve_checksum(product, session_list, cache)
+    return cache.fetch(
+        product, processing_dir, fill, checksum=target_checksum, algorithm=algorithm
+    )
+
+
+def resolve_checksum(product, session_list, cache=None):
+    """
+    Return ``(algorithm, checksum)`` of the product from the catalogue of the first hub in
+    ``session_list`` publishing it with a checksum, or ``("md5", None)`` if no checksum is
+    available. The checksum is read from the catalogue cache if it is there, otherwise the
+    catalogues are queried; if none of them answers, the checksum recorded by the product
+    ``cache`` is used, so that a cached product is served while the hubs are unreachable.
+    """
+    hubs = [
+        hub_name
+        for hub_name in hub_health.order_hubs(session_list)
+        # the dhus-api product info has no checksum, sentinelsat verifies it
+        if not isinstance(session_list[hub_name], DhusApi)
+    ]
+    catalogue = catalogue_cache.get_catalogue_cache()
+    if catalogue is not None:
+        for hub_name in hubs:
+            product_info = catalogue.get(session_list[hub_name].api_url, product)
+            published = product_info and published_checksum(product_info)
+            if published:
+                return published
+    answered = False
+    for hub_name in hubs:
+        if not hub_health.get_hub_health(hub_name).available():
+            continue
         try:
-            product_path = session.download(
-                product,
-                directory_path=processing_dir,
-                checksum=checksum,
+            product_info = session_list[hub_name].get_product_info(product)
+        except Exception as ex:
+            logger.info(f"checksum of {product} not available from {hub_name}: {ex}")
+            continue
+        answered = True
+        published = published_checksum(product_info)
+        if published:
+            return published
+    if not answered and cache is not None:
+        algorithm, checksum = cache.recorded_checksum(product)
+        if checksum:
+            logger.info(
+                f"catalogues not available, {product} verified with the checksum "
+                f"recorded by the product cache"
             )
-        except Exception:
-            logger.exception(
-                f"not able to download from {hub_name}, an error occurred:"
+            return algorithm, checksum
+    return "md5", None
+
+
+def published_checksum(product_info):
+    """Return ``(algorithm, checksum)`` of the product info, None if the checksum is not
+    published or its algorithm is not available."""
+    target_checksum = product_info.get("target_checksum")
+    algorithm = product_info.get("checksum_algorithm") or "md5"
+    if isinstance(target_checksum, str) and target_checksum:
+        if hashing.is_available(algorithm):
+            return algorithm, target_checksum
+    return None
+
+
+def rank_hubs(product, session_list, order_id=None, grace_period=None):
+    """
+    Query concurrently the catalogues of the hubs in ``session_list`` and return the list
+    of ``(hub_name, product_info)`` of the hubs publishing the product, sorted by the
+    expected download time: the catalogue latency plus, if the hub download throughput and
+    the product size are known, the transfer time. The hubs whose catalogue does not answer
+    within ``grace_period`` seconds from the first successful answer are discarded.
+    The hubs with open circuit are not queried, they are put at the end of the list
+    with product_info None.
+    """
+    if grace_period is None:
+        grace_period = RACE_GRACE_PERIOD
+
+    def lookup(session):
+        start = time.perf_counter()
+        product_info = session.get_product_info(product)
+        return time.perf_counter() - start, product_info
+
+    unavailable = [
+        hub_name
+        for hub_name in session_list
+        if not hub_health.get_hub_health(hub_name).available()
+    ]
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(session_list) or 1)
+    futures = {
+        pool.submit(lookup, session): hub_name
+        for hub_name, session in session_list.items()
+        if hub_name not in unavailable
+    }
+    ranking = []
+    pending = set(futures)
+    deadline = None
+    while pending:
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        done, pending = concurrent.futures.wait(
+            pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        if not done:
+            break
+        for future in done:
+            hub_name = futures[future]
+            try:
+                latency, product_info = future.result()
+            except Exception as ex:
+                if isinstance(ex, HUB_ERRORS):
+                    hub_health.get_hub_health(hub_name).record_failure()
+                logger.info(
+                    f"product {product} not available from {hub_name}: {ex}",
+                    extra={"order_id": order_id},
+                )
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + grace_period
+            throughput = hub_health.get_hub_health(hub_name).throughput
+            size = product_info.get("size")
+            expected_time = latency
+            if throughput and size:
+                expected_time += size / throughput
+            logger.info(
+                f"{hub_name} catalogue lookup: {latency:.2f} s, "
+                f"expected download time: {expected_time:.2f} s",
+                extra={"order_id": order_id},
             )
+            ranking.append((expected_time, hub_name, product_info))
+    pool.shutdown(wait=False, cancel_futures=True)
+    for future in pending:
+        logger.info(
+            f"{futures[future]} catalogue lookup slower than the other hubs, skipped",
+            extra={"order_id": order_id},
+        )
+    ranking.sort(key=lambda item: item[0])
+    return [(hub_name, product_info) for _, hub_name, product_info in ranking] + [
+        (hub_name, None) for hub_name in unavailable
+    ]
+
+
+def download_from_hub(
+    hub_name,
+    session,
+    product,
+    directory_path,
+    checksum=True,
+    product_info=None,
+    order_id=None,
+    progress=None,
+):
+    """
+    Download the product from a single hub updating its health. Return the product path,
+    or None if the download failed.
+    """
+    health = hub_health.get_hub_health(hub_name)
+    # the product info is passed only if already retrieved by the hubs ranking
+    kwargs = {} if product_info is None else {"product_info": product_info}
+    if progress is not None:
+        kwargs["progress"] = progress
+    start = time.perf_counter()
+    try:
+        product_path = session.download(
+            product, directory_path=directory_path, checksum=checksum, **kwargs
+        )
+    except Exception as ex:
+        logger.exception(f"not able to download from {hub_name}, an error occurred:")
+        if isinstance(ex, HUB_ERRORS):
+            health.record_failure()
+        else:
+            health.release()
+        return None
+    elapsed = time.perf_counter() - start
+    if product_path and os.path.isfile(product_path):
+        size = os.path.getsize(product_path)
+        health.record_success(throughput=size / max(elapsed, 1e-6))
+        logger.info(
+            f"{hub_name} download: {size} bytes in {elapsed:.2f} s",
+            extra={"order_id": order_id},
+        )
+    else:
+        health.record_success()
+    return product_path
+
+
+def download_from_hubs(
+    product,
+    session_list,
+    directory_path,
+    checksum=True,
+    order_id=None,
+    selection="sequential",
+    progress=None,
+):
+    """
+    Download the product in ``directory_path`` from the first hub in ``session_list``
+    that publishes the product. If ``selection`` is ``"race"`` the hubs are ranked with
+    ``rank_hubs``, otherwise they are sorted by health with ``hub_health.order_hubs``.
+    The hubs with open circuit are tried only if the download from all the others fails.
+    """
+    if selection == "race":
+        candidates = rank_hubs(product, session_list, order_id=order_id)
+    else:
+        candidates = [
+            (hub_name, None) for hub_name in hub_health.order_hubs(session_list)
+        ]
+
+    product_path = None
+    skipped = []
+    for hub_name, product_info in candidates:
+        if not hub_health.get_hub_health(hub_name).allow_request():
+            logger.info(
+                f"{hub_name} circuit is open, hub skipped", extra={"order_id": order_id}
+            )
+            skipped.append((hub_name, product_info))
+            continue
+        logger.info(f"trying to download data from {hub_name}")
+        start = time.perf_counter()
+        product_path = download_from_hub(
+            hub_name,
+            session_list[hub_name],
+            product,
+            directory_path,
+            checksum=checksum,
+            product_info=product_info,
+            order_id=order_id,
+            progress=progress,
+        )
         if product_path:
             break
+        logger.info(
+            f"{hub_name} download failed after {time.perf_counter() - start:.2f} s",
+            extra={"order_id": order_id},
+        )
+    else:
+        # last resort: the hubs with open circuit
+        for hub_name, product_info in skipped:
+            logger.info(f"trying to download data from {hub_name} with open circuit")
+            product_path = download_from_hub(
+                hub_name,
+                session_list[hub_name],
+                product,
+                directory_path,
+                checksum=checksum,
+                product_info=product_info,
+                order_id=order_id,
+                progress=progress,
+            )
+            if product_path:
+                break
     if product_path is None:
         raise ValueError(
             f"order_id {order_id}: could not download product from {list(session_list)}"
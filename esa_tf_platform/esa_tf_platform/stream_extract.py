@@ -0,0 +1,221 @@
+import logging
+import os
+import struct
+import threading
+import zipfile
+import zlib
+
+from . import extraction
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+ENCRYPTED_FLAG = 0x01
+DATA_DESCRIPTOR_FLAG = 0x08
+UTF8_FLAG = 0x800
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+BLOCK_SIZE = 1024**2
+
+
+class StreamExtractor:
+    """
+    Extract the members of a zip file while it is being downloaded.
+
+    The download reports with ``update(path, watermark)`` that the first ``watermark``
+    bytes of the file in ``path`` are on disk. A background thread parses the local
+    headers of the members and extracts them in ``processing_dir`` as soon as their data
+    has arrived. The streaming extraction stops, falling back to the extraction from the
+    complete file, if the members cannot be extracted before the central directory is
+    available: sizes in data descriptors, encryption or unsupported compression methods.
+    """
+
+    def __init__(self, processing_dir, block_size=BLOCK_SIZE):
+        self.processing_dir = processing_dir
+        self.block_size = block_size
+        self.path = None
+        self.watermark = 0
+        self.done = False
+        self.fallback_reason = None
+        # names and CRC-32 of the members extracted during the download
+        self.extracted = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def update(self, path, watermark):
+        """Report that the first ``watermark`` bytes of ``path`` have been written."""
+        with self._condition:
+            if self.path is None:
+                self.path = path
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            elif path != self.path or watermark < self.watermark:
+                self._stop("the download has been restarted")
+            self.watermark = max(watermark, self.watermark)
+            self._condition.notify_all()
+
+    def close(self):
+        """Stop waiting for the download and wait for the extraction thread."""
+        with self._condition:
+            self.done = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def finish(self, product_zip_file, patterns=None):
+        """
+        Complete the extraction of the downloaded ``product_zip_file``: the members not
+        extracted during the download, or not matching the central directory, are extracted
+        from the complete file. If ``patterns`` is given, only the missing members matching
+        them are extracted. Return the path of the extracted product folder.
+        """
+        self.close()
+        if self.fallback_reason:
+            logger.info(f"streaming extraction stopped: {self.fallback_reason}")
+        with zipfile.ZipFile(product_zip_file, "r") as product_zip:
+            infolist = product_zip.infolist()
+        missing = [
+            info
+            for info in infolist
+            if self.extracted.get(info.filename) != (0 if info.is_dir() else info.CRC)
+        ]
+        if patterns is not None:
+            missing = extraction.select_members(missing, patterns)
+        logger.info(
+            f"{len(infolist) - len(missing)} members extracted during the download, "
+            f"{len(missing)} members extracted after the download"
+        )
+        return extraction.extract_members(
+            product_zip_file, self.processing_dir, members=missing
+        )
+
+    def _stop(self, reason):
+        if self.fallback_reason is None:
+            self.fallback_reason = reason
+
+    def _wait_for(self, end):
+        """Wait until the first ``end`` bytes are available, return False if the streaming
+        extraction has to be stopped."""
+        with self._condition:
+            while (
+                self.watermark < end and not self.done and self.fallback_reason is None
+            ):
+                self._condition.wait()
+            return self.watermark >= end and self.fallback_reason is None
+
+    def _run(self):
+        try:
+            with open(self.path, "rb") as f:
+                offset = 0
+                while offset is not None:
+                    offset = self._extract_member(f.fileno(), offset)
+        except Exception as ex:
+            logger.exception("streaming extraction failed")
+            with self._condition:
+                self._stop(f"error: {ex}")
+
+    def _read(self, fd, offset, size):
+        if not self._wait_for(offset + size):
+            return None
+        data = os.pread(fd, size, offset)
+        if len(data) != size:
+            raise RuntimeError(f"short read at offset {offset}")
+        return data
+
+    def _extract_member(self, fd, offset):
+        """Extract the member whose local header starts at ``offset`` and return the
+        offset of the next header, or None when the extraction is completed or stopped.
+        """
+        header = self._read(fd, offset, LOCAL_HEADER.size)
+        if header is None:
+            return None
+        (
+            signature,
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            compressed_size,
+            file_size,
+            name_length,
+            extra_length,
+        ) = LOCAL_HEADER.unpack(header)
+        if signature != LOCAL_HEADER_SIGNATURE:
+            # end of the members, the central directory follows
+            return None
+        if flags & DATA_DESCRIPTOR_FLAG:
+            self._stop("the member sizes are stored in data descriptors")
+            return None
+        if flags & ENCRYPTED_FLAG:
+            self._stop("encrypted members")
+            return None
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            self._stop(f"unsupported compression method {method}")
+            return None
+
+        offset += LOCAL_HEADER.size
+        fields = self._read(fd, offset, name_length + extra_length)
+        if fields is None:
+            return None
+        encoding = "utf-8" if flags & UTF8_FLAG else "cp437"
+        name = fields[:name_length].decode(encoding)
+        if ZIP64_LIMIT in (compressed_size, file_size):
+            file_size, compressed_size = parse_zip64_extra(
+                fields[name_length:], file_size, compressed_size
+            )
+        offset += name_length + extra_length
+
+        target = extraction.member_path(self.processing_dir, name)
+        if name.endswith("/"):
+            os.makedirs(target, exist_ok=True)
+            self.extracted[name] = 0
+            return offset + compressed_size
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        decompressor = (
+            zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+        )
+        member_crc = 0
+        written = 0
+        end = offset + compressed_size
+        with open(target, "wb") as out:
+            while offset < end:
+                block = self._read(fd, offset, min(self.block_size, end - offset))
+                if block is None:
+                    return None
+                offset += len(block)
+                if decompressor is not None:
+                    block = decompressor.decompress(block)
+                member_crc = zlib.crc32(block, member_crc)
+                written += len(block)
+                out.write(block)
+            if decompressor is not None:
+                block = decompressor.flush()
+                member_crc = zlib.crc32(block, member_crc)
+                written += len(block)
+                out.write(block)
+        if member_crc != crc or written != file_size:
+            self._stop(f"CRC or size mismatch extracting {name!r}")
+            return None
+        self.extracted[name] = crc
+        return offset
+
+
+def parse_zip64_extra(extra, file_size, compressed_size):
+    """Read from the zip64 extra field of a local header the sizes stored as 0xFFFFFFFF."""
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, field_size = struct.unpack_from("<2H", extra, position)
+        position += 4
+        if field_id == ZIP64_EXTRA_ID:
+            values = iter(struct.unpack_from(f"<{field_size // 8}Q", extra, position))
+            if file_size == ZIP64_LIMIT:
+                file_size = next(values)
+            if compressed_size == ZIP64_LIMIT:
+                compressed_size = next(values)
+            break
+        position += field_size
+    return file_size, compressed_size
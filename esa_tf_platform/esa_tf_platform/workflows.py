@@ -1,22 +1,35 @@
 import datetime as dt
+import hashlib
 import importlib
+import importlib.metadata
 import itertools
+import json
 import logging
 import os
-import pathlib
 import re
 import shutil
-import subprocess
 import threading
+import time
 import zipfile
 
 import dask.distributed
-import pkg_resources
 
-from . import product_download, resources_monitor
+from . import (
+    extraction,
+    locality,
+    packaging,
+    product_cache,
+    product_download,
+    resources_monitor,
+    stream_extract,
+)
 
 logger = logging.getLogger(__name__)
 
+ENTRY_POINTS_GROUP = "esa_tf.plugin"
+# topic on which the workers publish the version of their workflows registry
+WORKFLOWS_REGISTRY_TOPIC = "esa_tf-workflows-registry"
+
 TYPES = {
     "boolean": bool,
     "number": float,
@@ -39,6 +52,17 @@ MANDATORY_OPTIONS_KEYS = [
     "Type",
 ]
 
+# the partial downloads of the failed orders not resumed within this time are deleted
+DEFAULT_PARTIAL_DOWNLOADS_RETENTION = 24 * 3600  # sec
+
+# how the workflows access the input product: extracted folder or zip file
+INPUT_PRODUCT_ACCESS = ["folder", "zip"]
+
+PACKAGING_OPTIONS_KEYS = [
+    "CompressionLevel",
+    "StoredExtensions",
+]
+
 
 SENTINEL1 = [
     "S1_RAW__0S",
@@ -238,6 +262,79 @@ def check_enum_type(worflow_options, workflow_id=None):
                 )
 
 
+def check_packaging_options(workflow, workflow_id=None):
+    """
+    Check the optional "PackagingOptions" of the workflow: "CompressionLevel" shall be
+    an integer between 0 and 9, "StoredExtensions" a list of file extensions.
+    :param dict workflow: workflow configuration dictionary
+    :param str workflow_id: workflow is needed for the error message
+    """
+    packaging_options = workflow.get("PackagingOptions", {})
+    if not isinstance(packaging_options, dict):
+        raise ValueError(
+            f"workflow_id {workflow_id}: PackagingOptions shall be a dictionary"
+        )
+    unknown_keys = set(packaging_options) - set(PACKAGING_OPTIONS_KEYS)
+    if unknown_keys:
+        raise ValueError(
+            f"workflow_id {workflow_id}: PackagingOptions keys {sorted(unknown_keys)} "
+            f"not recognized. The keys shall be in {PACKAGING_OPTIONS_KEYS}"
+        )
+    level = packaging_options.get("CompressionLevel", 0)
+    if not isinstance(level, int) or isinstance(level, bool) or not 0 <= level <= 9:
+        raise ValueError(
+            f"workflow_id {workflow_id}: PackagingOptions CompressionLevel {level} "
+            f"shall be an integer between 0 and 9"
+        )
+    extensions = packaging_options.get("StoredExtensions", [])
+    if not isinstance(extensions, (list, tuple)) or not all(
+        isinstance(extension, str) and extension.startswith(".")
+        for extension in extensions
+    ):
+        raise ValueError(
+            f"workflow_id {workflow_id}: PackagingOptions StoredExtensions {extensions} "
+            f"shall be a list of file extensions, e.g. ['.jp2']"
+        )
+
+
+def check_input_product_members(workflow, workflow_id=None):
+    """
+    Check the optional "InputProductMembers" of the workflow: a list of glob patterns of
+    the input product members needed by the workflow.
+    :param dict workflow: workflow configuration dictionary
+    :param str workflow_id: workflow is needed for the error message
+    """
+    patterns = workflow.get("InputProductMembers", [])
+    if not isinstance(patterns, list) or not all(
+        isinstance(pattern, str) for pattern in patterns
+    ):
+        raise ValueError(
+            f"workflow_id {workflow_id}: InputProductMembers {patterns} "
+            f"shall be a list of glob patterns, e.g. ['GRANULE/*/IMG_DATA/*.jp2']"
+        )
+
+
+def check_input_product_access(workflow, workflow_id=None):
+    """
+    Check the optional "InputProductAccess" of the workflow: "folder" (default) if the
+    workflow runner receives the extracted product folder, "zip" if it receives the path
+    of the product zip file.
+    :param dict workflow: workflow configuration dictionary
+    :param str workflow_id: workflow is needed for the error message
+    """
+    access = workflow.get("InputProductAccess", "folder")
+    if access not in INPUT_PRODUCT_ACCESS:
+        raise ValueError(
+            f"workflow_id {workflow_id}: InputProductAccess {access!r} not recognized. "
+            f"It shall be in {INPUT_PRODUCT_ACCESS}"
+        )
+    if access == "zip" and "InputProductMembers" in workflow:
+        raise ValueError(
+            f"workflow_id {workflow_id}: InputProductMembers can't be used with "
+            f"InputProductAccess 'zip'"
+        )
+
+
 def check_workflow(workflow, workflow_id=None):
     """
     Check if workflow keys, options keys and types.
@@ -251,6 +348,9 @@ def check_workflow(workflow, workflow_id=None):
     check_valid_declared_type(workflow["WorkflowOptions"], workflow_id=workflow_id)
     check_default_type(workflow["WorkflowOptions"], workflow_id=workflow_id)
     check_enum_type(workflow["WorkflowOptions"], workflow_id=workflow_id)
+    check_packaging_options(workflow, workflow_id=workflow_id)
+    check_input_product_members(workflow, workflow_id=workflow_id)
+    check_input_product_access(workflow, workflow_id=workflow_id)
 
 
 def remove_duplicates(pkg_entrypoints):
@@ -267,8 +367,8 @@ def remove_duplicates(pkg_entrypoints):
         unique_pkg_entrypoints.append(matches[0])
         matches_len = len(matches)
         if matches_len > 1:
-            selected_module_name = matches[0].module_name
-            all_module_names = [e.module_name for e in matches]
+            selected_module_name = matches[0].module
+            all_module_names = [e.module for e in matches]
             logging.warning(
                 f"found {matches_len} entrypoints for the workflow name {name}:"
                 f"\n {all_module_names}.\n It will be used: {selected_module_name}."
@@ -303,11 +403,11 @@ def load_workflows_configurations(pkg_entrypoints):
     }
 
 
-def get_all_workflows():
+def build_workflows_registry():
     """
-    Return the list of all available workflows.
+    Load and check the workflows configurations of the installed plugins.
     """
-    pkg_entrypoints = pkg_resources.iter_entry_points("esa_tf.plugin")
+    pkg_entrypoints = importlib.metadata.entry_points(group=ENTRY_POINTS_GROUP)
     workflows = load_workflows_configurations(pkg_entrypoints)
     valid_workflows = {}
     for workflow_id, workflow in workflows.items():
@@ -321,36 +421,128 @@ def get_all_workflows():
     return valid_workflows
 
 
-def unzip_product(product_zip_file, processing_dir):
+def registry_version(registry):
+    """Return the content hash of the workflows registry."""
+    content = json.dumps(registry, sort_keys=True, default=repr)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+# workflows registry of the current process and its version, built at the first use
+_workflows_registry = None
+_workflows_registry_version = None
+_workflows_registry_lock = threading.Lock()
+
+
+def _ensure_workflows_registry():
+    global _workflows_registry, _workflows_registry_version
+    with _workflows_registry_lock:
+        if _workflows_registry is not None:
+            return _workflows_registry, _workflows_registry_version, False
+        _workflows_registry = build_workflows_registry()
+        _workflows_registry_version = registry_version(_workflows_registry)
+        logger.info(
+            f"workflows registry {_workflows_registry_version} built: "
+            f"{sorted(_workflows_registry)}"
+        )
+        return _workflows_registry, _workflows_registry_version, True
+
+
+def get_all_workflows():
+    """
+    Return the list of all available workflows. The plugins are loaded only the first
+    time, see ``invalidate_workflows_registry``.
+    """
+    registry, version, built = _ensure_workflows_registry()
+    if built:
+        publish_registry_version(version)
+    return dict(registry)
+
+
+def get_workflows_registry():
+    """Return the version of the workflows registry and the workflows."""
+    registry, version, built = _ensure_workflows_registry()
+    if built:
+        publish_registry_version(version)
+    return version, dict(registry)
+
+
+def publish_registry_version(version, worker=None):
+    """
+    Publish on the ``WORKFLOWS_REGISTRY_TOPIC`` Dask topic the version of the workflows
+    registry of ``worker`` (default the current worker). It does nothing outside a Dask
+    worker.
+    """
+    if worker is None:
+        try:
+            worker = dask.distributed.get_worker()
+        except ValueError:
+            return
+    logger.debug(f"publishing workflows registry version {version} of {worker.address}")
+    worker.log_event(
+        WORKFLOWS_REGISTRY_TOPIC, {"worker": worker.address, "version": version}
+    )
+
+
+def invalidate_workflows_registry():
+    """
+    Forget the workflows registry, so that it is built again at the next use: to be
+    called when plugins are installed or removed while the process is running.
+    """
+    global _workflows_registry, _workflows_registry_version
+    with _workflows_registry_lock:
+        _workflows_registry = None
+        _workflows_registry_version = None
+    importlib.invalidate_caches()
+
+
+def unzip_product(product_zip_file, processing_dir, patterns=None):
     """
     Unzip the product in the processing dir
 
     :param str product_zip_file: path to product zip file
     :param str processing_dir: directory where to unzip the product zip
+    :param list patterns: if given, only the members matching these glob patterns are
+    extracted, see the "InputProductMembers" workflow key
     """
-    with zipfile.ZipFile(product_zip_file, "r") as product_zip:
-        path = pathlib.Path(product_zip.infolist()[0].filename)
-        product_folder = path.parts[0]
-        product_zip.extractall(processing_dir)
-    return os.path.join(processing_dir, product_folder)
+    members = None
+    if patterns is not None:
+        with zipfile.ZipFile(product_zip_file, "r") as product_zip:
+            members = extraction.select_members(product_zip.infolist(), patterns)
+    return extraction.extract_members(product_zip_file, processing_dir, members=members)
 
 
-def zip_product(output, output_dir):
-    """Zip the workflow output folder and return the zip file path.
+def zip_product(output, output_dir, packaging_options=None):
+    """Zip the workflow output folder and return the zip file path. The manifest of the
+    zip file, with its size and checksums, is written next to it.
 
     :param str output: full path of the workflow output folder
     :param str output_dir: path of the folder in which the zip file will be created
+    :param dict packaging_options: "PackagingOptions" of the workflow description
     :return str:
     """
+    if packaging_options is None:
+        packaging_options = {}
     basename = os.path.basename(output.rstrip("/"))
-    dirname = os.path.dirname(output.rstrip("/"))
     # remove the ".SAFE" string (if present) from the workflow output folder
     zip_basename = basename.rsplit(".SAFE")[0] + ".zip"
     output_zip_path = os.path.join(output_dir, zip_basename)
 
-    zip_code = f"cd {dirname} && zip -r {output_zip_path} {basename}"
-    logger.info(f"creating output product: {zip_code}")
-    f = subprocess.run(zip_code, shell=True, check=True)
+    logger.info(f"creating output product: {output_zip_path}")
+    manifest = packaging.package_folder(
+        output,
+        output_zip_path,
+        compression_level=packaging_options.get(
+            "CompressionLevel", packaging.DEFAULT_COMPRESSION_LEVEL
+        ),
+        stored_extensions=packaging_options.get(
+            "StoredExtensions", packaging.DEFAULT_STORED_EXTENSIONS
+        ),
+    )
+    packaging.write_manifest(manifest, packaging.manifest_path(output_zip_path))
+    logger.info(
+        f"output product created: {len(manifest['Members'])} members, "
+        f"{manifest['Size']} bytes, checksum {manifest['Checksum'][0]['Value']}"
+    )
     return output_zip_path
 
 
@@ -391,7 +583,13 @@ def chown(path, user, group):
 
 
 def move_in_output_folder(
-    output, order_id, output_dir, workflow_id, output_owner, output_group_owner
+    output,
+    order_id,
+    output_dir,
+    workflow_id,
+    output_owner,
+    output_group_owner,
+    packaging_options=None,
 ):
     if not os.path.exists(output):
         raise ValueError(f"{workflow_id!r} output file {output!r} not found.")
@@ -399,14 +597,113 @@ def move_in_output_folder(
     output_order_dir = os.path.join(output_dir, order_id)
     os.makedirs(output_order_dir, exist_ok=True)
 
-    output_product_path = zip_product(output, output_order_dir)
+    output_product_path = zip_product(
+        output, output_order_dir, packaging_options=packaging_options
+    )
 
     chown(output_product_path, user=output_owner, group=output_group_owner)
+    chown(
+        packaging.manifest_path(output_product_path),
+        user=output_owner,
+        group=output_group_owner,
+    )
     chown(output_order_dir, user=output_owner, group=output_group_owner)
 
     return output_product_path
 
 
+def clean_processing_dir(processing_dir, keep_partial_downloads=False):
+    """Delete the processing dir. If ``keep_partial_downloads`` is True, the files of
+    interrupted downloads are kept, so that a retry of the same order can resume them.
+
+    :param str processing_dir: path of the order processing dir
+    :param bool keep_partial_downloads: if True keep the partial downloads
+    """
+    partial_files = []
+    if keep_partial_downloads:
+        partial_files = product_download.partial_download_files(processing_dir)
+    if not partial_files:
+        logger.info(f"deleting {processing_dir!r}")
+        shutil.rmtree(processing_dir, ignore_errors=True)
+        return
+    logger.info(
+        f"deleting {processing_dir!r} keeping partial downloads {partial_files!r}"
+    )
+    for entry in os.scandir(processing_dir):
+        if entry.path in partial_files:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            os.remove(entry.path)
+
+
+_abandoned_downloads_sweep = None
+_abandoned_downloads_lock = threading.Lock()
+
+
+def partial_downloads_retention():
+    return float(
+        os.getenv("PARTIAL_DOWNLOADS_RETENTION", DEFAULT_PARTIAL_DOWNLOADS_RETENTION)
+    )
+
+
+def maybe_remove_abandoned_downloads(working_dir):
+    """Run ``remove_abandoned_downloads`` at most once every ``PARTIAL_DOWNLOADS_RETENTION``
+    seconds in the worker, the orders started in the meantime do not scan ``working_dir``.
+
+    :return: list of the deleted processing dirs, None if the sweep has not run
+    """
+    global _abandoned_downloads_sweep
+    retention = partial_downloads_retention()
+    if not _abandoned_downloads_lock.acquire(blocking=False):
+        # already running in another thread of the worker
+        return None
+    try:
+        now = time.monotonic()
+        if (
+            _abandoned_downloads_sweep is not None
+            and now - _abandoned_downloads_sweep < retention
+        ):
+            return None
+        _abandoned_downloads_sweep = now
+        return remove_abandoned_downloads(working_dir, retention=retention)
+    finally:
+        _abandoned_downloads_lock.release()
+
+
+def remove_abandoned_downloads(working_dir, retention=None):
+    """Delete the processing dirs of the failed orders holding only partial downloads
+    that have not been resumed for ``retention`` seconds (default
+    ``PARTIAL_DOWNLOADS_RETENTION`` environment variable, 24 hours).
+
+    :param str working_dir: path of the folder of the processing dirs
+    :param float retention: time in seconds after which the partial downloads are deleted
+    :return: list of the deleted processing dirs
+    """
+    if retention is None:
+        retention = partial_downloads_retention()
+    now = time.time()
+    removed = []
+    for entry in os.scandir(working_dir):
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        # the processing dirs of the running orders contain the output_binder_dir
+        try:
+            partial_files = set(product_download.partial_download_files(entry.path))
+            files = list(os.scandir(entry.path))
+            if not files or any(f.path not in partial_files for f in files):
+                continue
+            if any(now - f.stat().st_mtime < retention for f in files):
+                continue
+        except FileNotFoundError:
+            continue
+        logger.info(f"deleting abandoned partial downloads in {entry.path!r}")
+        shutil.rmtree(entry.path, ignore_errors=True)
+        removed.append(entry.path)
+    return removed
+
+
 def run_workflow(
     workflow_id,
     *,
@@ -438,6 +735,10 @@ def run_workflow(
     output_owner = int(os.getenv("OUTPUT_OWNER_ID", "-1"))
     output_group_owner = int(os.getenv("OUTPUT_GROUP_OWNER_ID", "-1"))
     hubs_config_file = os.getenv("HUBS_CREDENTIALS_FILE", "./hubs_credentials.yaml")
+    hubs_selection = os.getenv("HUBS_SELECTION", "sequential")
+    stream_extract_enabled = bool(int(os.getenv("STREAM_EXTRACT", 0)))
+    workflow = get_all_workflows()[workflow_id]
+    zip_access = workflow.get("InputProductAccess", "folder") == "zip"
 
     if not os.path.isfile(hubs_config_file):
         raise ValueError(
@@ -453,7 +754,9 @@ def run_workflow(
     )
     for directory in [working_dir, processing_dir, output_binder_dir]:
         os.makedirs(directory, exist_ok=True)
+    maybe_remove_abandoned_downloads(working_dir)
 
+    succeeded = False
     try:
         if enable_monitoring:
             stop_event = threading.Event()
@@ -472,17 +775,44 @@ def run_workflow(
         # download
         product = product_reference["Reference"]
         hub_name = product_reference.get("DataSourceName")
+        partial_files = product_download.partial_download_files(processing_dir)
+        if partial_files:
+            logger.info(
+                f"found partial downloads from a previous run: {partial_files!r}"
+            )
         logger.info(f"downloading input product {product!r}")
-        product_zip_file = product_download.download(
-            product=product,
-            hubs_config_file=hubs_config_file,
-            processing_dir=processing_dir,
-            hub_name=hub_name,
-            order_id=order_id,
-            checksum=checksum,
-        )
-        logger.info(f"unpack input product: {product_zip_file!r}")
-        product_path = unzip_product(product_zip_file, processing_dir)
+        # with the streaming extraction the members of the product are extracted
+        # while the product is downloaded
+        extractor = None
+        if stream_extract_enabled and not zip_access:
+            extractor = stream_extract.StreamExtractor(processing_dir)
+        try:
+            product_zip_file = product_download.download(
+                product=product,
+                hubs_config_file=hubs_config_file,
+                processing_dir=processing_dir,
+                hub_name=hub_name,
+                order_id=order_id,
+                checksum=checksum,
+                selection=hubs_selection,
+                progress=extractor.update if extractor else None,
+            )
+        finally:
+            if extractor:
+                extractor.close()
+        locality.report_products([product])
+        patterns = workflow.get("InputProductMembers")
+        if zip_access:
+            # the workflow reads the product directly from the zip file
+            product_path = product_zip_file
+        else:
+            logger.info(f"unpack input product: {product_zip_file!r}")
+            if extractor:
+                product_path = extractor.finish(product_zip_file, patterns=patterns)
+            else:
+                product_path = unzip_product(
+                    product_zip_file, processing_dir, patterns=patterns
+                )
 
         # run workflow
         logger.info(f"run workflow: {workflow_id!r}, {workflow_options!r}")
@@ -503,19 +833,29 @@ def run_workflow(
             workflow_options=workflow_options,
         )
         logger.info(f"package output product: {output!r}")
+        packaging_options = workflow.get("PackagingOptions")
         output_product_path = move_in_output_folder(
-            output, order_id, output_dir, workflow_id, output_owner, output_group_owner
+            output,
+            order_id,
+            output_dir,
+            workflow_id,
+            output_owner,
+            output_group_owner,
+            packaging_options=packaging_options,
         )
 
         if enable_monitoring:
             stop_event.set()
+        succeeded = True
 
     finally:
         if enable_monitoring:
             stop_event.set()
-        # delete workflow processing dir
+        # delete workflow processing dir, the partial downloads of a failed order left
+        # by a hub resuming the downloads are kept to be resumed when the order is retried
         if not int(os.getenv("TF_DEBUG", 0)):
-            logger.info(f"deleting {processing_dir!r}")
-            shutil.rmtree(processing_dir, ignore_errors=True)
+            clean_processing_dir(processing_dir, keep_partial_downloads=not succeeded)
+            if product_cache.get_product_cache() is None:
+                locality.report_products([product_reference["Reference"]], held=False)
 
     return os.path.join(order_id, os.path.basename(output_product_path))
@@ -0,0 +1,70 @@
+"""
+Checksum benchmarks against a local HTTP stand-in of a hub.
+They are not collected by default, run them with:
+
+    python -m pytest -s tests/benchmark_50_checksum.py
+"""
+
+import hashlib
+import os
+import time
+
+import pytest
+import requests
+
+from esa_tf_platform import hashing, product_download
+
+PAYLOAD_SIZE = 256 * 1024**2
+CHUNK_SIZE = 1024**2
+
+
+@pytest.fixture(scope="module")
+def payload():
+    return os.urandom(PAYLOAD_SIZE)
+
+
+def report(label, elapsed):
+    print(f"\n{label}: {elapsed:.2f} s, {PAYLOAD_SIZE / elapsed / 1024**2:.1f} MiB/s")
+
+
+@pytest.mark.parametrize("mode", ["inline", "background"])
+def test_benchmark_stream_checksum(tmpdir, range_http_server, payload, mode):
+    url, _ = range_http_server(payload)
+    path = str(tmpdir.join("product.zip"))
+
+    start = time.perf_counter()
+    with requests.get(f"{url}/product", stream=True) as response:
+        if mode == "inline":
+            # the checksum computed in the thread reading from the socket
+            hash_md5 = hashlib.md5()
+            with open(path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    hash_md5.update(chunk)
+                    f.write(chunk)
+            checksum = hash_md5.hexdigest()
+        else:
+            checksum = product_download.download_stream(
+                response, path, chunk_size=CHUNK_SIZE, checksum="md5"
+            )
+    report(f"{mode} md5", time.perf_counter() - start)
+    assert checksum == hashlib.md5(payload).hexdigest()
+
+
+@pytest.mark.parametrize(
+    "algorithm",
+    [a for a in hashing.ALGORITHMS_PREFERENCE if hashing.is_available(a)],
+)
+def test_benchmark_file_checksum(tmpdir, payload, algorithm):
+    path = tmpdir.join("product.zip")
+    path.write_binary(payload)
+
+    start = time.perf_counter()
+    hashing.file_checksum(str(path), algorithm)
+    report(f"{algorithm} mmap", time.perf_counter() - start)
+
+    start = time.perf_counter()
+    hash_object = hashing.new_hash(algorithm)
+    with open(str(path), "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hash_object.update(block)
+    report(f"{algorithm} read", time.perf_counter() - start)
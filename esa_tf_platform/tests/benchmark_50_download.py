@@ -0,0 +1,55 @@
+"""
+Download benchmarks against a local range-capable HTTP stand-in of a hub.
+They are not collected by default, run them with:
+
+    python -m pytest -s tests/benchmark_50_download.py
+"""
+
+import hashlib
+import os
+import time
+from unittest import mock
+
+import pytest
+
+from esa_tf_platform import product_download
+
+PAYLOAD_SIZE = 64 * 1024**2
+BANDWIDTH = 16 * 1024**2  # bytes per second per connection
+
+CSC_HUB_CONFIG = {
+    "api_type": "csc-api",
+    "auth": "basic",
+    "query_auth": False,
+    "download_auth": False,
+    "credentials": {
+        "api_url": "http://127.0.0.1",
+        "user": "user",
+        "password": "password",
+    },
+}
+
+
+@pytest.mark.parametrize("download_segments", [1, 2, 4, 8])
+def test_benchmark_csc_download(tmpdir, range_http_server, download_segments):
+    payload = os.urandom(PAYLOAD_SIZE)
+    url, _ = range_http_server(payload, bandwidth=BANDWIDTH)
+    session = product_download.CscApi(
+        **CSC_HUB_CONFIG,
+        download_segments=download_segments,
+        download_chunk_size=1024**2,
+    )
+    product_info = {
+        "download_url": f"{url}/product",
+        "target_checksum": hashlib.md5(payload).hexdigest(),
+    }
+
+    with mock.patch.object(session, "get_product_info", return_value=product_info):
+        start = time.perf_counter()
+        session.download("product", directory_path=str(tmpdir))
+        elapsed = time.perf_counter() - start
+
+    print(
+        f"\n{download_segments} segment(s): {elapsed:.2f} s, "
+        f"{PAYLOAD_SIZE / elapsed / 1024**2:.1f} MiB/s"
+    )
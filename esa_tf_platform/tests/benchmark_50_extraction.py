@@ -0,0 +1,56 @@
+"""
+Extraction benchmarks of a synthetic Sentinel-2 L1C product, comparing
+``ZipFile.extractall`` with the parallel extraction. They are not collected by default,
+run them with:
+
+    python -m pytest -s tests/benchmark_50_extraction.py
+"""
+
+import os
+import time
+import zipfile
+
+import pytest
+
+from esa_tf_platform import extraction
+
+PRODUCT = "S2A_MSIL1C_20211022T062221_N0301_R048_T39GWH_20211022T064132.SAFE"
+BANDS = ["B01", "B02", "B03", "B04", "B05", "B06", "B07", "B08", "B8A", "B09", "B10"]
+BAND_SIZE = 16 * 1024**2
+
+
+@pytest.fixture(scope="module")
+def product_zip(tmpdir_factory):
+    zip_path = tmpdir_factory.mktemp("product").join("product.zip").strpath
+    with zipfile.ZipFile(zip_path, "w") as product_zip:
+        for band in BANDS:
+            product_zip.writestr(
+                f"{PRODUCT}/GRANULE/L1C_T39GWH/IMG_DATA/T39GWH_{band}.jp2",
+                os.urandom(BAND_SIZE),
+            )
+        for index in range(200):
+            product_zip.writestr(
+                f"{PRODUCT}/GRANULE/L1C_T39GWH/QI_DATA/MSK_{index:03d}.gml",
+                b"<gml/>" * 10_000,
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+    return zip_path
+
+
+def report(label, elapsed):
+    size = len(BANDS) * BAND_SIZE
+    print(f"\n{label}: {elapsed:.2f} s, {size / elapsed / 1024**2:.1f} MiB/s")
+
+
+def test_benchmark_extractall(tmpdir, product_zip):
+    start = time.perf_counter()
+    with zipfile.ZipFile(product_zip) as f:
+        f.extractall(tmpdir.strpath)
+    report("extractall", time.perf_counter() - start)
+
+
+@pytest.mark.parametrize("threads", [1, 2, 4])
+def test_benchmark_extract_members(tmpdir, product_zip, threads):
+    start = time.perf_counter()
+    extraction.extract_members(product_zip, tmpdir.strpath, threads=threads)
+    report(f"extract_members, {threads} thread(s)", time.perf_counter() - start)
@@ -0,0 +1,64 @@
+"""
+Packaging benchmarks of a synthetic Sentinel-2 SAFE product, comparing ``zip -r`` with
+the in-process packager. They are not collected by default, run them with:
+
+    python -m pytest -s tests/benchmark_50_packaging.py
+"""
+
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+
+from esa_tf_platform import packaging
+
+PRODUCT = "S2A_MSIL2A_20211117T093251_N9999_R136_T33NTF_20211124T093440.SAFE"
+BANDS = ["B02", "B03", "B04", "B08", "TCI"]
+BAND_SIZE = 32 * 1024**2
+XML_SIZE = 4 * 1024**2
+
+
+@pytest.fixture(scope="module")
+def safe_product(tmpdir_factory):
+    product = tmpdir_factory.mktemp("product").mkdir(PRODUCT)
+    img_data = product.mkdir("GRANULE").mkdir("L2A_T33NTF").mkdir("IMG_DATA")
+    for band in BANDS:
+        img_data.join(f"T33NTF_{band}_10m.jp2").write_binary(os.urandom(BAND_SIZE))
+    qi_data = product.join("GRANULE", "L2A_T33NTF").mkdir("QI_DATA")
+    for index in range(20):
+        text = "".join(f"<value index='{i}'>{i * index}</value>\n" for i in range(1000))
+        qi_data.join(f"MSK_{index:02d}.gml").write(text * (XML_SIZE // 20 // len(text)))
+    product.join("MTD_MSIL2A.xml").write("<metadata/>\n" * (XML_SIZE // 12))
+    return product.strpath
+
+
+def report(label, zip_path, elapsed):
+    size = os.path.getsize(zip_path)
+    print(
+        f"\n{label}: {elapsed:.2f} s, {size / elapsed / 1024**2:.1f} MiB/s, "
+        f"{size / 1024**2:.1f} MiB"
+    )
+
+
+@pytest.mark.skipif(shutil.which("zip") is None, reason="zip not available")
+def test_benchmark_zip_r(tmpdir, safe_product):
+    zip_path = tmpdir.join("product.zip").strpath
+    start = time.perf_counter()
+    subprocess.run(
+        ["zip", "-qr", zip_path, PRODUCT],
+        cwd=os.path.dirname(safe_product),
+        check=True,
+    )
+    report("zip -r", zip_path, time.perf_counter() - start)
+
+
+@pytest.mark.parametrize("threads", [1, 2, 4])
+def test_benchmark_package_folder(tmpdir, safe_product, threads):
+    zip_path = tmpdir.join("product.zip").strpath
+    start = time.perf_counter()
+    packaging.package_folder(safe_product, zip_path, threads=threads)
+    report(
+        f"package_folder, {threads} thread(s)", zip_path, time.perf_counter() - start
+    )
@@ -0,0 +1,44 @@
+"""
+Timing of ``get_all_workflows`` with cold and warm workflows registry. They are not
+collected by default, run them with:
+
+    python -m pytest -s tests/benchmark_50_workflows.py
+"""
+
+import time
+
+import pytest
+
+from esa_tf_platform import workflows
+
+REPEAT = 20
+
+
+def report(label, elapsed):
+    print(f"\n{label}: {elapsed / REPEAT * 1000:.3f} ms per call")
+
+
+def test_benchmark_get_all_workflows_cold():
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        workflows.invalidate_workflows_registry()
+        workflows.get_all_workflows()
+    report("cold registry", time.perf_counter() - start)
+
+
+def test_benchmark_get_all_workflows_warm():
+    workflows.get_all_workflows()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        workflows.get_all_workflows()
+    report("warm registry", time.perf_counter() - start)
+
+
+def test_benchmark_pkg_resources_scan():
+    pkg_resources = pytest.importorskip("pkg_resources")
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        pkg_resources.working_set.__init__()
+        entrypoints = pkg_resources.iter_entry_points(workflows.ENTRY_POINTS_GROUP)
+        workflows.load_workflows_configurations(entrypoints)
+    report("pkg_resources scan", time.perf_counter() - start)
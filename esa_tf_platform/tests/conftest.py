@@ -0,0 +1,119 @@
+import http.server
+import re
+import threading
+import time
+
+import pytest
+
+from esa_tf_platform import catalogue_cache, hub_health, workflows
+
+
+class RangeRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Minimal stand-in of a hub download endpoint: ``/product`` returns the payload
+    (honouring ``Range`` requests if ``accept_ranges`` is True) and ``/redirect``
+    redirects to ``/product`` as the CDSE does.
+    """
+
+    payload = b""
+    accept_ranges = True
+    bandwidth = None  # bytes per second per connection, None means unlimited
+    fail_after = None  # close the connection after sending these many bytes
+    block_size = 64 * 1024
+    requested_ranges = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/redirect":
+            self.send_response(302)
+            self.send_header("Location", "/product")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.requested_ranges.append(self.headers.get("Range"))
+        start, end = 0, len(self.payload)
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if self.accept_ranges and match:
+            start = int(match.group(1))
+            if match.group(2):
+                end = int(match.group(2)) + 1
+            self.send_response(206)
+            self.send_header(
+                "Content-Range", f"bytes {start}-{end - 1}/{len(self.payload)}"
+            )
+        else:
+            self.send_response(200)
+        if self.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+
+        for offset in range(start, end, self.block_size):
+            if self.fail_after is not None and offset - start >= self.fail_after:
+                self.close_connection = True
+                return
+            block = self.payload[offset : min(offset + self.block_size, end)]
+            try:
+                self.wfile.write(block)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            if self.bandwidth:
+                time.sleep(len(block) / self.bandwidth)
+
+
+@pytest.fixture
+def range_http_server():
+    """
+    Return a function that starts a local HTTP server serving ``payload`` and
+    returns its base URL and the list of the ``Range`` headers it received.
+    The servers are shut down at the end of the test.
+    """
+    servers = []
+
+    def serve(payload, accept_ranges=True, bandwidth=None, fail_after=None):
+        requested_ranges = []
+        handler = type(
+            "Handler",
+            (RangeRequestHandler,),
+            {
+                "payload": payload,
+                "accept_ranges": accept_ranges,
+                "bandwidth": bandwidth,
+                "fail_after": fail_after,
+                "requested_ranges": requested_ranges,
+            },
+        )
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_port}", requested_ranges
+
+    yield serve
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def reset_hubs_health():
+    hub_health.HUBS_HEALTH.clear()
+    yield
+    hub_health.HUBS_HEALTH.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_catalogue_cache():
+    catalogue_cache._catalogue_cache.cache_clear()
+    yield
+    catalogue_cache._catalogue_cache.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_workflows_registry():
+    workflows.invalidate_workflows_registry()
+    yield
+    workflows.invalidate_workflows_registry()
@@ -0,0 +1,34 @@
+import zipfile
+
+import pytest
+
+from esa_tf_platform import esa_tf_plugin_eopf
+
+
+def test_input_product_url(tmpdir):
+    fsspec = pytest.importorskip("fsspec")
+    product_zip = tmpdir.join("S2A_MSIL1C_20170205T105221.zip").strpath
+    with zipfile.ZipFile(product_zip, "w") as zf:
+        zf.writestr("S2A_MSIL1C_20170205T105221.SAFE/", "")
+        zf.writestr("S2A_MSIL1C_20170205T105221.SAFE/manifest.safe", "<manifest/>")
+        zf.writestr(
+            "S2A_MSIL1C_20170205T105221.SAFE/GRANULE/L1C_T31TCF/IMG_DATA/B04.jp2",
+            "B04",
+        )
+
+    url = esa_tf_plugin_eopf.input_product_url(product_zip)
+    assert url == f"zip://S2A_MSIL1C_20170205T105221.SAFE::file://{product_zip}"
+
+    # the URL points at the SAFE folder inside the zip file
+    fs, path = fsspec.core.url_to_fs(url)
+    with fs.open(f"{path}/manifest.safe") as f:
+        assert f.read() == b"<manifest/>"
+    assert sorted(fs.ls(path, detail=False)) == [
+        f"{path}/GRANULE",
+        f"{path}/manifest.safe",
+    ]
+
+
+def test_input_product_url_folder(tmpdir):
+    product_dir = tmpdir.mkdir("S2A_MSIL1C_20170205T105221.SAFE").strpath
+    assert esa_tf_plugin_eopf.input_product_url(product_dir) == product_dir
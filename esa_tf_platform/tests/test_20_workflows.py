@@ -1,9 +1,10 @@
+import importlib.metadata
 import logging
 import os
+import time
 import zipfile
 from unittest import mock
 
-import pkg_resources
 import pytest
 
 from esa_tf_platform import workflows
@@ -65,6 +66,13 @@ WORKFLOWS3 = {
 }
 
 
+def parse_entry_point(spec):
+    name, value = (part.strip() for part in spec.split("="))
+    return importlib.metadata.EntryPoint(
+        name=name, value=value, group=workflows.ENTRY_POINTS_GROUP
+    )
+
+
 @pytest.fixture
 def dummy_duplicated_entrypoints():
     specs = [
@@ -74,7 +82,7 @@ def dummy_duplicated_entrypoints():
         "workflow3 = esa_tf_platform.tests.test_workflows:dummy_workflow_config3a",
         "workflow3 = esa_tf_platform.tests.test_workflows:dummy_workflow_config3b",
     ]
-    eps = [pkg_resources.EntryPoint.parse(spec) for spec in specs]
+    eps = [parse_entry_point(spec) for spec in specs]
     return eps
 
 
@@ -97,19 +105,19 @@ def test_remove_duplicates_warnings(dummy_duplicated_entrypoints, caplog):
     assert "found 2 entrypoints" in warnings[1]
 
 
-@mock.patch("pkg_resources.EntryPoint.load", mock.MagicMock(return_value=None))
+@mock.patch("importlib.metadata.EntryPoint.load", mock.MagicMock(return_value=None))
 def test_workflows_dict_from_pkg():
     specs = [
         "workflow1 = esa_tf_platform.tests.test_workflows:dummy_workflow_config1",
         "workflow2 = esa_tf_platform.tests.test_workflows:dummy_workflow_config2a",
     ]
-    entrypoints = [pkg_resources.EntryPoint.parse(spec) for spec in specs]
+    entrypoints = [parse_entry_point(spec) for spec in specs]
     wk = workflows.workflow_dict_from_pkg(entrypoints)
     assert len(wk) == 2
     assert wk.keys() == set(("workflow1", "workflow2"))
 
 
-@mock.patch("pkg_resources.EntryPoint.load", mock.MagicMock(return_value={}))
+@mock.patch("importlib.metadata.EntryPoint.load", mock.MagicMock(return_value={}))
 def test_load_workflows_configurations(caplog):
     specs = [
         "workflow1 = esa_tf_platform.tests.test_workflows:dummy_workflow_config1",
@@ -117,7 +125,7 @@ def test_load_workflows_configurations(caplog):
         "workflow2 = esa_tf_platform.tests.test_workflows:dummy_workflow_config2b",
     ]
     with caplog.at_level(logging.INFO):
-        entrypoints = [pkg_resources.EntryPoint.parse(spec) for spec in specs]
+        entrypoints = [parse_entry_point(spec) for spec in specs]
         wk = workflows.load_workflows_configurations(entrypoints)
     assert len(wk) == 2
 
@@ -136,6 +144,7 @@ def test_zip_product(tmpdir):
         product_folder = product_zip.infolist()[0].filename
 
     assert product_folder.rstrip("/") == output_folder_name
+    assert os.path.isfile(zip_path + ".manifest.json") is True
 
 
 def test_check_workflow():
@@ -228,6 +237,47 @@ def test_error_check_enum_type():
         workflows.check_enum_type(option)
 
 
+def test_check_packaging_options():
+    workflow = {
+        "PackagingOptions": {"CompressionLevel": 1, "StoredExtensions": [".jp2"]}
+    }
+    workflows.check_packaging_options(workflow)
+    workflows.check_packaging_options({})
+
+
+@pytest.mark.parametrize(
+    "packaging_options",
+    [
+        {"Level": 1},
+        {"CompressionLevel": 10},
+        {"CompressionLevel": "1"},
+        {"StoredExtensions": ".jp2"},
+        {"StoredExtensions": ["jp2"]},
+    ],
+)
+def test_error_check_packaging_options(packaging_options):
+    with pytest.raises(ValueError, match=f"PackagingOptions"):
+        workflows.check_packaging_options({"PackagingOptions": packaging_options})
+
+
+def test_check_input_product_access():
+    workflows.check_input_product_access({"InputProductAccess": "zip"})
+    workflows.check_input_product_access({})
+    with pytest.raises(ValueError, match=f"not recognized"):
+        workflows.check_input_product_access({"InputProductAccess": "mapper"})
+    with pytest.raises(ValueError, match=f"InputProductMembers"):
+        workflows.check_input_product_access(
+            {"InputProductAccess": "zip", "InputProductMembers": ["*.jp2"]}
+        )
+
+
+def test_check_input_product_members():
+    workflows.check_input_product_members({"InputProductMembers": ["*.jp2"]})
+    workflows.check_input_product_members({})
+    with pytest.raises(ValueError, match=f"InputProductMembers"):
+        workflows.check_input_product_members({"InputProductMembers": "*.jp2"})
+
+
 @mock.patch(
     "esa_tf_platform.workflows.load_workflows_configurations",
     mock.MagicMock(side_effect=[WORKFLOWS1, WORKFLOWS2]),
@@ -245,10 +295,117 @@ def test_get_all_workflows():
 def test_get_all_workflows(caplog):
     workflows.get_all_workflows()
 
+    workflows.invalidate_workflows_registry()
     with caplog.at_level(logging.INFO):
         workflows.get_all_workflows()
     assert "missing key" in caplog.text
 
+    workflows.invalidate_workflows_registry()
     with caplog.at_level(logging.INFO):
         workflows.get_all_workflows()
     assert "product type" in caplog.text
+
+
+@mock.patch("esa_tf_platform.workflows.build_workflows_registry")
+def test_get_all_workflows_registry(build_workflows_registry):
+    build_workflows_registry.return_value = WORKFLOWS3
+
+    assert workflows.get_all_workflows() == WORKFLOWS3
+    assert workflows.get_all_workflows() == WORKFLOWS3
+    assert build_workflows_registry.call_count == 1
+
+    workflows.invalidate_workflows_registry()
+    assert workflows.get_all_workflows() == WORKFLOWS3
+    assert build_workflows_registry.call_count == 2
+
+
+def test_build_workflows_registry():
+    spec = (
+        "sen2cor_l1c_l2a = "
+        "esa_tf_platform.esa_tf_plugin_sen2cor:sen2cor_l1c_l2a_workflow_api"
+    )
+    with mock.patch(
+        "importlib.metadata.entry_points", return_value=[parse_entry_point(spec)]
+    ) as entry_points:
+        registry = workflows.build_workflows_registry()
+    entry_points.assert_called_once_with(group="esa_tf.plugin")
+    assert "sen2cor_l1c_l2a" in registry
+    assert registry["sen2cor_l1c_l2a"]["Id"] == "sen2cor_l1c_l2a"
+
+
+def test_clean_processing_dir(tmpdir):
+    processing_dir = tmpdir.mkdir("order_id")
+    processing_dir.mkdir("product.SAFE").join("file").write("content")
+    for filename in ["product.zip.part", "product.zip.part.json", "product.zip"]:
+        processing_dir.join(filename).write("content")
+
+    workflows.clean_processing_dir(processing_dir.strpath, keep_partial_downloads=True)
+    assert sorted(os.listdir(processing_dir.strpath)) == [
+        "product.zip.part",
+        "product.zip.part.json",
+    ]
+
+    workflows.clean_processing_dir(processing_dir.strpath)
+    assert not os.path.exists(processing_dir.strpath)
+
+
+def test_remove_abandoned_downloads(tmpdir):
+    abandoned = tmpdir.mkdir("order_1")
+    resumed = tmpdir.mkdir("order_2")
+    running = tmpdir.mkdir("order_3")
+    running.mkdir("output_binder_dir")
+    for processing_dir in (abandoned, resumed, running):
+        for filename in ["product.zip.part", "product.zip.part.json"]:
+            processing_dir.join(filename).write("content")
+    old = time.time() - 3600
+    for path in abandoned.listdir() + running.listdir():
+        os.utime(path.strpath, (old, old))
+
+    removed = workflows.remove_abandoned_downloads(tmpdir.strpath, retention=600)
+    assert removed == [abandoned.strpath]
+    assert sorted(os.listdir(tmpdir.strpath)) == ["order_2", "order_3"]
+
+
+def test_maybe_remove_abandoned_downloads(tmpdir, monkeypatch):
+    monkeypatch.setenv("PARTIAL_DOWNLOADS_RETENTION", "600")
+    monkeypatch.setattr(workflows, "_abandoned_downloads_sweep", None)
+    old = time.time() - 3600
+
+    def abandon(name):
+        processing_dir = tmpdir.mkdir(name)
+        processing_dir.join("product.zip.part").write("content")
+        os.utime(processing_dir.join("product.zip.part").strpath, (old, old))
+        return processing_dir.strpath
+
+    first = abandon("order_1")
+    assert workflows.maybe_remove_abandoned_downloads(tmpdir.strpath) == [first]
+
+    # the following orders do not scan the working dir until the retention has elapsed
+    abandon("order_2")
+    with mock.patch.object(workflows, "remove_abandoned_downloads") as remove:
+        assert workflows.maybe_remove_abandoned_downloads(tmpdir.strpath) is None
+    remove.assert_not_called()
+
+    monkeypatch.setattr(workflows, "_abandoned_downloads_sweep", time.monotonic() - 601)
+    assert workflows.maybe_remove_abandoned_downloads(tmpdir.strpath) == [
+        tmpdir.join("order_2").strpath
+    ]
+
+
+@mock.patch("esa_tf_platform.workflows.build_workflows_registry")
+def test_get_workflows_registry(build_workflows_registry):
+    build_workflows_registry.return_value = WORKFLOWS3
+    worker = mock.MagicMock(address="tcp://10.0.0.1:4000")
+
+    with mock.patch("dask.distributed.get_worker", return_value=worker):
+        version, registry = workflows.get_workflows_registry()
+        assert workflows.get_workflows_registry() == (version, registry)
+
+    assert registry == WORKFLOWS3
+    assert version == workflows.registry_version(dict(WORKFLOWS3))
+    assert version != workflows.registry_version(WORKFLOWS1)
+    # the version is published only when the registry is built
+    worker.log_event.assert_called_once_with(
+        workflows.WORKFLOWS_REGISTRY_TOPIC,
+        {"worker": "tcp://10.0.0.1:4000", "version": version},
+    )
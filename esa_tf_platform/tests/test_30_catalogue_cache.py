@@ -0,0 +1,148 @@
+import concurrent.futures
+import hashlib
+import threading
+import time
+from unittest import mock
+
+from esa_tf_platform import catalogue_cache, product_download
+
+CSC_HUB_CONFIG = {
+    "api_type": "csc-api",
+    "auth": "basic",
+    "query_auth": False,
+    "download_auth": False,
+    "credentials": {
+        "api_url": "https://catalogue.dataspace.copernicus.eu",
+        "user": "user",
+        "password": "password",
+    },
+}
+
+
+def md5(name):
+    return hashlib.md5(name.encode()).hexdigest()
+
+
+def odata_response(names):
+    response = mock.MagicMock()
+    response.json.return_value = {
+        "value": [
+            {
+                "Id": f"id-{name}",
+                "Name": name,
+                "ContentLength": 10,
+                "Checksum": [{"Algorithm": "MD5", "Value": md5(name)}],
+            }
+            for name in names
+        ]
+    }
+    return response
+
+
+def test_catalogue_cache_disk_tier(tmpdir):
+    cache_dir = tmpdir.join("catalogue").strpath
+    cache1 = catalogue_cache.CatalogueCache(ttl=10, cache_dir=cache_dir)
+    cache2 = catalogue_cache.CatalogueCache(ttl=10, cache_dir=cache_dir)
+
+    cache1.put("hub", "product", {"download_url": "url"})
+
+    assert cache2.get("hub", "product") == {"download_url": "url"}
+    assert cache2.get("other_hub", "product") is None
+    with mock.patch("time.time", return_value=time.time() + 10):
+        assert (
+            catalogue_cache.CatalogueCache(cache_dir=cache_dir).get("hub", "product")
+            is None
+        )
+
+    cache1.invalidate("hub", "product")
+    assert (
+        catalogue_cache.CatalogueCache(cache_dir=cache_dir).get("hub", "product")
+        is None
+    )
+
+
+def test_batch_resolver():
+    calls = []
+    barrier = threading.Barrier(3)
+
+    def resolve_batch(products):
+        calls.append(sorted(products))
+        return {product: product.upper() for product in products if product != "c"}
+
+    resolver = catalogue_cache.BatchResolver(
+        resolve_batch, window=0.2, max_batch_size=5
+    )
+
+    def resolve(product):
+        barrier.wait()
+        return resolver.resolve(product)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(resolve, ["a", "b", "c"]))
+
+    assert results == ["A", "B", None]
+    assert calls == [["a", "b", "c"]]
+
+
+def test_batch_resolver_without_window():
+    calls = []
+    release = threading.Event()
+
+    def resolve_batch(products):
+        calls.append(sorted(products))
+        release.wait(5)
+        return {product: product.upper() for product in products}
+
+    resolver = catalogue_cache.BatchResolver(resolve_batch, window=0, max_batch_size=5)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
+        # the first lookup is resolved at once
+        first = pool.submit(resolver.resolve, "a")
+        while not calls:
+            time.sleep(0.01)
+        # the lookups arriving during the query are resolved together
+        others = [pool.submit(resolver.resolve, product) for product in "bc"]
+        while len(resolver.pending) < 2:
+            time.sleep(0.01)
+        release.set()
+        results = [first.result()] + [future.result() for future in others]
+
+    assert results == ["A", "B", "C"]
+    assert calls == [["a"], ["b", "c"]]
+
+
+def test_csc_get_product_info_cached():
+    session = product_download.CscApi(**CSC_HUB_CONFIG, catalogue_batch_window=0)
+
+    with mock.patch.object(
+        session.session, "get", return_value=odata_response(["product.SAFE"])
+    ) as get:
+        product_info = session.get_product_info("product.zip")
+        assert session.get_product_info("product") == product_info
+
+    assert get.call_count == 1
+    assert product_info == {
+        "download_url": "https://catalogue.dataspace.copernicus.eu/odata/v1/Products(id-product.SAFE)/$value",
+        "target_checksum": md5("product.SAFE"),
+        "checksum_algorithm": "md5",
+        "size": 10,
+    }
+
+
+def test_csc_get_products_info_batch(monkeypatch):
+    monkeypatch.setattr(product_download, "CATALOGUE_BATCH_SIZE", 2)
+    session = product_download.CscApi(**CSC_HUB_CONFIG)
+
+    with mock.patch.object(
+        session.session,
+        "get",
+        side_effect=[odata_response(["p1.SAFE", "p2.SAFE"]), odata_response([])],
+    ) as get:
+        products_info = session.get_products_info(["p1", "p2", "p3"])
+
+    assert sorted(products_info) == ["p1", "p2"]
+    assert get.call_count == 2
+    query_url = get.call_args_list[0].args[0]
+    assert "startswith(Name,'p1') or startswith(Name,'p2')" in query_url
+    # the resolved products are cached
+    assert session.get_product_info("p2") == products_info["p2"]
@@ -1,8 +1,13 @@
+import hashlib
+import json
+import os
+import time
 from unittest import mock
 
 import pytest
+import requests
 
-from esa_tf_platform import product_download
+from esa_tf_platform import hub_health, product_download
 
 
 @mock.patch(
@@ -97,3 +102,273 @@ def test_error_download_product3(update_api_list):
             processing_dir="processing_dir",
             hubs_config_file="hubs_config_file",
         )
+
+
+def make_hub(product_info=None, latency=0, download=None):
+    api_hub = mock.MagicMock()
+
+    def get_product_info(product):
+        time.sleep(latency)
+        if product_info is None:
+            raise ValueError(f"{product} not found")
+        return product_info
+
+    api_hub.get_product_info.side_effect = get_product_info
+    api_hub.download.side_effect = download
+    return api_hub
+
+
+def test_rank_hubs():
+    session_list = {
+        "slow": make_hub({"size": 1000}, latency=0.2),
+        "missing": make_hub(None),
+        "fast": make_hub({"size": 1000}),
+        "low_throughput": make_hub({"size": 1000}),
+        "timeout": make_hub({"size": 1000}, latency=2),
+    }
+    hub_health.get_hub_health("low_throughput").record_success(throughput=10)
+
+    ranking = product_download.rank_hubs("product", session_list, grace_period=0.5)
+
+    assert [hub_name for hub_name, _ in ranking] == ["fast", "slow", "low_throughput"]
+    assert ranking[0][1] == {"size": 1000}
+
+
+@mock.patch("esa_tf_platform.product_download.update_api_list")
+def test_download_race(update_api_list, tmpdir):
+    def download(product, directory_path, checksum=True, product_info=None):
+        path = os.path.join(directory_path, f"{product}.zip")
+        with open(path, "wb") as f:
+            f.write(bytes(product_info["size"]))
+        return path
+
+    failing_hub = make_hub({"size": 10}, download=requests.ConnectionError())
+    fallback_hub = make_hub({"size": 10}, latency=0.1, download=download)
+    update_api_list.return_value = {"fallback": fallback_hub, "failing": failing_hub}
+
+    product_path = product_download.download(
+        "product",
+        processing_dir=str(tmpdir),
+        hubs_config_file="hubs_config_file",
+        selection="race",
+    )
+
+    assert product_path == os.path.join(str(tmpdir), "product.zip")
+    assert failing_hub.download.call_count == 1
+    assert fallback_hub.download.call_args.kwargs["product_info"] == {"size": 10}
+    assert hub_health.get_hub_health("fallback").throughput is not None
+    assert hub_health.get_hub_health("failing").success_rate == 0.0
+
+
+def test_download_unknown_selection():
+    with pytest.raises(ValueError, match="not supported"):
+        product_download.download(
+            "product",
+            processing_dir="processing_dir",
+            hubs_config_file="hubs_config_file",
+            selection="random",
+        )
+
+
+CSC_HUB_CONFIG = {
+    "api_type": "csc-api",
+    "auth": "basic",
+    "query_auth": False,
+    "download_auth": False,
+    "credentials": {
+        "api_url": "https://catalogue.dataspace.copernicus.eu",
+        "user": "user",
+        "password": "password",
+    },
+}
+
+
+def test_split_in_segments():
+    assert product_download.split_in_segments(10, 3, min_segment_size=1) == [
+        (0, 3),
+        (3, 6),
+        (6, 10),
+    ]
+    assert product_download.split_in_segments(10, 4, min_segment_size=5) == [
+        (0, 5),
+        (5, 10),
+    ]
+    assert product_download.split_in_segments(10, 4, min_segment_size=20) == [(0, 10)]
+    assert product_download.split_in_segments(0, 4, min_segment_size=1) == []
+
+
+@pytest.mark.parametrize("accept_ranges", [True, False])
+@pytest.mark.parametrize("path", ["product", "redirect"])
+@mock.patch("esa_tf_platform.product_download.MIN_SEGMENT_SIZE", 1024)
+def test_csc_download_segments(tmpdir, range_http_server, accept_ranges, path):
+    payload = os.urandom(100_000)
+    url, _ = range_http_server(payload, accept_ranges=accept_ranges)
+
+    session = product_download.CscApi(**CSC_HUB_CONFIG, download_segments=4)
+    product_info = {
+        "download_url": f"{url}/{path}",
+        "target_checksum": hashlib.md5(payload).hexdigest(),
+    }
+    with mock.patch.object(session, "get_product_info", return_value=product_info):
+        product_path = session.download("product.SAFE", directory_path=str(tmpdir))
+
+    assert product_path == tmpdir.join("product.zip").strpath
+    with open(product_path, "rb") as f:
+        assert f.read() == payload
+
+
+def test_csc_download_checksum_error(tmpdir, range_http_server):
+    url, _ = range_http_server(b"product content")
+
+    session = product_download.CscApi(**CSC_HUB_CONFIG)
+    product_info = {"download_url": f"{url}/product", "target_checksum": "wrong"}
+    with mock.patch.object(session, "get_product_info", return_value=product_info):
+        with pytest.raises(RuntimeError, match="Checksum does not match"):
+            session.download("product", directory_path=str(tmpdir))
+
+
+def test_partial_download_missing_ranges(tmpdir):
+    partial = product_download.PartialDownload(tmpdir.join("product.zip").strpath, 100)
+    assert partial.missing_ranges() == [(0, 100)]
+
+    partial.ranges = [(10, 20, "md5"), (0, 5, "md5"), (50, 100, "md5")]
+    assert partial.missing_ranges() == [(5, 10), (20, 50)]
+
+
+@pytest.mark.parametrize("valid_state", [True, False])
+def test_csc_download_resume(tmpdir, range_http_server, valid_state):
+    payload = os.urandom(200_000)
+    url, requested_ranges = range_http_server(payload)
+    target_checksum = hashlib.md5(payload).hexdigest()
+    product_path = tmpdir.join("product.zip").strpath
+
+    downloaded = payload[:120_000]
+    with open(f"{product_path}.part", "wb") as f:
+        f.write(downloaded + bytes(len(payload) - len(downloaded)))
+    range_md5 = hashlib.md5(downloaded if valid_state else b"").hexdigest()
+    with open(f"{product_path}.part.json", "w") as f:
+        json.dump(
+            {
+                "size": len(payload),
+                "target_checksum": target_checksum,
+                "ranges": [[0, len(downloaded), range_md5]],
+            },
+            f,
+        )
+
+    session = product_download.CscApi(**CSC_HUB_CONFIG, resume_download=True)
+    product_info = {
+        "download_url": f"{url}/product",
+        "target_checksum": target_checksum,
+    }
+    with mock.patch.object(session, "get_product_info", return_value=product_info):
+        path = session.download("product", directory_path=str(tmpdir))
+
+    with open(path, "rb") as f:
+        assert f.read() == payload
+    assert product_download.partial_download_files(str(tmpdir)) == []
+    if valid_state:
+        assert requested_ranges == [None, "bytes=120000-199999"]
+    else:
+        assert requested_ranges == [None]
+
+
+@mock.patch("esa_tf_platform.product_download.CHECKPOINT_SIZE", 10_000)
+def test_csc_download_interrupted(tmpdir, range_http_server):
+    payload = os.urandom(200_000)
+    url, requested_ranges = range_http_server(payload, fail_after=100_000)
+    target_checksum = hashlib.md5(payload).hexdigest()
+
+    session = product_download.CscApi(**CSC_HUB_CONFIG, resume_download=True)
+    product_info = {
+        "download_url": f"{url}/product",
+        "target_checksum": target_checksum,
+    }
+    with mock.patch.object(session, "get_product_info", return_value=product_info):
+        with pytest.raises(Exception):
+            session.download("product", directory_path=str(tmpdir))
+
+    partial = product_download.PartialDownload(
+        tmpdir.join("product.zip").strpath, len(payload), target_checksum
+    )
+    partial.load()
+    assert partial.ranges
+    assert partial.missing_ranges()[-1][1] == len(payload)
+
+
+def test_csc_download_interrupted_not_resumable(tmpdir, range_http_server):
+    payload = os.urandom(200_000)
+    url, _ = range_http_server(payload, fail_after=100_000)
+
+    session = product_download.CscApi(**CSC_HUB_CONFIG)
+    product_info = {
+        "download_url": f"{url}/product",
+        "target_checksum": hashlib.md5(payload).hexdigest(),
+    }
+    with mock.patch.object(session, "get_product_info", return_value=product_info):
+        with pytest.raises(Exception):
+            session.download("product", directory_path=str(tmpdir))
+
+    # the hub does not resume the downloads, the partial download is deleted
+    assert product_download.partial_download_files(str(tmpdir)) == []
+
+
+def test_csc_pooled_session():
+    session = product_download.CscApi(
+        **CSC_HUB_CONFIG, download_segments=16, max_retries=5
+    )
+    adapter = session.session.get_adapter("https://catalogue.dataspace.copernicus.eu")
+
+    assert session.auth_session is None
+    assert adapter._pool_maxsize == 16
+    assert adapter.max_retries.total == 5
+    assert 503 in adapter.max_retries.status_forcelist
+
+
+def test_csc_oauth2_token_refresh():
+    hub_config = {
+        **CSC_HUB_CONFIG,
+        "auth": "oauth2",
+        "query_auth": True,
+        "credentials": {
+            **CSC_HUB_CONFIG["credentials"],
+            "client_id": "client_id",
+            "token_endpoint": "https://identity.example.com/token",
+        },
+    }
+    session = product_download.CscApi(**hub_config)
+    tokens = [
+        {"access_token": "token1", "expires_at": time.time() + 30},
+        {"access_token": "token2", "expires_at": time.time() + 3600},
+    ]
+
+    with mock.patch.object(
+        session.auth_session, "fetch_token", side_effect=tokens
+    ) as fetch_token:
+        # no token is fetched at instantiation
+        assert session.token is None
+        session._ensure_token()
+        # the token expiring within the refresh margin is refreshed
+        session._ensure_token()
+        session._ensure_token()
+
+    assert fetch_token.call_count == 2
+    assert fetch_token.call_args.args == ("https://identity.example.com/token",)
+    assert session.token["access_token"] == "token2"
+
+
+def test_update_api_list_reuses_apis(tmpdir, monkeypatch):
+    monkeypatch.setattr(product_download, "SESSION_LIST", {})
+    monkeypatch.setattr(product_download, "HUBS_CONFIG", {})
+    hubs_config = {"hub1": CSC_HUB_CONFIG, "hub2": CSC_HUB_CONFIG}
+    hubs_config_file = tmpdir.join("hubs_credentials.yaml")
+    hubs_config_file.write(json.dumps(hubs_config))
+
+    session_list = dict(product_download.update_api_list.__wrapped__(hubs_config_file))
+    hubs_config["hub2"] = {**CSC_HUB_CONFIG, "download_segments": 4}
+    hubs_config_file.write(json.dumps(hubs_config))
+    new_session_list = product_download.update_api_list.__wrapped__(hubs_config_file)
+
+    assert new_session_list["hub1"] is session_list["hub1"]
+    assert new_session_list["hub2"] is not session_list["hub2"]
+    assert new_session_list["hub2"].download_segments == 4
@@ -0,0 +1,93 @@
+import os
+import zipfile
+
+from esa_tf_platform import extraction, workflows
+
+PRODUCT = "S2A_MSIL1C_20211022T062221_N0301_R048_T39GWH_20211022T064132.SAFE"
+FILES = {
+    "MTD_MSIL1C.xml": b"<metadata/>" * 1000,
+    "GRANULE/L1C_T39GWH/IMG_DATA/T39GWH_B02.jp2": os.urandom(300_000),
+    "GRANULE/L1C_T39GWH/IMG_DATA/T39GWH_B03.jp2": os.urandom(200_000),
+    "GRANULE/L1C_T39GWH/IMG_DATA/T39GWH_B04.jp2": os.urandom(100_000),
+    "GRANULE/L1C_T39GWH/QI_DATA/MSK_CLOUDS_B00.gml": b"<gml/>" * 1000,
+    "empty.txt": b"",
+}
+
+
+def make_product_zip(tmpdir):
+    zip_path = tmpdir.join("product.zip").strpath
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as product_zip:
+        product_zip.writestr(f"{PRODUCT}/", b"")
+        product_zip.writestr(f"{PRODUCT}/AUX_DATA/", b"")
+        for name, data in FILES.items():
+            product_zip.writestr(f"{PRODUCT}/{name}", data)
+    return zip_path
+
+
+def test_split_members():
+    infolist = []
+    for size in [5, 4, 1, 5, 4, 1]:
+        info = zipfile.ZipInfo(f"file{size}")
+        info.file_size = size
+        infolist.append(info)
+
+    bins = extraction.split_members(infolist, 2)
+
+    assert sorted(sum(info.file_size for info in b) for b in bins) == [10, 10]
+    assert len(extraction.split_members(infolist[:1], 4)) == 1
+
+
+def test_select_members(tmpdir):
+    with zipfile.ZipFile(make_product_zip(tmpdir)) as product_zip:
+        infolist = product_zip.infolist()
+
+    members = extraction.select_members(infolist, ["GRANULE/*_B0[23].jp2", "MTD_*"])
+
+    assert sorted(info.filename[len(PRODUCT) + 1 :] for info in members) == [
+        "",
+        "AUX_DATA/",
+        "GRANULE/L1C_T39GWH/IMG_DATA/T39GWH_B02.jp2",
+        "GRANULE/L1C_T39GWH/IMG_DATA/T39GWH_B03.jp2",
+        "MTD_MSIL1C.xml",
+    ]
+
+
+def test_unzip_product(tmpdir):
+    zip_path = make_product_zip(tmpdir)
+    processing_dir = tmpdir.mkdir("processing").strpath
+
+    product_path = workflows.unzip_product(zip_path, processing_dir)
+
+    assert product_path == os.path.join(processing_dir, PRODUCT)
+    assert os.path.isdir(os.path.join(product_path, "AUX_DATA"))
+    for name, data in FILES.items():
+        with open(os.path.join(product_path, name), "rb") as f:
+            assert f.read() == data
+
+
+def test_unzip_product_patterns(tmpdir):
+    zip_path = make_product_zip(tmpdir)
+    processing_dir = tmpdir.mkdir("processing").strpath
+
+    product_path = workflows.unzip_product(
+        zip_path, processing_dir, patterns=["*_B04.jp2"]
+    )
+
+    assert product_path == os.path.join(processing_dir, PRODUCT)
+    extracted = [
+        os.path.relpath(os.path.join(dirpath, filename), product_path)
+        for dirpath, _, filenames in os.walk(product_path)
+        for filename in filenames
+    ]
+    assert extracted == ["GRANULE/L1C_T39GWH/IMG_DATA/T39GWH_B04.jp2"]
+
+
+def test_extract_members_single_thread(tmpdir):
+    zip_path = make_product_zip(tmpdir)
+    processing_dir = tmpdir.mkdir("processing").strpath
+
+    product_path = extraction.extract_members(zip_path, processing_dir, threads=1)
+
+    for name, data in FILES.items():
+        with open(os.path.join(product_path, name), "rb") as f:
+            assert f.read() == data
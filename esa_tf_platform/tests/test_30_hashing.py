@@ -0,0 +1,144 @@
+import hashlib
+import os
+from unittest import mock
+
+import pytest
+
+from esa_tf_platform import hashing, product_download
+
+CSC_HUB_CONFIG = {
+    "api_type": "csc-api",
+    "auth": "basic",
+    "query_auth": False,
+    "download_auth": False,
+    "credentials": {
+        "api_url": "http://127.0.0.1",
+        "user": "user",
+        "password": "password",
+    },
+}
+
+
+def test_select_checksum():
+    checksums = {"MD5": "AB", "SHA-256": "CD", "unknown": "EF"}
+
+    assert hashing.select_checksum(checksums) == ("sha256", "cd")
+    assert hashing.select_checksum({"MD5": "AB"}) == ("md5", "ab")
+    assert hashing.select_checksum({"unknown": "EF"}) == (None, None)
+
+
+@mock.patch("esa_tf_platform.hashing.blake3", None)
+def test_select_checksum_unavailable_algorithm():
+    assert hashing.select_checksum({"BLAKE3": "AB", "MD5": "CD"}) == ("md5", "cd")
+
+
+def test_find_checksum():
+    product_info = {
+        "Checksum": [
+            {"Algorithm": "MD5", "Value": "ab"},
+            {"Algorithm": "SHA256", "Value": "cd"},
+        ]
+    }
+
+    assert product_download.CscApi.find_checksum(product_info) == ("sha256", "cd")
+    assert product_download.CscApi.find_checksum({}) == (None, None)
+
+
+def test_parse_multihash():
+    md5 = hashlib.md5(b"data").hexdigest()
+    sha256 = hashlib.sha256(b"data").hexdigest()
+
+    assert hashing.parse_multihash(f"d50110{md5}") == ("md5", md5)
+    assert hashing.parse_multihash(f"1220{sha256}") == ("sha256", sha256)
+    assert hashing.parse_multihash(f"1320{sha256}") == (None, sha256)
+    with pytest.raises(ValueError):
+        hashing.parse_multihash(f"1220{md5}")
+
+
+def test_background_hasher():
+    chunks = [os.urandom(1000) for _ in range(100)]
+    hasher = hashing.BackgroundHasher("sha256", maxsize=4)
+
+    for chunk in chunks:
+        hasher.update(chunk)
+
+    assert hasher.hexdigest() == hashlib.sha256(b"".join(chunks)).hexdigest()
+
+
+@pytest.mark.parametrize("size", [0, 1000, 3 * 1024**2 + 1])
+def test_file_checksum(tmpdir, size):
+    data = os.urandom(size)
+    path = tmpdir.join("file")
+    path.write_binary(data)
+
+    checksum = hashing.file_checksum(str(path), "md5", block_size=1024**2)
+
+    assert checksum == hashlib.md5(data).hexdigest()
+
+
+@pytest.mark.parametrize("checksum_mode", ["stream", "post"])
+def test_csc_download_checksum_algorithm(tmpdir, range_http_server, checksum_mode):
+    payload = os.urandom(100_000)
+    url, _ = range_http_server(payload)
+    session = product_download.CscApi(**CSC_HUB_CONFIG, checksum_mode=checksum_mode)
+    product_info = {
+        "download_url": f"{url}/product",
+        "target_checksum": hashlib.sha256(payload).hexdigest().upper(),
+        "checksum_algorithm": "sha256",
+    }
+
+    with mock.patch.object(session, "get_product_info", return_value=product_info):
+        path = session.download("product", directory_path=str(tmpdir))
+
+    with open(path, "rb") as f:
+        assert f.read() == payload
+
+
+def test_file_hasher(tmpdir):
+    data = os.urandom(10_000)
+    path = tmpdir.join("file")
+    path.write_binary(b"\0" * len(data))
+    hasher = hashing.FileHasher(str(path), "sha256", block_size=1000)
+
+    # the second half is written first, it is hashed once the first half is written
+    with open(path, "r+b") as f:
+        f.seek(5000)
+        f.write(data[5000:])
+        f.flush()
+        f.seek(0)
+        f.write(data[:2500])
+        f.flush()
+        hasher.update(2500)
+        f.write(data[2500:5000])
+        f.flush()
+    hasher.update(10_000)
+
+    assert hasher.hexdigest() == hashlib.sha256(data).hexdigest()
+
+
+@mock.patch("esa_tf_platform.product_download.MIN_SEGMENT_SIZE", 1024)
+def test_csc_download_segments_stream_checksum(tmpdir, range_http_server):
+    payload = os.urandom(100_000)
+    url, _ = range_http_server(payload)
+    session = product_download.CscApi(**CSC_HUB_CONFIG, download_segments=4)
+    product_info = {
+        "download_url": f"{url}/product",
+        "target_checksum": hashlib.sha256(payload).hexdigest(),
+        "checksum_algorithm": "sha256",
+    }
+
+    # the checksum is computed while the segments are downloaded, not after
+    with mock.patch.object(
+        session, "get_product_info", return_value=product_info
+    ), mock.patch.object(
+        hashing, "file_checksum", side_effect=AssertionError("file read again")
+    ):
+        path = session.download("product", directory_path=str(tmpdir))
+
+    with open(path, "rb") as f:
+        assert f.read() == payload
+
+
+def test_csc_checksum_mode_error():
+    with pytest.raises(ValueError, match="checksum_mode"):
+        product_download.CscApi(**CSC_HUB_CONFIG, checksum_mode="never")
@@ -0,0 +1,93 @@
+from unittest import mock
+
+import pytest
+import requests
+
+from esa_tf_platform import hub_health, product_download
+
+
+def test_hub_health_circuit_breaker():
+    health = hub_health.HubHealth(failure_threshold=2, open_duration=60)
+
+    health.record_failure()
+    assert health.state == hub_health.CLOSED
+    health.record_failure()
+    assert health.state == hub_health.OPEN
+    assert not health.allow_request()
+
+    with mock.patch("time.monotonic", return_value=health.opened_at + 60):
+        assert health.state == hub_health.HALF_OPEN
+        # only one probe is allowed in half-open state
+        assert health.allow_request()
+        assert not health.allow_request()
+        # a failed probe opens again the circuit
+        health.record_failure()
+        assert health.state == hub_health.OPEN
+
+    with mock.patch("time.monotonic", return_value=health.opened_at + 60):
+        assert health.allow_request()
+        health.record_success(throughput=100)
+    assert health.state == hub_health.CLOSED
+    assert health.success_rate == 0.25
+    assert health.throughput == 100
+
+
+def test_hub_health_ewma():
+    health = hub_health.HubHealth()
+    health.record_ttfb(1.0)
+    health.record_ttfb(2.0)
+
+    assert health.ttfb == pytest.approx(1.3)
+
+
+def test_order_hubs():
+    hub_health.get_hub_health("hub2").record_failure()
+    for _ in range(hub_health.FAILURE_THRESHOLD):
+        hub_health.get_hub_health("hub1").record_failure()
+
+    assert hub_health.order_hubs(["hub1", "hub2", "hub3", "hub4"]) == [
+        "hub3",
+        "hub4",
+        "hub2",
+        "hub1",
+    ]
+    assert hub_health.get_hubs_health()["hub1"]["state"] == hub_health.OPEN
+
+
+@mock.patch("esa_tf_platform.product_download.update_api_list")
+def test_download_skips_open_circuit(update_api_list):
+    broken_hub = mock.MagicMock()
+    broken_hub.download.side_effect = requests.ConnectionError()
+    working_hub = mock.MagicMock()
+    working_hub.download.return_value = "product_path"
+    update_api_list.return_value = {"broken": broken_hub, "working": working_hub}
+
+    for _ in range(hub_health.FAILURE_THRESHOLD + 2):
+        product_path = product_download.download(
+            "product",
+            processing_dir="processing_dir",
+            hubs_config_file="hubs_config_file",
+        )
+        assert product_path == "product_path"
+
+    # after the first failure the broken hub is sorted after the working one
+    assert broken_hub.download.call_count == 1
+    assert hub_health.get_hub_health("broken").consecutive_failures == 1
+
+
+@mock.patch("esa_tf_platform.product_download.update_api_list")
+def test_download_open_circuit_last_resort(update_api_list):
+    api_hub = mock.MagicMock()
+    api_hub.download.return_value = "product_path"
+    update_api_list.return_value = {"hub1": api_hub}
+    for _ in range(hub_health.FAILURE_THRESHOLD):
+        hub_health.get_hub_health("hub1").record_failure()
+
+    product_path = product_download.download(
+        "product",
+        processing_dir="processing_dir",
+        hubs_config_file="hubs_config_file",
+    )
+
+    assert product_path == "product_path"
+    assert hub_health.get_hub_health("hub1").state == hub_health.CLOSED
@@ -0,0 +1,35 @@
+import os
+from unittest import mock
+
+from esa_tf_platform import locality, product_cache
+
+
+def test_local_products(tmpdir, monkeypatch):
+    monkeypatch.setenv("PRODUCT_CACHE_DIR", tmpdir.join("cache").strpath)
+    monkeypatch.setenv("WORKING_DIR", tmpdir.join("working_dir").strpath)
+    tmpdir.mkdir("working_dir").mkdir("order_id").join("product_b.zip").write("")
+
+    def fill(staging_dir):
+        path = os.path.join(staging_dir, "product_a.zip")
+        open(path, "w").close()
+        return path
+
+    cache = product_cache.get_product_cache()
+    cache.fetch("product_a", tmpdir.mkdir("order").strpath, fill)
+
+    assert locality.local_products() == ["product_a"]
+    monkeypatch.setenv("TF_DEBUG", "1")
+    assert locality.local_products() == ["product_a", "product_b"]
+
+
+def test_report_products():
+    # outside a dask worker nothing is reported
+    locality.report_products(["product_a.zip"])
+
+    worker = mock.MagicMock(ip="10.0.0.1")
+    with mock.patch("dask.distributed.get_worker", return_value=worker):
+        locality.report_products(["product_a.zip"], held=False)
+    worker.log_event.assert_called_once_with(
+        locality.PRODUCT_LOCALITY_TOPIC,
+        {"host": "10.0.0.1", "products": ["product_a"], "held": False},
+    )
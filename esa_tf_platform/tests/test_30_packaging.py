@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import zipfile
+
+import pytest
+
+from esa_tf_platform import packaging
+
+PRODUCT = "S2A_MSIL2A_20211117T093251_N9999_R136_T33NTF_20211124T093440.SAFE"
+
+
+def make_product(tmpdir):
+    files = {
+        "MTD_MSIL2A.xml": b"<xml>" + b"metadata " * 10_000 + b"</xml>",
+        "GRANULE/T33NTF/IMG_DATA/R10m/B02.jp2": os.urandom(100_000),
+        "GRANULE/T33NTF/IMG_DATA/R10m/B03.JP2": os.urandom(1000),
+        "measurements/b02.zarr/0.0": os.urandom(1000),
+        "measurements/b02.zarr/.zarray": b'{"chunks": [10, 10]}',
+        "empty.txt": b"",
+        "métadonnées.txt": b"unicode name",
+    }
+    product = tmpdir.mkdir(PRODUCT)
+    for name, data in files.items():
+        path = product.join(name)
+        path.dirpath().ensure(dir=True)
+        path.write_binary(data)
+    product.mkdir("AUX_DATA")
+    return product.strpath, files
+
+
+def check_zip(zip_path, files):
+    with zipfile.ZipFile(zip_path) as product_zip:
+        assert product_zip.testzip() is None
+        infolist = product_zip.infolist()
+        assert infolist[0].filename == f"{PRODUCT}/"
+        assert f"{PRODUCT}/AUX_DATA/" in product_zip.namelist()
+        for name, data in files.items():
+            assert product_zip.read(f"{PRODUCT}/{name}") == data
+        return {info.filename[len(PRODUCT) + 1 :]: info for info in infolist}
+
+
+def test_package_folder(tmpdir):
+    product, files = make_product(tmpdir)
+    zip_path = tmpdir.join("product.zip").strpath
+
+    manifest = packaging.package_folder(product, zip_path, threads=2)
+
+    infos = check_zip(zip_path, files)
+    assert len(manifest["Members"]) == len(infos)
+    assert infos["MTD_MSIL2A.xml"].compress_type == zipfile.ZIP_DEFLATED
+    assert infos["MTD_MSIL2A.xml"].compress_size < len(files["MTD_MSIL2A.xml"])
+    for name in [
+        "GRANULE/T33NTF/IMG_DATA/R10m/B02.jp2",
+        "GRANULE/T33NTF/IMG_DATA/R10m/B03.JP2",
+        "measurements/b02.zarr/0.0",
+        "measurements/b02.zarr/.zarray",
+    ]:
+        assert infos[name].compress_type == zipfile.ZIP_STORED
+
+
+def test_package_folder_symlinked_folder(tmpdir):
+    product, files = make_product(tmpdir)
+    qi_data = tmpdir.mkdir("QI_DATA")
+    qi_data.join("report.xml").write_binary(b"<report/>")
+    os.symlink(qi_data.strpath, os.path.join(product, "QI_DATA"))
+    # a link to one of its parents is not followed forever
+    os.symlink(product, os.path.join(product, "AUX_DATA", "loop"))
+    zip_path = tmpdir.join("product.zip").strpath
+
+    packaging.package_folder(product, zip_path, threads=2)
+
+    infos = check_zip(zip_path, {**files, "QI_DATA/report.xml": b"<report/>"})
+    assert "QI_DATA/" in infos
+    assert not any(name.startswith("AUX_DATA/loop") for name in infos)
+
+
+def test_package_folder_stored_read_once(tmpdir, monkeypatch):
+    product, files = make_product(tmpdir)
+    zip_path = tmpdir.join("product.zip").strpath
+    opened = []
+
+    def tracked_open(path, *args, **kwargs):
+        opened.append(os.path.relpath(path, product))
+        return open(path, *args, **kwargs)
+
+    monkeypatch.setattr(packaging, "open", tracked_open, raising=False)
+    manifest = packaging.package_folder(product, zip_path, threads=2)
+
+    check_zip(zip_path, files)
+    assert opened.count("GRANULE/T33NTF/IMG_DATA/R10m/B02.jp2") == 1
+    checksums = {
+        member["Name"]: member["Checksum"][0]["Value"]
+        for member in manifest["Members"]
+        if "Checksum" in member
+    }
+    assert (
+        checksums[f"{PRODUCT}/GRANULE/T33NTF/IMG_DATA/R10m/B02.jp2"]
+        == hashlib.sha256(files["GRANULE/T33NTF/IMG_DATA/R10m/B02.jp2"]).hexdigest()
+    )
+
+
+def test_package_folder_manifest(tmpdir):
+    product, files = make_product(tmpdir)
+    zip_path = tmpdir.join("product.zip").strpath
+
+    manifest = packaging.package_folder(product, zip_path)
+
+    with open(zip_path, "rb") as f:
+        data = f.read()
+    assert manifest["Reference"] == "product.zip"
+    assert manifest["Size"] == len(data)
+    assert manifest["Checksum"] == [
+        {"Algorithm": "SHA256", "Value": hashlib.sha256(data).hexdigest()}
+    ]
+    infos = check_zip(zip_path, files)
+    members = {
+        member["Name"][len(PRODUCT) + 1 :]: member for member in manifest["Members"]
+    }
+    assert members.keys() == infos.keys()
+    for name, content in files.items():
+        assert members[name]["Size"] == len(content)
+        assert members[name]["CompressedSize"] == infos[name].compress_size
+        assert members[name]["CRC32"] == f"{infos[name].CRC:08x}"
+        assert (
+            members[name]["Checksum"][0]["Value"] == hashlib.sha256(content).hexdigest()
+        )
+    assert "Checksum" not in members["AUX_DATA/"]
+
+    manifest_path = packaging.manifest_path(zip_path)
+    packaging.write_manifest(manifest, manifest_path)
+    with open(manifest_path) as f:
+        assert json.load(f) == manifest
+
+
+def test_package_folder_checksum_algorithm(tmpdir):
+    product, _ = make_product(tmpdir)
+    zip_path = tmpdir.join("product.zip").strpath
+
+    manifest = packaging.package_folder(product, zip_path, checksum_algorithm="MD5")
+
+    with open(zip_path, "rb") as f:
+        assert manifest["Checksum"][0]["Value"] == hashlib.md5(f.read()).hexdigest()
+    assert manifest["Checksum"][0]["Algorithm"] == "MD5"
+
+    with pytest.raises(ValueError, match="not available"):
+        packaging.package_folder(product, zip_path, checksum_algorithm="unknown")
+
+
+def test_package_folder_options(tmpdir):
+    product, files = make_product(tmpdir)
+    zip_path = tmpdir.join("product.zip").strpath
+
+    packaging.package_folder(
+        product, zip_path, compression_level=0, stored_extensions=[".xml"]
+    )
+
+    infos = check_zip(zip_path, files)
+    assert infos["MTD_MSIL2A.xml"].compress_type == zipfile.ZIP_STORED
+    assert infos["empty.txt"].compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_package_folder_zip64(tmpdir, monkeypatch):
+    monkeypatch.setattr(packaging, "ZIP64_LIMIT", 5000)
+    monkeypatch.setattr(packaging, "ZIP64_COUNT_LIMIT", 5)
+    product, files = make_product(tmpdir)
+    zip_path = tmpdir.join("product.zip").strpath
+
+    packaging.package_folder(product, zip_path)
+
+    check_zip(zip_path, files)
+    with open(zip_path, "rb") as f:
+        assert b"PK\x06\x06" in f.read()
+
+
+@pytest.mark.skipif(shutil.which("unzip") is None, reason="unzip not available")
+def test_package_folder_unzip(tmpdir):
+    product, _ = make_product(tmpdir)
+    zip_path = tmpdir.join("product.zip").strpath
+
+    packaging.package_folder(product, zip_path)
+
+    subprocess.run(["unzip", "-tq", zip_path], check=True)
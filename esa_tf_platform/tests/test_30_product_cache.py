@@ -0,0 +1,210 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import time
+from unittest import mock
+
+from esa_tf_platform import catalogue_cache, product_cache, product_download
+
+
+def make_fill(content=b"product content", delay=0):
+    calls = []
+
+    def fill(staging_dir):
+        calls.append(staging_dir)
+        time.sleep(delay)
+        path = os.path.join(staging_dir, "product.zip")
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    return fill, calls
+
+
+def test_product_cache_fetch(tmpdir):
+    cache = product_cache.ProductCache(tmpdir.join("cache").strpath, max_size=1000)
+    order1 = tmpdir.mkdir("order1").strpath
+    order2 = tmpdir.mkdir("order2").strpath
+    fill, calls = make_fill()
+
+    path1 = cache.fetch("product", order1, fill, checksum="md5")
+    path2 = cache.fetch("product", order2, fill, checksum="md5")
+
+    assert len(calls) == 1
+    assert path1 == os.path.join(order1, "product.zip")
+    assert path2 == os.path.join(order2, "product.zip")
+    assert os.path.samefile(path1, path2)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # a different checksum is a cache miss
+    cache.fetch("product", order2, fill, checksum="other md5")
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_product_cache_verify_checksum(tmpdir):
+    cache = product_cache.ProductCache(tmpdir.join("cache").strpath, max_size=1000)
+    order_dir = tmpdir.mkdir("order").strpath
+    fill, calls = make_fill()
+    cache.fetch("product", order_dir, fill)
+
+    # the checksum of an entry filled without checksum is computed at the first hit
+    checksum = hashlib.md5(b"product content").hexdigest()
+    assert cache.get("product", checksum=checksum.upper()) is not None
+    with open(cache.metadata_path("product")) as f:
+        assert json.load(f)["checksum"] == checksum
+
+    # corrupted entry
+    os.chmod(cache.product_path("product"), 0o644)
+    with open(cache.product_path("product"), "wb") as f:
+        f.write(b"product CONTENT")
+    assert cache.get("product", checksum=checksum) is None
+    with open(cache.product_path("product"), "ab") as f:
+        f.write(b"!")
+    assert cache.get("product") is None
+
+    cache.fetch("product", order_dir, fill, checksum=checksum)
+    assert len(calls) == 2
+    assert cache.get("product", checksum=checksum) is not None
+
+
+def test_product_cache_concurrent_fill(tmpdir):
+    cache = product_cache.ProductCache(tmpdir.join("cache").strpath, max_size=1000)
+    fill, calls = make_fill(delay=0.2)
+    order_dirs = [tmpdir.mkdir(f"order{k}").strpath for k in range(4)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        paths = list(
+            pool.map(
+                lambda order_dir: cache.fetch("product", order_dir, fill), order_dirs
+            )
+        )
+
+    assert len(calls) == 1
+    assert all(os.path.isfile(path) for path in paths)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_product_cache_evict(tmpdir):
+    cache = product_cache.ProductCache(tmpdir.join("cache").strpath, max_size=25)
+    order_dir = tmpdir.mkdir("order").strpath
+
+    for k, product in enumerate(["product1", "product2", "product3"]):
+        fill, _ = make_fill(content=bytes(10))
+        cache.fetch(product, order_dir, fill)
+        os.remove(os.path.join(order_dir, f"{product}.zip"))
+        os.utime(cache.metadata_path(product), (k, k))
+
+    # product1 is the least recently used one
+    assert cache.get("product1") is None
+    assert cache.get("product2") is not None
+    assert cache.get("product3") is not None
+    assert cache.size() == 20
+
+
+def test_product_cache_evict_skips_linked_products(tmpdir):
+    cache = product_cache.ProductCache(tmpdir.join("cache").strpath, max_size=5)
+    order_dir = tmpdir.mkdir("order").strpath
+    fill, _ = make_fill(content=bytes(10))
+
+    cache.fetch("product", order_dir, fill)
+
+    assert cache.get("product") is not None
+
+
+def test_product_cache_evict_skips_symlinked_products(tmpdir):
+    cache = product_cache.ProductCache(tmpdir.join("cache").strpath, max_size=5)
+    order_dir = tmpdir.mkdir("order").strpath
+    fill, _ = make_fill(content=bytes(10))
+
+    # cache on a different file system than the order
+    with mock.patch("os.link", side_effect=OSError("cross-device link")):
+        link_path = cache.fetch("product", order_dir, fill)
+    assert os.path.islink(link_path)
+    assert cache.evict() == []
+    assert cache.get("product") is not None
+
+    os.remove(link_path)
+    assert cache.evict() == ["product"]
+    assert os.listdir(cache.users_dir) == []
+
+
+@mock.patch("esa_tf_platform.product_download.update_api_list")
+def test_download_with_product_cache(update_api_list, tmpdir, monkeypatch):
+    monkeypatch.setenv("PRODUCT_CACHE_DIR", tmpdir.join("cache").strpath)
+
+    def hub_download(product, directory_path, checksum=True):
+        path = os.path.join(directory_path, f"{product}.zip")
+        with open(path, "wb") as f:
+            f.write(b"product content")
+        return path
+
+    api_hub = mock.MagicMock()
+    api_hub.download.side_effect = hub_download
+    api_hub.get_product_info.return_value = {
+        "target_checksum": hashlib.md5(b"product content").hexdigest()
+    }
+    update_api_list.return_value = {"hub1": api_hub}
+
+    for order_id in ["order1", "order2"]:
+        processing_dir = tmpdir.mkdir(order_id).strpath
+        product_path = product_download.download(
+            "product.SAFE",
+            processing_dir=processing_dir,
+            hubs_config_file="hubs_config_file",
+        )
+        assert product_path == os.path.join(processing_dir, "product.zip")
+    assert api_hub.download.call_count == 1
+
+    # the product re-published with a different checksum is downloaded again
+    api_hub.get_product_info.return_value = {"target_checksum": "republished"}
+    product_download.download(
+        "product.SAFE",
+        processing_dir=tmpdir.mkdir("order3").strpath,
+        hubs_config_file="hubs_config_file",
+    )
+    assert api_hub.download.call_count == 2
+
+
+@mock.patch("esa_tf_platform.product_download.update_api_list")
+def test_download_with_product_cache_without_catalogue(
+    update_api_list, tmpdir, monkeypatch
+):
+    monkeypatch.setenv("PRODUCT_CACHE_DIR", tmpdir.join("cache").strpath)
+    # a catalogue cache of its own
+    monkeypatch.setenv("CATALOGUE_CACHE_SIZE", "17")
+    checksum = hashlib.md5(b"product content").hexdigest()
+
+    def hub_download(product, directory_path, checksum=True):
+        path = os.path.join(directory_path, f"{product}.zip")
+        with open(path, "wb") as f:
+            f.write(b"product content")
+        return path
+
+    api_hub = mock.MagicMock(api_url="https://hub.test")
+    api_hub.download.side_effect = hub_download
+    api_hub.get_product_info.return_value = {"target_checksum": checksum}
+    update_api_list.return_value = {"hub1": api_hub}
+
+    def download(order_id):
+        return product_download.download(
+            "product.SAFE",
+            processing_dir=tmpdir.mkdir(order_id).strpath,
+            hubs_config_file="hubs_config_file",
+        )
+
+    download("order1")
+    # the hubs are unreachable: the checksum recorded by the product cache is used
+    api_hub.get_product_info.side_effect = ConnectionError("hub unreachable")
+    assert os.path.exists(download("order2"))
+    assert api_hub.download.call_count == 1
+
+    # the checksum in the catalogue cache is used without querying the catalogue
+    api_hub.get_product_info.reset_mock()
+    catalogue_cache.get_catalogue_cache().put(
+        "https://hub.test", "product", {"target_checksum": checksum}
+    )
+    assert os.path.exists(download("order3"))
+    api_hub.get_product_info.assert_not_called()
+    assert api_hub.download.call_count == 1
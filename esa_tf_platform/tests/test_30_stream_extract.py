@@ -0,0 +1,128 @@
+import hashlib
+import io
+import os
+import zipfile
+from unittest import mock
+
+from esa_tf_platform import product_download, stream_extract
+
+CSC_HUB_CONFIG = {
+    "api_type": "csc-api",
+    "auth": "basic",
+    "query_auth": False,
+    "download_auth": False,
+    "credentials": {
+        "api_url": "http://127.0.0.1",
+        "user": "user",
+        "password": "password",
+    },
+}
+
+MEMBERS = {
+    "product.SAFE/manifest.safe": b"manifest" * 1000,
+    "product.SAFE/GRANULE/image.jp2": os.urandom(200_000),
+    "product.SAFE/empty": b"",
+}
+
+
+def make_zip(stream):
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(zipfile.ZipInfo("product.SAFE/"), b"")
+        for name, data in MEMBERS.items():
+            compress_type = zipfile.ZIP_STORED if name.endswith("jp2") else None
+            zf.writestr(name, data, compress_type=compress_type)
+
+
+class UnseekableStream(io.RawIOBase):
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def stream_download(payload, path, extractor, chunk_size=10_000):
+    with open(path, "wb") as f:
+        for offset in range(0, len(payload), chunk_size):
+            f.write(payload[offset : offset + chunk_size])
+            f.flush()
+            extractor.update(path, offset + len(payload[offset : offset + chunk_size]))
+
+
+def check_extracted(product_path):
+    assert os.path.basename(product_path) == "product.SAFE"
+    for name, data in MEMBERS.items():
+        with open(os.path.join(os.path.dirname(product_path), name), "rb") as f:
+            assert f.read() == data
+
+
+def test_stream_extractor(tmpdir):
+    payload = io.BytesIO()
+    make_zip(payload)
+    processing_dir = tmpdir.mkdir("processing_dir").strpath
+    path = os.path.join(processing_dir, "product.zip")
+    extractor = stream_extract.StreamExtractor(processing_dir, block_size=4096)
+
+    stream_download(payload.getvalue(), path, extractor)
+    product_path = extractor.finish(path)
+
+    assert extractor.fallback_reason is None
+    assert len(extractor.extracted) == len(MEMBERS) + 1
+    check_extracted(product_path)
+
+
+def test_stream_extractor_data_descriptor_fallback(tmpdir):
+    stream = UnseekableStream()
+    make_zip(stream)
+    processing_dir = tmpdir.mkdir("processing_dir").strpath
+    path = os.path.join(processing_dir, "product.zip")
+    extractor = stream_extract.StreamExtractor(processing_dir)
+
+    stream_download(stream.buffer.getvalue(), path, extractor)
+    product_path = extractor.finish(path)
+
+    assert "data descriptors" in extractor.fallback_reason
+    check_extracted(product_path)
+
+
+def test_download_progress():
+    calls = []
+    progress = product_download.DownloadProgress(
+        "path", lambda path, watermark: calls.append(watermark), ranges=[(30, 40)]
+    )
+
+    progress.update(10, 20)
+    progress.update(0, 5)
+    progress.update(0, 10)
+    progress.update(20, 30)
+    progress.update(40, 50)
+
+    assert calls == [5, 20, 40, 50]
+
+
+@mock.patch("esa_tf_platform.product_download.MIN_SEGMENT_SIZE", 1024)
+def test_csc_download_stream_extract(tmpdir, range_http_server):
+    payload = io.BytesIO()
+    make_zip(payload)
+    payload = payload.getvalue()
+    url, _ = range_http_server(payload)
+    processing_dir = tmpdir.mkdir("processing_dir").strpath
+    session = product_download.CscApi(**CSC_HUB_CONFIG, download_segments=4)
+    product_info = {
+        "download_url": f"{url}/product",
+        "target_checksum": hashlib.md5(payload).hexdigest(),
+    }
+    extractor = stream_extract.StreamExtractor(processing_dir)
+
+    with mock.patch.object(session, "get_product_info", return_value=product_info):
+        product_zip_file = session.download(
+            "product", directory_path=processing_dir, progress=extractor.update
+        )
+    product_path = extractor.finish(product_zip_file)
+
+    assert extractor.watermark == len(payload)
+    assert extractor.fallback_reason is None
+    check_extracted(product_path)
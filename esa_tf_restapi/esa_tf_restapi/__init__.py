@@ -23,11 +23,62 @@ __version__ = "1.5.9-osf"
 
 app = FastAPI(root_path=os.environ.get("ROOT_PATH", ""))
 
-from . import api, logger_setup, routes
+from . import api, config, logger_setup, routes
 
 logger_setup.logger_setup()
 
 
+@app.on_event("startup")
+async def install_config_reload():
+    try:
+        config.install_reload_signal_handler()
+    except ValueError:
+        logging.warning(
+            "the configuration can't be reloaded on SIGHUP: not main thread"
+        )
+
+
+@app.on_event("startup")
+async def start_orders_eviction():
+    api.evict_orders_in_background()
+
+
+@app.on_event("shutdown")
+async def stop_orders_eviction():
+    api.stop_evicting_orders()
+
+
+@app.on_event("startup")
+async def restore_orders():
+    # the orders are restored before connecting, so that their tasks are followed again
+    try:
+        api.restore_orders()
+    except Exception:
+        logging.exception("restoring of the transformation orders failed")
+
+
+@app.on_event("startup")
+async def start_orders_sync():
+    api.sync_orders_in_background()
+
+
+@app.on_event("shutdown")
+async def stop_orders_sync():
+    api.stop_syncing_orders()
+
+
+@app.on_event("shutdown")
+async def close_order_store():
+    api.close_order_store()
+
+
+@app.on_event("startup")
+async def load_workflow_catalogue():
+    # the workflows catalogue is loaded in background, without delaying the startup
+    if os.getenv("SCHEDULER"):
+        api.connect_in_background()
+
+
 @app.exception_handler(ODataException)
 async def validation_exception_handler(request, exc):
     logging.exception("Invalid OData query")
@@ -1,7 +1,7 @@
-import functools
 import logging
 import os
 import re
+import threading
 import typing as T
 from datetime import datetime
 
@@ -9,12 +9,33 @@ import dask.distributed
 
 from . import config
 from .auth import DEFAULT_USER
+from .locality import ProductLocality
+from .odata import decode_skiptoken, encode_skiptoken
+from .order_index import ORDERBY_KEYS
+from .order_store import open_order_store
 from .transformation_orders import Queue, TransformationOrder
+from .workflow_catalogue import WorkflowCatalogue
 
 logger = logging.getLogger(__name__)
 
 queue = Queue()
+product_locality = ProductLocality()
+workflow_catalogue = WorkflowCatalogue()
 CLIENT = None
+_connecting = threading.Lock()
+# the submissions run in the threads of the request handlers: the quota check and the
+# creation of the orders are serialized, so that an order is never submitted twice; they
+# are serialized also with the other processes sharing the order store, see Queue.submission
+_submitting = threading.Lock()
+_eviction_thread = None
+_eviction_lock = threading.Lock()
+_stop_eviction = threading.Event()
+DEFAULT_ORDERS_EVICTION_INTERVAL = 60  # sec
+_sync_thread = None
+_sync_lock = threading.Lock()
+_stop_sync = threading.Event()
+DEFAULT_ORDERS_SYNC_INTERVAL = 1  # sec
+DEFAULT_ORDERS_PAGE_SIZE = 1000
 FILE_MODIFICATION_INTERVAL = 86400  # sec
 
 SENTINEL1 = [
@@ -206,26 +227,118 @@ def instantiate_client(scheduler_addr=None):
         raise ValueError("environment variable 'SCHEDULER' not found")
     if not CLIENT or CLIENT.scheduler.addr != scheduler_addr:
         CLIENT = dask.distributed.Client(scheduler_addr)
+        queue.attach(CLIENT)
+        product_locality.attach(CLIENT)
+        workflow_catalogue.attach(CLIENT)
+        reattach_in_background(CLIENT)
 
     return CLIENT
 
 
-@functools.lru_cache()
-def get_all_workflows(scheduler=None, verbose=False):
+def restore_orders(url=None):
     """
-    Return the workflows configurations installed in the workers.
+    Open the order store (see ``open_order_store``) and restore in the queue the orders
+    saved before a restart of the API. Their tasks are followed again once the client is
+    connected, see ``reattach_orders``.
     """
+    store = open_order_store(url)
+    if store is None:
+        return
+    queue.restore(store, locality=product_locality)
 
-    # definition of the task must be internal
-    # to avoid dask to import esa_tf_restapi in the workers
-    def task():
-        import esa_tf_platform
 
-        return esa_tf_platform.get_all_workflows()
+def close_order_store():
+    if queue.store is not None:
+        queue.store.close()
 
-    client = instantiate_client(scheduler)
-    future = client.submit(task, priority=10)
-    workflows = client.gather(future)
+
+def reattach_orders(client):
+    """
+    Follow again the tasks of the orders restored by ``restore_orders``: the tasks still
+    running are followed with the events of the scheduler plugin, the orders of the other
+    ones are completed if their output product is on disk, failed if not.
+    """
+    transformation_orders = queue.get_orders_to_reattach()
+    for transformation_order in queue.get_orders_without_future():
+        transformation_order.set_client(client)
+    if not transformation_orders:
+        return
+    # the events are followed first, so that a task completed in the meantime is reported
+    for transformation_order in transformation_orders:
+        transformation_order.follow_task_events()
+
+    def tasks_state_on_scheduler(dask_scheduler, keys):
+        return {
+            key: dask_scheduler.tasks[key].state
+            for key in keys
+            if key in dask_scheduler.tasks
+        }
+
+    states = client.run_on_scheduler(
+        tasks_state_on_scheduler,
+        keys=[
+            transformation_order.task_id
+            for transformation_order in transformation_orders
+        ],
+    )
+    for transformation_order in transformation_orders:
+        transformation_order.reattach(states.get(transformation_order.task_id))
+    logger.info(
+        f"{len(transformation_orders)} transformation orders reattached, "
+        f"{len(states)} tasks found in the scheduler"
+    )
+
+
+def reattach_in_background(client):
+    def reattach():
+        try:
+            reattach_orders(client)
+        except Exception:
+            logger.exception("reattaching of the restored transformation orders failed")
+
+    threading.Thread(target=reattach, daemon=True).start()
+
+
+def connect_in_background(scheduler=None):
+    """
+    Instantiate the client in background, so that the workflows catalogue is loaded
+    without blocking the caller. It does nothing if a connection is already in progress.
+    """
+    if not _connecting.acquire(blocking=False):
+        return
+
+    def connect():
+        try:
+            instantiate_client(scheduler)
+        except Exception:
+            logger.exception("connection to the Dask scheduler failed")
+        finally:
+            _connecting.release()
+
+    threading.Thread(target=connect, daemon=True).start()
+
+
+def ensure_workflow_catalogue(scheduler=None):
+    """
+    Load the workflows catalogue, connecting to the scheduler and waiting for the workers,
+    if it has never been loaded, e.g. for the requests arriving on a cold start.
+    """
+    if not workflow_catalogue.loaded:
+        workflow_catalogue.load(instantiate_client(scheduler))
+
+
+def get_all_workflows(scheduler=None, verbose=False, load=True):
+    """
+    Return the workflows configurations installed in the workers, from the workflows
+    catalogue kept up to date in background. If the catalogue has never been loaded, it is
+    loaded waiting for the workers if ``load`` is True, otherwise the workflows are empty
+    until the catalogue is loaded in background.
+    """
+    if load:
+        ensure_workflow_catalogue(scheduler)
+    elif not workflow_catalogue.loaded and not CLIENT:
+        connect_in_background(scheduler)
+    workflows = workflow_catalogue.get_workflows()
 
     for workflow_id in workflows:
         if not verbose:
@@ -241,6 +354,43 @@ def get_all_workflows(scheduler=None, verbose=False):
     return workflows
 
 
+def reload_workflows(scheduler=None):
+    """
+    Reload the workflows registry of the workers, e.g. after the installation of new
+    plugins, and return the workflows ids registered by each worker.
+    """
+
+    # definition of the task must be internal
+    # to avoid dask to import esa_tf_restapi in the workers
+    def task(dask_worker):
+        import esa_tf_platform.workflows
+
+        esa_tf_platform.workflows.invalidate_workflows_registry()
+        version, workflows = esa_tf_platform.workflows.get_workflows_registry()
+        # the workflows catalogue is loaded again when the new version is received
+        esa_tf_platform.workflows.publish_registry_version(version, worker=dask_worker)
+        return sorted(workflows)
+
+    client = instantiate_client(scheduler)
+    return client.run(task)
+
+
+def get_hubs_health(scheduler=None):
+    """
+    Return the health statistics of the hubs, as seen by each worker.
+    """
+
+    # definition of the task must be internal
+    # to avoid dask to import esa_tf_restapi in the workers
+    def task():
+        import esa_tf_platform
+
+        return esa_tf_platform.get_hubs_health()
+
+    client = instantiate_client(scheduler)
+    return client.run(task)
+
+
 def get_workflow_by_id(
     workflow_id, esa_tf_config=None, user_id=DEFAULT_USER, verbose=False
 ):
@@ -260,16 +410,16 @@ def get_workflow_by_id(
     return workflow
 
 
-def get_workflows(product_type=None, esa_tf_config=None, verbose=False):
+def get_workflows(product_type=None, esa_tf_config=None, verbose=False, load=True):
     """
     Return the workflows configurations installed in the workers.
-    They may be filtered using the product type
+    They may be filtered using the product type. See ``get_all_workflows`` for ``load``.
     """
     if esa_tf_config is None:
         esa_tf_config = config.read_esa_tf_config()
-    excluded_workflows = esa_tf_config["excluded_workflows"]
+    excluded_workflows = esa_tf_config.excluded_workflows
     workflows = {}
-    for workflow_id, workflow in get_all_workflows(verbose=verbose).items():
+    for workflow_id, workflow in get_all_workflows(verbose=verbose, load=load).items():
         if workflow_id not in excluded_workflows:
             workflows[workflow_id] = workflow
 
@@ -340,14 +490,14 @@ def extract_roles_key(
     esa_tf_config, user_roles=[], key="profile", user_id=DEFAULT_USER
 ):
     """Return the profiles associated with the user's roles input list.
-    :param dict esa_tf_config: esa_tf configuration dictionary
+    :param Configuration esa_tf_config: esa_tf configuration
     :param list user_roles: user roles
     :param str key: it can be "profile" or "quota"
     :param str user_id: user ID
     :return set:
     """
-    roles_config = esa_tf_config.get("roles", {})
-    default_role = esa_tf_config["default_role"]
+    roles_config = esa_tf_config.roles
+    default_role = esa_tf_config.default_role
 
     if not user_roles:
         logger.warning(
@@ -377,7 +527,7 @@ def extract_roles_key(
 
 def get_profile(user_roles: list = [], user_id=DEFAULT_USER):
     esa_tf_config = config.read_esa_tf_config()
-    if not esa_tf_config["enable_authorization_check"]:
+    if not esa_tf_config.enable_authorization_check:
         return "manager"
 
     user_profiles = extract_roles_key(
@@ -411,6 +561,76 @@ def get_transformation_orders(
     return [order.get_info() for order in transformation_orders.values()]
 
 
+def get_transformation_orders_page(
+    filters: T.List[T.Tuple[str, str, str]] = [],
+    user_id: str = DEFAULT_USER,
+    filter_by_user_id: bool = True,
+    orderby: T.List[T.Tuple[str, str]] = [],
+    top: T.Optional[int] = None,
+    skip: int = 0,
+    skiptoken: T.Optional[str] = None,
+    count: bool = False,
+) -> T.Dict[str, T.Any]:
+    """
+    Return a page of the transformation orders, at most ``top`` and at most
+    ``ORDERS_PAGE_SIZE`` (environment variable, default 1000).
+    :param T.List[T.Tuple[str, str, str]] filters: list of tuple defining the filter to be applied
+    :param str user_id: user ID
+    :param bool filter_by_user_id: if True the transformation orders are filtered by the user_id
+    :param T.List[T.Tuple[str, str]] orderby: the key sorting the orders and its direction,
+    'asc' or 'desc', default SubmissionDate ascending; the orders are also sorted by Id
+    :param int top: maximum number of orders
+    :param int skip: number of orders skipped
+    :param str skiptoken: continuation token of the page returned in "next"
+    :param bool count: if True, the total number of orders selected is returned in "odata.count"
+    :return: the orders in "value" and, if there are more orders, the "$skiptoken" and
+    the "$top" of the next page in "next"
+    """
+    check_filter_validity(filters, user_id=user_id)
+    if len(orderby) > 1 or any(key not in ORDERBY_KEYS for key, _ in orderby):
+        raise RequestError(
+            user_id,
+            f"Transformation Orders can be sorted by only one of the following keys: "
+            f"{list(ORDERBY_KEYS)}",
+        )
+    key, direction = orderby[0] if orderby else ("SubmissionDate", "asc")
+    after = None
+    if skiptoken is not None:
+        try:
+            after = decode_skiptoken(skiptoken)
+            if key in ("SubmissionDate", "CompletedDate") and after[0] is not None:
+                datetime.fromisoformat(after[0])
+        except (TypeError, ValueError) as ex:
+            raise RequestError(user_id, str(ex))
+    page_size = int(os.getenv("ORDERS_PAGE_SIZE", DEFAULT_ORDERS_PAGE_SIZE))
+    limit = page_size if top is None else min(top, page_size)
+    # one more order is read to know if there is a next page
+    transformation_orders = queue.get_transformation_orders_page(
+        filters=filters,
+        user_id=user_id,
+        filter_by_user_id=filter_by_user_id,
+        orderby=key,
+        descending=direction == "desc",
+        skip=skip,
+        limit=limit + 1,
+        after=after,
+    )
+    infos = [order.get_info() for order in transformation_orders[:limit]]
+    page = {"value": infos}
+    if count:
+        page["odata.count"] = len(
+            queue.get_transformation_orders(
+                filters=filters, user_id=user_id, filter_by_user_id=filter_by_user_id
+            )
+        )
+    if len(transformation_orders) > limit and (top is None or top > limit):
+        page["next"] = {
+            "$skiptoken": encode_skiptoken(infos[-1].get(key), infos[-1]["Id"]),
+            "$top": None if top is None else top - limit,
+        }
+    return page
+
+
 def extract_workflow_defaults(config_workflow_options):
     """
     Extract default values from plugin workflow declaration
@@ -445,14 +665,14 @@ def check_user_quota(user_id, user_roles=None, esa_tf_config=None):
     """Check the user's quota to determine if he is able to submit a transformation or not. If the
     cap has been already reached, a ExceededQuota is raised.
 
-    :param dict esa_tf_config: esa_tf configuration dictionary containing the quotas and the key enable_quota_check
+    :param Configuration esa_tf_config: esa_tf configuration containing the quotas and the key enable_quota_check
     :param str user_id: user identifier
     :param str user_roles: list of the user roles
     :return:
     """
     if esa_tf_config is None:
         esa_tf_config = config.read_esa_tf_config()
-    if not esa_tf_config["enable_quota_check"]:
+    if not esa_tf_config.enable_quota_check:
         return
 
     user_quotas = extract_roles_key(
@@ -467,6 +687,26 @@ def check_user_quota(user_id, user_roles=None, esa_tf_config=None):
         )
 
 
+def get_running_orders(repair=False):
+    """
+    Return the number of running orders of each user, checking the counters used for the
+    quotas against the count recomputed from the orders; with ``repair`` the inconsistent
+    counters are fixed.
+    """
+    differences = queue.check_running_counts(repair=repair)
+    running_counts = dict(queue.running_counts)
+    return {
+        "value": [
+            {"UserId": user_id, "RunningOrders": count}
+            for user_id, count in sorted(running_counts.items())
+        ],
+        "Inconsistencies": [
+            {"UserId": user_id, "Counter": counter, "Actual": actual}
+            for user_id, (counter, actual) in sorted(differences.items())
+        ],
+    }
+
+
 def evict_orders(esa_tf_config=None):
     """Evict orders from the queue according to a
     configurable keeping period parameter. The keeping period parameter is based on the CompletedDate
@@ -474,7 +714,7 @@ def evict_orders(esa_tf_config=None):
     staging area). The keeping period parameter is expressed in minutes and is defined in the
     esa_tf.config file.
 
-    :param dict esa_tf_config: esa_tf configuration dictionary containing key keeping_period
+    :param Configuration esa_tf_config: esa_tf configuration containing key keeping_period
 
     :return:
     """
@@ -482,8 +722,81 @@ def evict_orders(esa_tf_config=None):
     # specified by the "FILE_MODIFICATION_INTERVAL" constant value, then the cache is cleared
     if esa_tf_config is None:
         esa_tf_config = config.read_esa_tf_config()
-    keeping_period = esa_tf_config["keeping_period"]
-    queue.remove_old_orders(keeping_period)
+    keeping_period = esa_tf_config.keeping_period
+    evicted_orders = queue.remove_old_orders(keeping_period)
+    if evicted_orders:
+        logger.info(f"{len(evicted_orders)} old orders evicted from the queue")
+    return evicted_orders
+
+
+def evict_orders_in_background(interval=None):
+    """
+    Start a thread evicting the old orders from the queue every ``interval`` seconds
+    (default ``ORDERS_EVICTION_INTERVAL`` environment variable, 60 seconds), so that the
+    eviction does not delay the submissions. It does nothing if the thread is running.
+    """
+    global _eviction_thread
+
+    if interval is None:
+        interval = float(
+            os.getenv("ORDERS_EVICTION_INTERVAL", DEFAULT_ORDERS_EVICTION_INTERVAL)
+        )
+    with _eviction_lock:
+        if _eviction_thread is not None and _eviction_thread.is_alive():
+            return _eviction_thread
+
+        def evict():
+            while not _stop_eviction.wait(interval):
+                try:
+                    evict_orders()
+                except Exception:
+                    logger.exception("eviction of the old orders failed")
+
+        _stop_eviction.clear()
+        _eviction_thread = threading.Thread(target=evict, daemon=True)
+        _eviction_thread.start()
+        return _eviction_thread
+
+
+def stop_evicting_orders():
+    _stop_eviction.set()
+    if _eviction_thread is not None:
+        _eviction_thread.join()
+
+
+def sync_orders_in_background(interval=None):
+    """
+    Start a thread copying in the queue the orders changed by the other processes sharing
+    the order store every ``interval`` seconds (default ``ORDERS_SYNC_INTERVAL``
+    environment variable, 1 second). It does nothing if the thread is running.
+    """
+    global _sync_thread
+
+    if interval is None:
+        interval = float(
+            os.getenv("ORDERS_SYNC_INTERVAL", DEFAULT_ORDERS_SYNC_INTERVAL)
+        )
+    with _sync_lock:
+        if _sync_thread is not None and _sync_thread.is_alive():
+            return _sync_thread
+
+        def sync():
+            while not _stop_sync.wait(interval):
+                try:
+                    queue.sync(locality=product_locality)
+                except Exception:
+                    logger.exception("synchronization of the orders failed")
+
+        _stop_sync.clear()
+        _sync_thread = threading.Thread(target=sync, daemon=True)
+        _sync_thread.start()
+        return _sync_thread
+
+
+def stop_syncing_orders():
+    _stop_sync.set()
+    if _sync_thread is not None:
+        _sync_thread.join()
 
 
 def submit_workflow(
@@ -511,18 +824,14 @@ def submit_workflow(
     # a default role is used if user_roles is equal to None or [], [None], [None, None, ...]
 
     esa_tf_config = config.read_esa_tf_config()
-    enable_traceability = esa_tf_config.pop("enable_traceability", False)
-    if enable_traceability:
-        logger.warning("Traceability no more supported, the keyword enable_traceability will be ignored")
+    if esa_tf_config.enable_traceability:
+        logger.warning(
+            "Traceability no more supported, the keyword enable_traceability will be ignored"
+        )
 
-    evict_orders(esa_tf_config=esa_tf_config)
-    check_user_quota(
-        user_id=user_id, user_roles=user_roles, esa_tf_config=esa_tf_config
-    )
     workflow = get_workflow_by_id(
         workflow_id, esa_tf_config=esa_tf_config, verbose=True
     )
-
     check_product_type(
         workflow["InputProductType"],
         input_product_reference["Reference"],
@@ -541,29 +850,53 @@ def submit_workflow(
         workflow_options,
     )
     logger.info(f"user: {user_id!r} - required transformation order {order_id!r}")
-
-
-    if order_id in queue.transformation_orders:
-        logger.info(f"oder {order_id!r} is already in list of submitted orders")
-        transformation_order = queue.transformation_orders[order_id]
-        transformation_order.maybe_resubmit()
-    else:
-        client = instantiate_client()
-        transformation_order = TransformationOrder(
-            client=client,
-            order_id=order_id,
-            product_reference=input_product_reference,
-            workflow_id=workflow_id,
-            workflow_name=workflow["WorkflowName"],
-            workflow_options=workflow_options,
-            enable_monitoring=esa_tf_config.get("enable_monitoring", True),
-            monitoring_polling_time_s=esa_tf_config.get(
-                "monitoring_polling_time_s", True
-            ),
-            uri_root=uri_root,
+    client = instantiate_client()
+
+    # only the quota check and the reservation of the order are serialized, the task is
+    # submitted once the reservation is committed, without delaying the other submissions
+    submit = False
+    with _submitting, queue.submission(locality=product_locality):
+        check_user_quota(
+            user_id=user_id, user_roles=user_roles, esa_tf_config=esa_tf_config
         )
-        transformation_order.submit()
-
-    queue.add_order(transformation_order, user_id=user_id)
+        transformation_order = queue.get_order(order_id)
+        if transformation_order is not None:
+            logger.info(f"oder {order_id!r} is already in list of submitted orders")
+            if not transformation_order.has_future():
+                # order restored from the order store
+                transformation_order.set_client(client)
+            if transformation_order.needs_resubmission():
+                queue.claim(order_id)
+                transformation_order.reserve(resubmit=True)
+                submit = True
+        else:
+            transformation_order = TransformationOrder(
+                client=client,
+                order_id=order_id,
+                product_reference=input_product_reference,
+                workflow_id=workflow_id,
+                workflow_name=workflow["WorkflowName"],
+                workflow_options=workflow_options,
+                enable_monitoring=esa_tf_config.enable_monitoring,
+                monitoring_polling_time_s=esa_tf_config.monitoring_polling_time_s,
+                uri_root=uri_root,
+                locality=product_locality,
+            )
+            if transformation_order.find_output_product():
+                # output product computed before a restart of the API
+                transformation_order.complete_from_output_dir()
+            else:
+                transformation_order.reserve()
+                submit = True
+
+        queue.add_order(transformation_order, user_id=user_id)
+
+    if submit:
+        try:
+            transformation_order.submit()
+        except Exception:
+            # the reservation is released, the order can be submitted again
+            transformation_order.complete_from_output_dir(finished=False)
+            raise
 
     return transformation_order.get_info()
@@ -1,9 +1,15 @@
+import logging
 import os
+import signal
+import stat
+import threading
 import typing as T
 
 import pydantic
 import yaml
 
+logger = logging.getLogger(__name__)
+
 
 class ConfigurationError(Exception):
     pass
@@ -24,23 +30,75 @@ class Configuration(pydantic.BaseModel):
     enable_monitoring: bool = True
     monitoring_polling_time_s: int = 10
 
+    class Config:
+        # the configuration is shared by all the requests
+        allow_mutation = False
 
-def read_esa_tf_config():
+
+def load_esa_tf_config(esa_tf_config_file):
     """
-    :return dict: returns esa_tf_config dictionary
+    Parse and validate the configuration file.
+    :return Configuration:
     """
-    esa_tf_config_file = os.getenv("ESA_TF_CONFIG_FILE", "./esa_tf.config")
-    if not os.path.isfile(esa_tf_config_file):
-        raise FileNotFoundError(
-            f"{esa_tf_config_file!r} not found, please define the correct path "
-            f"using the environment variable ESA_TF_CONFIG_FILE"
-        )
     with open(esa_tf_config_file) as file:
         esa_tf_config = yaml.load(file, Loader=yaml.FullLoader)
     try:
-        esa_tf_configuration_object = Configuration(**esa_tf_config)
+        return Configuration(**(esa_tf_config or {}))
     except ValueError as exc:
         raise ConfigurationError(
             f"invalid configuration file esa_tf.config: {exc!r}"
         ) from exc
-    return esa_tf_configuration_object.dict()
+
+
+# configuration parsed from the file and the file identity (path, inode, mtime and size)
+_esa_tf_config = None
+_esa_tf_config_key = None
+_esa_tf_config_lock = threading.Lock()
+
+
+def read_esa_tf_config():
+    """
+    Return the configuration, parsed again only when the file changes (path, inode,
+    modification time or size) or after ``invalidate_esa_tf_config``. The configuration
+    is shared by all the callers and can't be modified.
+    :return Configuration:
+    """
+    global _esa_tf_config, _esa_tf_config_key
+    esa_tf_config_file = os.getenv("ESA_TF_CONFIG_FILE", "./esa_tf.config")
+    try:
+        file_stat = os.stat(esa_tf_config_file)
+    except FileNotFoundError:
+        file_stat = None
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+        raise FileNotFoundError(
+            f"{esa_tf_config_file!r} not found, please define the correct path "
+            f"using the environment variable ESA_TF_CONFIG_FILE"
+        )
+    key = (
+        esa_tf_config_file,
+        file_stat.st_ino,
+        file_stat.st_mtime_ns,
+        file_stat.st_size,
+    )
+    with _esa_tf_config_lock:
+        if key != _esa_tf_config_key:
+            _esa_tf_config = load_esa_tf_config(esa_tf_config_file)
+            _esa_tf_config_key = key
+            logger.info(f"configuration file {esa_tf_config_file!r} loaded")
+        return _esa_tf_config
+
+
+def invalidate_esa_tf_config(*args):
+    """Forget the configuration, so that the file is parsed again at the next use."""
+    global _esa_tf_config, _esa_tf_config_key
+    with _esa_tf_config_lock:
+        _esa_tf_config = None
+        _esa_tf_config_key = None
+    logger.info("configuration invalidated")
+
+
+def install_reload_signal_handler():
+    """Parse again the configuration file when the process receives SIGHUP. It must be
+    called from the main thread."""
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, invalidate_esa_tf_config)
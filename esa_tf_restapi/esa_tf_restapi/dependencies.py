@@ -16,15 +16,27 @@ import typing as T
 from fastapi import Header, HTTPException, status
 
 from . import api, auth
+from .threadpool import run_blocking
 
 
 async def role_has_manager_profile(
     x_username: T.Optional[str] = Header(None), x_roles: str = Header(None)
 ):
     user = auth.get_user(x_username, x_roles)
-    profile = api.get_profile(user_roles=user.roles, user_id=user.username)
+    profile = await run_blocking(
+        api.get_profile, user_roles=user.roles, user_id=user.username
+    )
     if profile != "manager":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"Resource is forbidden",
         )
+
+
+async def workflow_catalogue_loaded():
+    """
+    Load the workflows catalogue on a cold start before the validation of the request
+    body, whose validators read the catalogue from the event loop without loading it.
+    """
+    if not api.workflow_catalogue.loaded:
+        await run_blocking(api.get_workflows)
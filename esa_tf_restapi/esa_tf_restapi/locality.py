@@ -0,0 +1,87 @@
+import logging
+import pathlib
+import threading
+
+import dask.distributed
+
+logger = logging.getLogger(__name__)
+
+# topic on which the workers publish the input products they hold locally
+PRODUCT_LOCALITY_TOPIC = "esa_tf-product-locality"
+
+
+def product_key(product):
+    """Return the product name without the extension (e.g. ``.zip`` or ``.SAFE``)."""
+    return pathlib.Path(product).stem
+
+
+class ProductLocality(object):
+    """
+    Index of the worker hosts that hold the input products locally (in the workers product
+    cache or in the processing dirs kept in debug mode). It is fed by the events that the
+    workers publish on the ``PRODUCT_LOCALITY_TOPIC`` Dask topic.
+    """
+
+    __slots__ = ("product_to_hosts", "_lock")
+
+    def __init__(self):
+        self.product_to_hosts = {}
+        self._lock = threading.Lock()
+
+    def update(self, host, products, held=True):
+        with self._lock:
+            for product in products:
+                key = product_key(product)
+                if held:
+                    self.product_to_hosts.setdefault(key, set()).add(host)
+                else:
+                    hosts = self.product_to_hosts.get(key, set())
+                    hosts.discard(host)
+                    if not hosts:
+                        self.product_to_hosts.pop(key, None)
+
+    def handle_event(self, event):
+        _, msg = event
+        self.update(msg["host"], msg["products"], held=msg.get("held", True))
+
+    def get_hosts(self, product):
+        """Return the hosts that hold the ``product``."""
+        # the sets are updated by the thread of the events
+        with self._lock:
+            hosts = list(self.product_to_hosts.get(product_key(product), ()))
+        return sorted(hosts)
+
+    def synchronize(self, client):
+        """Rebuild the index asking to the workers the products they hold."""
+
+        # definition of the task must be internal
+        # to avoid dask to import esa_tf_restapi in the workers
+        def task():
+            import esa_tf_platform.locality
+
+            return esa_tf_platform.locality.local_products()
+
+        products_by_worker = client.run(task)
+        product_to_hosts = {}
+        for worker_address, products in products_by_worker.items():
+            host = dask.distributed.comm.get_address_host(worker_address)
+            for product in products:
+                product_to_hosts.setdefault(product_key(product), set()).add(host)
+        with self._lock:
+            self.product_to_hosts = product_to_hosts
+        logger.info(f"products held by the workers: {len(product_to_hosts)}")
+
+    def attach(self, client):
+        """
+        Subscribe to the events published by the workers and synchronize the index
+        in background.
+        """
+        client.subscribe_topic(PRODUCT_LOCALITY_TOPIC, self.handle_event)
+
+        def synchronize():
+            try:
+                self.synchronize(client)
+            except Exception:
+                logger.exception("synchronization of the products locality failed")
+
+        threading.Thread(target=synchronize, daemon=True).start()
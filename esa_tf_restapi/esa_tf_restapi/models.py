@@ -35,7 +35,7 @@ class TranformationOrder(BaseModel):
 
     @validator("workflow_id", always=True, pre=True)
     def validate_wf_id(cls, v, values):
-        workflows = api.get_workflows()
+        workflows = api.get_workflows(load=False)
         workflows_ids = list(workflows)
 
         if v not in workflows_ids:
@@ -49,7 +49,7 @@ class TranformationOrder(BaseModel):
     @validator("workflow_options")
     def validate_wf_options(cls, v, values):
         try:
-            workflows = api.get_workflows()
+            workflows = api.get_workflows(load=False)
         except ValueError as exc:
             # This is needed because we don't want to capture internal pydantic exceptions
             raise Exception(exc.args[0]) from exc
@@ -1,26 +1,77 @@
+import base64
+import binascii
+import json
 from collections import namedtuple
 
 from odata_query.ast import And, BoolOp
+from odata_query.exceptions import ODataSyntaxError
 from odata_query.grammar import ODataLexer, ODataParser
 
-ODataParams = namedtuple("OData", ["filter", "count"], defaults=[[], False])
+ODataParams = namedtuple(
+    "OData",
+    ["filter", "count", "top", "skip", "orderby", "skiptoken"],
+    defaults=[[], False, None, 0, [], None],
+)
 ODataFilterExpr = namedtuple("ODataFilter", ["name", "operator", "value"])
+ODataOrderByExpr = namedtuple("ODataOrderBy", ["name", "direction"])
 
 lexer = ODataLexer()
 parser = ODataParser()
 
 
-def parse_qs(filter: str = None, count: bool = False):
-    odata_params = ODataParams(count=count)
+def parse_qs(
+    filter: str = None,
+    count: bool = False,
+    top: int = None,
+    skip: int = 0,
+    orderby: str = None,
+    skiptoken: str = None,
+):
+    odata_params = ODataParams(
+        count=count, top=top, skip=skip or 0, skiptoken=skiptoken
+    )
     if filter:
         odata_filter = parser.parse(lexer.tokenize(filter))
         odata_params = odata_params._replace(
             filter=[*_get_inner_expr([], odata_filter)]
         )
+    if orderby is not None:
+        odata_params = odata_params._replace(orderby=_get_orderby_expr(orderby))
 
     return odata_params
 
 
+def _get_orderby_expr(orderby: str):
+    expressions = []
+    for item in orderby.split(","):
+        if not item.strip():
+            raise ODataSyntaxError(f"empty $orderby item in {orderby!r}")
+        name, *direction = item.split()
+        if direction not in ([], ["asc"], ["desc"]):
+            raise ODataSyntaxError(f"invalid $orderby item {item.strip()!r}")
+        expressions.append(
+            ODataOrderByExpr(name=name, direction=(direction or ["asc"])[0])
+        )
+    return expressions
+
+
+def encode_skiptoken(value, order_id):
+    """Return the $skiptoken continuing after the order ``order_id`` with sort ``value``."""
+    token = json.dumps([value, order_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode()
+
+
+def decode_skiptoken(skiptoken):
+    """Return the ``(value, order_id)`` of the $skiptoken, raise ValueError if invalid."""
+    try:
+        value, order_id = json.loads(base64.urlsafe_b64decode(skiptoken.encode()))
+    except (binascii.Error, UnicodeError, TypeError, ValueError):
+        raise ValueError(f"invalid $skiptoken {skiptoken!r}")
+    if not isinstance(order_id, str):
+        raise ValueError(f"invalid $skiptoken {skiptoken!r}")
+    return value, order_id
+
+
 def _get_operator(op_type):
     types = {
         "Eq()": "eq",
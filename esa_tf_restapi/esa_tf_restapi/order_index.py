@@ -0,0 +1,353 @@
+import bisect
+import functools
+import itertools
+import math
+import operator
+from datetime import datetime
+
+# keys of the transformation orders indexed by value and by date
+HASH_INDEXES = ("Status", "WorkflowId", "InputProductReference")
+SORTED_INDEXES = ("SubmissionDate", "CompletedDate")
+# keys of the transformation orders that can be used to sort them
+ORDERBY_KEYS = ("SubmissionDate", "CompletedDate", "Status")
+
+
+def indexed_values(info):
+    """Return the values of the indexed keys of the order ``info``, with the dates parsed."""
+    values = {
+        "Status": info.get("Status"),
+        "WorkflowId": info.get("WorkflowId"),
+        "InputProductReference": (info.get("InputProductReference") or {}).get(
+            "Reference"
+        ),
+    }
+    for key in SORTED_INDEXES:
+        value = info.get(key)
+        values[key] = datetime.fromisoformat(value) if value else None
+    return values
+
+
+def sort_key(value):
+    """Return the key sorting ``value`` with None before all the other values."""
+    return (value is not None, value)
+
+
+def parse_filter(odata_filter):
+    """Return the filter ``(key, op, value)`` with the dates parsed."""
+    key, op, value = odata_filter
+    if key in SORTED_INDEXES:
+        value = datetime.fromisoformat(value)
+    return key, op, value
+
+
+class SortedIndex(object):
+    """
+    Order IDs sorted by key, in two parallel lists searched with ``bisect``. The orders
+    with the same key are sorted by ID, so that every order has a stable position.
+    """
+
+    __slots__ = ("keys", "order_ids")
+
+    def __init__(self):
+        self.keys = []
+        self.order_ids = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _ties(self, key):
+        return bisect.bisect_left(self.keys, key), bisect.bisect_right(self.keys, key)
+
+    def add(self, key, order_id):
+        position = bisect.bisect_left(self.order_ids, order_id, *self._ties(key))
+        self.keys.insert(position, key)
+        self.order_ids.insert(position, order_id)
+
+    def remove(self, key, order_id):
+        start, end = self._ties(key)
+        position = bisect.bisect_left(self.order_ids, order_id, start, end)
+        if position == end or self.order_ids[position] != order_id:
+            raise ValueError(f"order {order_id!r} not in the index")
+        del self.keys[position]
+        del self.order_ids[position]
+
+    def position(self, key, order_id, after=True):
+        """Return the position of the first order after ``(key, order_id)``, or of the
+        order itself if ``after`` is False."""
+        search = bisect.bisect_right if after else bisect.bisect_left
+        return search(self.order_ids, order_id, *self._ties(key))
+
+    def bounds(self, op, key):
+        """Return the slice of the positions of the keys satisfying ``op`` with ``key``."""
+        if op == "lt":
+            return 0, bisect.bisect_left(self.keys, key)
+        if op == "le":
+            return 0, bisect.bisect_right(self.keys, key)
+        if op == "gt":
+            return bisect.bisect_right(self.keys, key), len(self.keys)
+        if op == "ge":
+            return bisect.bisect_left(self.keys, key), len(self.keys)
+        if op == "eq":
+            return self._ties(key)
+        raise ValueError(f"operator {op!r} not supported")
+
+    def range(self, conditions):
+        """Return the slice of the positions of the keys satisfying all the
+        ``(op, key)`` conditions."""
+        start, end = 0, len(self.keys)
+        for op, key in conditions:
+            condition_start, condition_end = self.bounds(op, key)
+            start, end = max(start, condition_start), min(end, condition_end)
+        return start, max(start, end)
+
+    def slice(self, start, end):
+        return self.order_ids[start:end]
+
+    def lookup(self, op, key):
+        return self.slice(*self.bounds(op, key))
+
+    def count(self, op, key):
+        start, end = self.bounds(op, key)
+        return end - start
+
+
+class OrderIndex(object):
+    """
+    Secondary indexes of the transformation orders: hash indexes on ``Id``, ``Status``,
+    ``WorkflowId`` and ``InputProductReference`` and sorted indexes on ``SubmissionDate``
+    and ``CompletedDate``. The filters are applied starting from the most selective index,
+    checking the other filters on the indexed values, so that the dates of the orders are
+    never parsed while filtering. The orders are also sorted on each of the
+    ``ORDERBY_KEYS``, with the orders without the key first, to read them page by page.
+    """
+
+    __slots__ = ("values", "hash_indexes", "sorted_indexes", "orderings")
+
+    def __init__(self):
+        # order ID -> indexed values, in insertion order
+        self.values = {}
+        self.hash_indexes = {key: {} for key in HASH_INDEXES}
+        self.sorted_indexes = {key: SortedIndex() for key in SORTED_INDEXES}
+        self.orderings = {key: SortedIndex() for key in ORDERBY_KEYS}
+
+    def __len__(self):
+        return len(self.values)
+
+    def update(self, order_id, info):
+        """Add the order ``order_id`` or update its indexed values with ``info``."""
+        new_values = indexed_values(info)
+        old_values = self.values.get(order_id)
+        if new_values == old_values:
+            return
+        if old_values is None:
+            old_values = dict.fromkeys(new_values)
+            new_order = True
+        else:
+            new_order = False
+        for key in HASH_INDEXES:
+            if not new_order and old_values[key] == new_values[key]:
+                continue
+            if not new_order:
+                self._discard(key, old_values[key], order_id)
+            self.hash_indexes[key].setdefault(new_values[key], set()).add(order_id)
+        for key in SORTED_INDEXES:
+            if old_values[key] == new_values[key]:
+                continue
+            if old_values[key] is not None:
+                self.sorted_indexes[key].remove(old_values[key], order_id)
+            if new_values[key] is not None:
+                self.sorted_indexes[key].add(new_values[key], order_id)
+        for key in ORDERBY_KEYS:
+            if not new_order and old_values[key] == new_values[key]:
+                continue
+            if not new_order:
+                self.orderings[key].remove(sort_key(old_values[key]), order_id)
+            self.orderings[key].add(sort_key(new_values[key]), order_id)
+        self.values[order_id] = new_values
+
+    def remove(self, order_id):
+        values = self.values.pop(order_id, None)
+        if values is None:
+            return
+        for key in HASH_INDEXES:
+            self._discard(key, values[key], order_id)
+        for key in SORTED_INDEXES:
+            if values[key] is not None:
+                self.sorted_indexes[key].remove(values[key], order_id)
+        for key in ORDERBY_KEYS:
+            self.orderings[key].remove(sort_key(values[key]), order_id)
+
+    def _discard(self, key, value, order_id):
+        order_ids = self.hash_indexes[key].get(value)
+        if order_ids is None:
+            return
+        order_ids.discard(order_id)
+        if not order_ids:
+            del self.hash_indexes[key][value]
+
+    def count(self, key, op, value):
+        """Return the number of orders selected by the index of ``key``."""
+        if key == "Id":
+            return int(value in self.values)
+        if key in SORTED_INDEXES:
+            return self.sorted_indexes[key].count(op, value)
+        return len(self.hash_indexes[key].get(value, ()))
+
+    def lookup(self, key, op, value):
+        """Return the IDs of the orders selected by the index of ``key``."""
+        if key == "Id":
+            return {value} if value in self.values else set()
+        if key in SORTED_INDEXES:
+            return self.sorted_indexes[key].lookup(op, value)
+        return self.hash_indexes[key].get(value, set())
+
+    def match(self, order_id, key, op, value):
+        if key == "Id":
+            return getattr(operator, op)(order_id, value)
+        order_value = self.values[order_id][key]
+        if order_value is None and key in SORTED_INDEXES:
+            return False
+        return getattr(operator, op)(order_value, value)
+
+    def estimate(self, filters, order_ids=None):
+        """Return the number of candidates selected by ``plan``, without selecting them."""
+        counts = [len(self.values) if order_ids is None else len(order_ids)]
+        counts += [count for count, _, _ in self._paths(list(filters))]
+        return min(counts)
+
+    def _paths(self, filters):
+        """Return the access paths: (number of candidates, filters used, lookup)."""
+        paths = []
+        for position, (key, op, value) in enumerate(filters):
+            if key not in SORTED_INDEXES:
+                paths.append(
+                    (
+                        self.count(key, op, value),
+                        {position},
+                        functools.partial(self.lookup, key, op, value),
+                    )
+                )
+        for key, index in self.sorted_indexes.items():
+            positions = {
+                position
+                for position, odata_filter in enumerate(filters)
+                if odata_filter[0] == key
+            }
+            if positions:
+                start, end = index.range(
+                    filters[position][1:] for position in positions
+                )
+                paths.append(
+                    (end - start, positions, functools.partial(index.slice, start, end))
+                )
+        return paths
+
+    def plan(self, filters, order_ids=None):
+        """
+        Return the candidate order IDs and the filters still to be checked on them. The
+        candidates are selected with the most selective index: the hash index of an
+        ``eq`` filter or the sorted index of a date, with all the filters on the date
+        merged in a single range. They are ``order_ids`` if these are fewer, all the orders
+        if there are no filters.
+        """
+        filters = list(filters)
+        if not filters:
+            return (self.values if order_ids is None else order_ids), filters
+        count, positions, lookup = min(self._paths(filters), key=operator.itemgetter(0))
+        if order_ids is not None and len(order_ids) <= count:
+            return order_ids, filters
+        residual = [
+            odata_filter
+            for position, odata_filter in enumerate(filters)
+            if position not in positions
+        ]
+        return lookup(), residual
+
+    def select(self, filters, order_ids=None):
+        """
+        Return the IDs of the orders matching all the ``filters``, parsed with
+        ``parse_filter``, among ``order_ids`` (all the orders by default).
+        """
+        candidates, residual = self.plan(filters, order_ids=order_ids)
+        if order_ids is not None and candidates is not order_ids:
+            candidates = filter(order_ids.__contains__, candidates)
+        # the equality filters are checked on the sets of the hash indexes
+        checks = []
+        for key, op, value in residual:
+            if op == "eq" and key not in SORTED_INDEXES:
+                candidates = filter(
+                    self.lookup(key, op, value).__contains__, candidates
+                )
+            else:
+                checks.append((key, op, value))
+        return [
+            order_id
+            for order_id in candidates
+            if all(self.match(order_id, *odata_filter) for odata_filter in checks)
+        ]
+
+    def page(
+        self,
+        filters,
+        order_ids=None,
+        orderby="SubmissionDate",
+        descending=False,
+        skip=0,
+        limit=None,
+        after=None,
+    ):
+        """
+        Return the IDs of the orders selected as ``select``, sorted by ``orderby`` and then
+        by ID, skipping the first ``skip`` ones and those up to ``after``, the ``(sort key,
+        order ID)`` of the last order of the previous page, and at most ``limit`` of them.
+        The page is read walking the ordering of ``orderby`` from ``after``, checking the
+        filters on each order, unless the filters are so selective that the walk would
+        check more orders than sorting the selected ones.
+        """
+        filters = list(filters)
+        selected = self.estimate(filters, order_ids=order_ids)
+        if selected == 0 or limit == 0:
+            return []
+        orders = len(self.values)
+        wanted = orders if limit is None else min(orders, skip + limit)
+        # orders checked by the walk, if the selected orders are evenly spread
+        walk_cost = min(orders, wanted * orders / selected)
+        sort_cost = selected * math.log2(selected + 1)
+        if walk_cost > sort_cost:
+            order_ids_iter = self._sort(filters, order_ids, orderby, descending, after)
+        elif not filters and order_ids is None:
+            # all the orders are selected: the first ``skip`` ones are not checked
+            order_ids_iter = self._walk(filters, None, orderby, descending, after, skip)
+            skip = 0
+        else:
+            order_ids_iter = self._walk(filters, order_ids, orderby, descending, after)
+        stop = None if limit is None else skip + limit
+        return list(itertools.islice(order_ids_iter, skip, stop))
+
+    def _walk(self, filters, order_ids, orderby, descending, after, skip=0):
+        ordering = self.orderings[orderby]
+        if descending:
+            end = len(ordering)
+            if after is not None:
+                end = ordering.position(*after, after=False)
+            positions = range(end - 1 - skip, -1, -1)
+        else:
+            start = 0 if after is None else ordering.position(*after)
+            positions = range(start + skip, len(ordering))
+        for position in positions:
+            order_id = ordering.order_ids[position]
+            if order_ids is not None and order_id not in order_ids:
+                continue
+            if all(self.match(order_id, *odata_filter) for odata_filter in filters):
+                yield order_id
+
+    def _sort(self, filters, order_ids, orderby, descending, after):
+        entries = sorted(
+            (sort_key(self.values[order_id][orderby]), order_id)
+            for order_id in self.select(filters, order_ids=order_ids)
+        )
+        if descending:
+            end = len(entries) if after is None else bisect.bisect_left(entries, after)
+            return (order_id for _, order_id in reversed(entries[:end]))
+        start = 0 if after is None else bisect.bisect_right(entries, after)
+        return (order_id for _, order_id in entries[start:])
@@ -0,0 +1,407 @@
+import abc
+import contextlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ORDER_STORE_URL = "sqlite:///esa_tf_orders.db"
+DEFAULT_FLUSH_INTERVAL = 1.0  # sec
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BUSY_TIMEOUT = 30  # sec
+# the changes are kept for the processes sharing the store that have not read them yet
+CHANGES_RETENTION = 600  # sec
+# maximum number of parameters of a query
+QUERY_CHUNK_SIZE = 500
+
+
+class OrderStore(abc.ABC):
+    """
+    Interface of the persistent stores of the transformation orders: the records of the
+    orders (see ``TransformationOrder.to_record``), the users that required them and the
+    transitions of their status. A store can be shared by several processes of the API:
+    each process reads the changes written by the others with ``changes`` and serializes
+    the submissions with ``transaction``.
+    """
+
+    @abc.abstractmethod
+    def save_order(self, record):
+        """Save the ``record`` of the order, replacing the previous one."""
+
+    @abc.abstractmethod
+    def add_user(self, order_id, user_id):
+        """Add ``user_id`` to the users that required the order."""
+
+    @abc.abstractmethod
+    def add_transition(self, order_id, status, date):
+        """Add the transition of the order to ``status`` at ``date``."""
+
+    @abc.abstractmethod
+    def remove_order(self, order_id):
+        """Remove the order with its users and transitions."""
+
+    @abc.abstractmethod
+    def load(self):
+        """Return the list of the stored ``(record, users)``."""
+
+    @abc.abstractmethod
+    def load_transitions(self, order_id):
+        """Return the list of the stored ``(status, date)`` transitions of the order."""
+
+    @abc.abstractmethod
+    def last_change(self):
+        """Return the sequence number of the last change of the orders."""
+
+    @abc.abstractmethod
+    def changes(self, since):
+        """
+        Return the sequence number of the last change and the orders changed by the other
+        processes after the change ``since``, as a dictionary order ID -> ``(record,
+        users)``, with record None if the order has been removed. The dictionary is None
+        if the changes are no longer available and all the orders must be loaded again.
+        """
+
+    @abc.abstractmethod
+    def transaction(self):
+        """Return a context manager excluding the transactions of the other processes,
+        the writes queued in the context are executed at its exit."""
+
+    @abc.abstractmethod
+    def flush(self):
+        """Write the queued changes."""
+
+    @abc.abstractmethod
+    def close(self):
+        """Write the queued changes and release the store."""
+
+
+class SQLiteOrderStore(OrderStore):
+    """
+    Order store in a SQLite database in WAL mode. The writes are queued and executed by a
+    background thread in a single transaction every ``flush_interval`` seconds, or as soon
+    as ``batch_size`` writes are queued, so that the request handlers never wait for the
+    disk. Only the last record of an order saved several times in a batch is written.
+    The changes of the orders and of their users are logged in the ``order_changes``
+    table, with the ID of the writer, for the other processes sharing the database.
+    """
+
+    __slots__ = (
+        "path",
+        "flush_interval",
+        "batch_size",
+        "writer_id",
+        "_connection",
+        "_connection_lock",
+        "_condition",
+        "_pending",
+        "_records",
+        "_transaction",
+        "_pruned_at",
+        "_closed",
+        "_thread",
+    )
+
+    def __init__(
+        self,
+        path,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        batch_size=DEFAULT_BATCH_SIZE,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.writer_id = uuid.uuid4().hex
+        self._connection = sqlite3.connect(
+            path, timeout=DEFAULT_BUSY_TIMEOUT, check_same_thread=False
+        )
+        self._connection_lock = threading.RLock()
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS orders "
+                "(order_id TEXT PRIMARY KEY, record TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS order_users "
+                "(order_id TEXT NOT NULL, user_id TEXT NOT NULL, "
+                "PRIMARY KEY (order_id, user_id))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS order_transitions "
+                "(order_id TEXT NOT NULL, status TEXT, date TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS order_transitions_order_id "
+                "ON order_transitions (order_id)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS order_changes "
+                "(seq INTEGER PRIMARY KEY AUTOINCREMENT, order_id TEXT NOT NULL, "
+                "writer TEXT NOT NULL, date REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS order_changes_date ON order_changes (date)"
+            )
+        self._condition = threading.Condition()
+        # queued (operation, order ID, arguments), the last record saved of each order
+        self._pending = []
+        self._records = {}
+        self._transaction = False
+        self._pruned_at = time.monotonic()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_url(cls, url):
+        """Open the store of ``sqlite:///relative/path`` or ``sqlite:////absolute/path``."""
+        path = url[len("sqlite:///") :]
+        if not path:
+            raise ValueError(f"order store {url!r} without the database path")
+        return cls(path)
+
+    def _queue(self, operation, order_id, *arguments, record=None):
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"order store {self.path!r} closed")
+            if record is not None:
+                self._records[order_id] = record
+            self._pending.append((operation, order_id, arguments))
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def save_order(self, record):
+        self._queue("save", record["order_id"], record=json.dumps(record))
+
+    def add_user(self, order_id, user_id):
+        self._queue("add_user", order_id, user_id)
+
+    def add_transition(self, order_id, status, date):
+        self._queue("add_transition", order_id, status, date)
+
+    def remove_order(self, order_id):
+        self._queue("remove", order_id)
+
+    def load(self):
+        self.flush()
+        with self._connection_lock:
+            users = {}
+            for order_id, user_id in self._connection.execute(
+                "SELECT order_id, user_id FROM order_users"
+            ):
+                users.setdefault(order_id, []).append(user_id)
+            return [
+                (json.loads(record), users.get(order_id, []))
+                for order_id, record in self._connection.execute(
+                    "SELECT order_id, record FROM orders ORDER BY rowid"
+                )
+            ]
+
+    def load_transitions(self, order_id):
+        self.flush()
+        with self._connection_lock:
+            return list(
+                self._connection.execute(
+                    "SELECT status, date FROM order_transitions WHERE order_id = ? "
+                    "ORDER BY rowid",
+                    (order_id,),
+                )
+            )
+
+    def last_change(self):
+        with self._connection_lock:
+            row = self._connection.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'order_changes'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def changes(self, since):
+        with self._connection_lock:
+            last = self.last_change()
+            if last <= since:
+                return last, {}
+            (first,) = self._connection.execute(
+                "SELECT MIN(seq) FROM order_changes"
+            ).fetchone()
+            if first is None or first > since + 1:
+                # the changes after ``since`` have been pruned
+                return last, None
+            order_ids = [
+                order_id
+                for (order_id,) in self._connection.execute(
+                    "SELECT DISTINCT order_id FROM order_changes "
+                    "WHERE seq > ? AND seq <= ? AND writer != ?",
+                    (since, last, self.writer_id),
+                )
+            ]
+            changed = dict.fromkeys(order_ids, (None, []))
+            for start in range(0, len(order_ids), QUERY_CHUNK_SIZE):
+                chunk = order_ids[start : start + QUERY_CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                for order_id, record in self._connection.execute(
+                    f"SELECT order_id, record FROM orders "
+                    f"WHERE order_id IN ({placeholders})",
+                    chunk,
+                ):
+                    changed[order_id] = (json.loads(record), [])
+                for order_id, user_id in self._connection.execute(
+                    f"SELECT order_id, user_id FROM order_users "
+                    f"WHERE order_id IN ({placeholders})",
+                    chunk,
+                ):
+                    if changed[order_id][0] is not None:
+                        changed[order_id][1].append(user_id)
+        return last, changed
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._connection_lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._transaction = True
+            try:
+                yield
+            finally:
+                self._transaction = False
+                try:
+                    self._execute_pending()
+                    self._connection.commit()
+                except Exception:
+                    self._connection.rollback()
+                    raise
+
+    def flush(self):
+        """Execute the queued writes in a single transaction."""
+        with self._connection_lock:
+            if self._transaction:
+                self._execute_pending()
+                return
+            try:
+                self._execute_pending()
+                self._connection.commit()
+            except Exception:
+                self._connection.rollback()
+                raise
+
+    def _execute_pending(self):
+        with self._condition:
+            pending, self._pending = self._pending, []
+            records, self._records = self._records, {}
+        if not pending:
+            return
+        try:
+            # only the last save of each order is executed, with the last record
+            last_saves = {
+                order_id: position
+                for position, (operation, order_id, _) in enumerate(pending)
+                if operation == "save"
+            }
+            now = time.time()
+            for position, (operation, order_id, arguments) in enumerate(pending):
+                record = (
+                    records.get(order_id)
+                    if last_saves.get(order_id) == position
+                    else None
+                )
+                self._execute(operation, order_id, arguments, record, now)
+        except Exception:
+            # the writes are queued again, before the ones queued in the meantime
+            with self._condition:
+                self._pending[:0] = pending
+                for order_id, record in records.items():
+                    self._records.setdefault(order_id, record)
+            raise
+
+    def _execute(self, operation, order_id, arguments, record, now):
+        if operation == "save" and record is not None:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO orders (order_id, record) VALUES (?, ?)",
+                (order_id, record),
+            )
+        elif operation == "add_user":
+            self._connection.execute(
+                "INSERT OR IGNORE INTO order_users (order_id, user_id) VALUES (?, ?)",
+                (order_id, *arguments),
+            )
+        elif operation == "add_transition":
+            self._connection.execute(
+                "INSERT INTO order_transitions (order_id, status, date) "
+                "VALUES (?, ?, ?)",
+                (order_id, *arguments),
+            )
+            return
+        elif operation == "remove":
+            for table in ("orders", "order_users", "order_transitions"):
+                self._connection.execute(
+                    f"DELETE FROM {table} WHERE order_id = ?", (order_id,)
+                )
+        else:
+            return
+        self._connection.execute(
+            "INSERT INTO order_changes (order_id, writer, date) VALUES (?, ?, ?)",
+            (order_id, self.writer_id, now),
+        )
+
+    def prune_changes(self, retention=CHANGES_RETENTION):
+        """Delete the changes older than ``retention`` seconds."""
+        with self._connection_lock:
+            with self._connection:
+                self._connection.execute(
+                    "DELETE FROM order_changes WHERE date < ?",
+                    (time.time() - retention,),
+                )
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                closed = self._closed
+            try:
+                self.flush()
+                if time.monotonic() - self._pruned_at > CHANGES_RETENTION / 10:
+                    self._pruned_at = time.monotonic()
+                    self.prune_changes()
+            except Exception:
+                logger.exception(f"writing of the order store {self.path!r} failed")
+            if closed:
+                return
+
+    def close(self):
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        with self._connection_lock:
+            self._connection.close()
+
+
+STORE_BACKENDS = {
+    "sqlite": SQLiteOrderStore.from_url,
+}
+
+
+def open_order_store(url=None):
+    """
+    Open the order store with URL ``url`` (default ``ORDER_STORE_URL`` environment
+    variable, ``sqlite:///esa_tf_orders.db``). Return None if the URL is ``none``.
+    """
+    if url is None:
+        url = os.getenv("ORDER_STORE_URL", DEFAULT_ORDER_STORE_URL)
+    if url.lower() == "none":
+        return None
+    scheme = urllib.parse.urlparse(url).scheme
+    if scheme not in STORE_BACKENDS:
+        raise ValueError(
+            f"order store {url!r} not supported, the supported schemes are "
+            f"{list(STORE_BACKENDS)!r}"
+        )
+    return STORE_BACKENDS[scheme](url)
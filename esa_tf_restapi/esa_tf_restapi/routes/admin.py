@@ -16,8 +16,9 @@ from typing import Optional
 
 from fastapi import APIRouter, Depends, Header, Query, Request
 
-from .. import app
+from .. import api, app
 from ..dependencies import role_has_manager_profile
+from ..threadpool import run_blocking
 from .user import transformation_orders
 
 logger = logging.getLogger(__name__)
@@ -32,6 +33,7 @@ router = APIRouter(
 
 @router.get("/TransformationOrders")
 async def admin_transformation_orders(
+    request: Request,
     rawfilter: Optional[str] = Query(
         None,
         alias="$filter",
@@ -43,16 +45,79 @@ async def admin_transformation_orders(
         title="OData $count flag",
         description='Include number of results in the "odata.count" field',
     ),
+    top: Optional[int] = Query(
+        None,
+        alias="$top",
+        ge=0,
+        title="OData $top query",
+        description="Maximum number of results",
+    ),
+    skip: Optional[int] = Query(
+        0,
+        alias="$skip",
+        ge=0,
+        title="OData $skip query",
+        description="Number of results skipped",
+    ),
+    orderby: Optional[str] = Query(
+        None,
+        alias="$orderby",
+        title="OData $orderby query",
+        description="SubmissionDate, CompletedDate or Status, followed by asc or desc",
+    ),
+    skiptoken: Optional[str] = Query(
+        None,
+        alias="$skiptoken",
+        title="OData $skiptoken",
+        description='Continuation token of the "@odata.nextLink" of the previous page',
+    ),
     x_username: Optional[str] = Header(None),
     x_roles: Optional[str] = Header(None),
 ):
     return await transformation_orders(
+        request,
         rawfilter=rawfilter,
         count=count,
+        top=top,
+        skip=skip,
+        orderby=orderby,
+        skiptoken=skiptoken,
         x_username=x_username,
         x_roles=x_roles,
         filter_by_user_id=False,
     )
 
 
+@router.get("/HubsHealth")
+async def admin_hubs_health():
+    workers_hubs_health = await run_blocking(api.get_hubs_health)
+    return {
+        "value": [
+            {"Worker": worker, "Hubs": hubs_health}
+            for worker, hubs_health in workers_hubs_health.items()
+        ]
+    }
+
+
+@router.get("/RunningOrders")
+async def admin_running_orders(repair: bool = False):
+    return await run_blocking(api.get_running_orders, repair=repair)
+
+
+@router.get("/Workflows/Catalogue")
+async def admin_workflow_catalogue():
+    return await run_blocking(api.workflow_catalogue.to_dict)
+
+
+@router.post("/Workflows/Reload")
+async def admin_reload_workflows():
+    workers_workflows = await run_blocking(api.reload_workflows)
+    return {
+        "value": [
+            {"Worker": worker, "Workflows": workflows}
+            for worker, workflows in workers_workflows.items()
+        ]
+    }
+
+
 app.include_router(router)
@@ -15,12 +15,14 @@
 import logging
 from typing import Optional
 
-from fastapi import Header, HTTPException, Query, Request, Response, status
+from fastapi import Depends, Header, HTTPException, Query, Request, Response, status
 from fastapi.responses import HTMLResponse, PlainTextResponse
 
 from .. import api, app, models
 from ..auth import DEFAULT_USER, get_user
+from ..dependencies import workflow_catalogue_loaded
 from ..odata import parse_qs
+from ..threadpool import run_blocking
 
 logger = logging.getLogger(__name__)
 
@@ -38,7 +40,7 @@ async def workflows(
     user = get_user(x_username, x_roles)
     user_id = user.username if user else DEFAULT_USER
     logger.info(f"user: {user_id} - required workflows configurations")
-    data = api.get_workflows()
+    data = await run_blocking(api.get_workflows)
     return {
         "value": [{"Id": id, **ops} for id, ops in data.items()],
     }
@@ -56,7 +58,7 @@ async def workflow(
     logger.info(
         f"user: {user.username} - required the configuration about '{id}' workflow"
     )
-    data = api.get_workflow_by_id(id, user_id=user_id)
+    data = await run_blocking(api.get_workflow_by_id, id, user_id=user_id)
     base = request.url_for("workflows")
     return {
         "@odata.id": f"{base}('{id}')",
@@ -67,6 +69,7 @@ async def workflow(
 
 @app.get("/TransformationOrders")
 async def transformation_orders(
+    request: Request,
     rawfilter: Optional[str] = Query(
         None,
         alias="$filter",
@@ -78,12 +81,40 @@ async def transformation_orders(
         title="OData $count flag",
         description='Include number of results in the "odata.count" field',
     ),
+    top: Optional[int] = Query(
+        None,
+        alias="$top",
+        ge=0,
+        title="OData $top query",
+        description="Maximum number of results",
+    ),
+    skip: Optional[int] = Query(
+        0,
+        alias="$skip",
+        ge=0,
+        title="OData $skip query",
+        description="Number of results skipped",
+    ),
+    orderby: Optional[str] = Query(
+        None,
+        alias="$orderby",
+        title="OData $orderby query",
+        description="SubmissionDate, CompletedDate or Status, followed by asc or desc",
+    ),
+    skiptoken: Optional[str] = Query(
+        None,
+        alias="$skiptoken",
+        title="OData $skiptoken",
+        description='Continuation token of the "@odata.nextLink" of the previous page',
+    ),
     x_username: Optional[str] = Header(None),
     x_roles: Optional[str] = Header(None),
     filter_by_user_id: bool = True,
 ):
     user = get_user(x_username, x_roles)
-    odata_params = parse_qs(filter=rawfilter)
+    odata_params = parse_qs(
+        filter=rawfilter, top=top, skip=skip, orderby=orderby, skiptoken=skiptoken
+    )
     filters = [(f.name, f.operator, f.value) for f in odata_params.filter]
     if not count:
         msg = f"user: {user.username} - required the transformation orders list"
@@ -93,15 +124,35 @@ async def transformation_orders(
                 f" filtered by '{' and '.join([' '.join(f) for f in filters])}'"
             )
         logger.info(msg + msg_filter)
-    data = api.get_transformation_orders(
-        filters, user_id=user.username, filter_by_user_id=filter_by_user_id
+    page = await run_blocking(
+        api.get_transformation_orders_page,
+        filters,
+        user_id=user.username,
+        filter_by_user_id=filter_by_user_id,
+        orderby=[(o.name, o.direction) for o in odata_params.orderby],
+        top=odata_params.top,
+        skip=odata_params.skip,
+        skiptoken=odata_params.skiptoken,
+        count=bool(count),
     )
+    next_page = page.get("next")
     return {
-        **({"odata.count": len(data)} if count else {}),
-        "value": data,
+        **({"odata.count": page["odata.count"]} if count else {}),
+        "value": page["value"],
+        **({"@odata.nextLink": next_link(request, next_page)} if next_page else {}),
     }
 
 
+def next_link(request, next_page):
+    """Return the URL of the next page, with the same query as the current one."""
+    url = request.url.remove_query_params(["$skip", "$skiptoken", "$top"])
+    return str(
+        url.include_query_params(
+            **{key: value for key, value in next_page.items() if value is not None}
+        )
+    )
+
+
 @app.get("/TransformationOrders/$count")
 async def transformation_orders_count(
     request: Request,
@@ -111,7 +162,15 @@ async def transformation_orders_count(
     user = get_user(x_username, x_roles)
     logger.info(f"user: {user.username} - required the transformation orders count")
     results = await transformation_orders(
-        rawfilter=None, count=True, x_username=x_username, x_roles=x_roles
+        request,
+        rawfilter=None,
+        count=True,
+        top=0,
+        skip=0,
+        orderby=None,
+        skiptoken=None,
+        x_username=x_username,
+        x_roles=x_roles,
     )
     return results["odata.count"]
 
@@ -129,7 +188,7 @@ async def get_transformation_order(
         f"user: {user_id} - required info about the transformation order '{id}'"
     )
     base = request.url_for("transformation_orders")
-    data = api.get_transformation_order(id, user_id=user_id)
+    data = await run_blocking(api.get_transformation_order, id, user_id=user_id)
     return {
         "@odata.id": f"{base}('{id}')",
         "Id": id,
@@ -148,7 +207,7 @@ async def get_transformation_order_log(
     logger.info(
         f"user: {user_id} - required the log-file for the transformation order '{id}'"
     )
-    log = api.get_transformation_order_log(id, user_id=user_id)
+    log = await run_blocking(api.get_transformation_order_log, id, user_id=user_id)
     return {
         "value": log,
     }
@@ -164,7 +223,11 @@ async def get_transformation_order_log_raw(
     return "\n".join(log.get("value", []))
 
 
-@app.post("/TransformationOrders", status_code=201)
+@app.post(
+    "/TransformationOrders",
+    status_code=201,
+    dependencies=[Depends(workflow_catalogue_loaded)],
+)
 async def transformation_order_create(
     request: Request,
     response: Response,
@@ -175,7 +238,8 @@ async def transformation_order_create(
     uri_root = request.url_for("index")
     user = get_user(x_username, x_roles)
     user_id = user.username if user else DEFAULT_USER
-    running_transformation = api.submit_workflow(
+    running_transformation = await run_blocking(
+        api.submit_workflow,
         data.workflow_id,
         input_product_reference=data.product_reference.dict(
             by_alias=True, exclude_unset=True
@@ -0,0 +1,32 @@
+import functools
+import os
+
+import anyio
+import anyio.to_thread
+
+DEFAULT_THREADPOOL_SIZE = 16
+
+_limiter = None
+
+
+def get_limiter():
+    """
+    Return the limiter bounding the threads that run the blocking calls of the requests,
+    sized by the environment variable ``REST_THREADPOOL_SIZE`` (default 16).
+    """
+    global _limiter
+
+    if _limiter is None:
+        size = int(os.getenv("REST_THREADPOOL_SIZE", DEFAULT_THREADPOOL_SIZE))
+        _limiter = anyio.CapacityLimiter(max(size, 1))
+    return _limiter
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` in the bounded thread pool, so that the calls to the
+    Dask client and the file system do not block the event loop serving the requests.
+    """
+    return await anyio.to_thread.run_sync(
+        functools.partial(func, *args, **kwargs), limiter=get_limiter()
+    )
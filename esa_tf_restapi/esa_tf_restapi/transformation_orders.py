@@ -1,10 +1,17 @@
+import contextlib
+import glob
+import heapq
+import json
 import logging
-import operator
 import os
+import threading
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
+
+import dask.distributed
 
 from .auth import DEFAULT_USER
+from .order_index import OrderIndex, parse_filter, sort_key
 
 STATUS_DASK_TO_API = {
     "pending": "in_progress",
@@ -13,6 +20,23 @@ STATUS_DASK_TO_API = {
     "lost": "failed",
     "cancelled": "in_progress",  # the cancelled status can occur when the order is re-submitted
 }
+# scheduler states of the tasks that are not completed: the completion is reported by the
+# callback of the future, together with the result
+TASK_STATE_TO_API = {
+    "waiting": "in_progress",
+    "no-worker": "in_progress",
+    "queued": "in_progress",
+    "processing": "in_progress",
+}
+# final states of the tasks, followed only for the orders restored without a future
+FINISHED_TASK_STATES = ("memory", "erred")
+# statuses of the orders counted in the users quota
+RUNNING_STATUSES = ("in_progress", "queued")
+# suffix of the manifest written by the workers next to the output product
+MANIFEST_SUFFIX = ".manifest.json"
+# topic on which the scheduler plugin publishes the transitions of the orders tasks
+ORDERS_STATUS_TOPIC = "esa_tf-orders-status"
+ORDERS_STATUS_PLUGIN = "esa_tf-orders-status"
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +50,13 @@ class TransformationOrder(object):
         "_task_parameters",
         "_uri_root",
         "_output_product_path",
+        "_output_product_manifest",
         "_task_id",
+        "_locality",
+        "_on_update",
+        "_reattached",
+        "_reserved",
+        "_info_lock",
     )
 
     def __init__(
@@ -40,13 +70,21 @@ class TransformationOrder(object):
         enable_monitoring=True,
         monitoring_polling_time_s=10,
         uri_root="",
+        locality=None,
     ):
         self._client = client
+        self._locality = locality
         self._order_id = order_id
         self._uri_root = uri_root
         self._output_product_path = ""
+        self._output_product_manifest = {}
         self._future = None
         self._task_id = order_id
+        self._on_update = None
+        self._reattached = False
+        self._reserved = False
+        # the info is updated by the threads of the Dask callbacks and events
+        self._info_lock = threading.RLock()
 
         self._task_parameters = {
             "order_id": order_id,
@@ -76,22 +114,181 @@ class TransformationOrder(object):
 
         if id_suffix is not None:
             self._task_id = self._task_parameters["order_id"] + "-" + id_suffix
-        self._future = self._client.submit(
-            task, **self._task_parameters, key=self._task_id
-        )
-        self._info["SubmissionDate"] = datetime.now().isoformat()
-        self.update_status()
+        self._reattached = False
+        try:
+            self._future = self._client.submit(
+                task, **self._task_parameters, key=self._task_id, **self.get_placement()
+            )
+        finally:
+            self._reserved = False
+        # the task keeps running if the API is restarted, it is followed again by key
+        dask.distributed.fire_and_forget(self._future)
+        with self._info_lock:
+            # already set if the order has been reserved
+            self._info.setdefault("SubmissionDate", datetime.now().isoformat())
+            self._set_future_status()
+        self.notify_update()
         self._future.add_done_callback(self.add_completed_info)
 
+    def to_record(self):
+        """Return the JSON serializable record of the order kept by the order store."""
+        with self._info_lock:
+            return {
+                "order_id": self._order_id,
+                "task_id": self._task_id,
+                "task_parameters": self._task_parameters,
+                "info": dict(self._info),
+                "uri_root": self._uri_root,
+                "output_product_path": self._output_product_path,
+                "output_product_manifest": self._output_product_manifest,
+            }
+
+    @classmethod
+    def from_record(cls, record, client=None, locality=None):
+        """Return the order of the ``record`` of the order store, without its future."""
+        task_parameters = record["task_parameters"]
+        transformation_order = cls(
+            client=client,
+            order_id=task_parameters["order_id"],
+            product_reference=task_parameters["product_reference"],
+            workflow_id=task_parameters["workflow_id"],
+            workflow_options=task_parameters["workflow_options"],
+            enable_monitoring=task_parameters["enable_monitoring"],
+            monitoring_polling_time_s=task_parameters["monitoring_polling_time_s"],
+            uri_root=record["uri_root"],
+            locality=locality,
+        )
+        transformation_order.load_record(record)
+        return transformation_order
+
+    def load_record(self, record):
+        """Update the order with the ``record`` written by another process. If the order
+        has been re-submitted, its future is no longer followed."""
+        with self._info_lock:
+            if record["task_id"] != self._task_id:
+                self._future = None
+                self._reattached = False
+            self._task_id = record["task_id"]
+            self._info = record["info"]
+            self._output_product_path = record["output_product_path"]
+            self._output_product_manifest = record["output_product_manifest"]
+
+    def set_client(self, client):
+        self._client = client
+
+    def has_future(self):
+        return self._future is not None
+
+    def is_reserved(self):
+        """Return True if the order is reserved and its task is not submitted yet."""
+        return self._reserved
+
+    def find_output_product(self):
+        """Return the path of the output product of the order, relative to the output
+        dir, if it is on disk with its manifest."""
+        output_dir = os.getenv("OUTPUT_DIR", "./output_dir")
+        order_id = self._task_parameters["order_id"]
+        pattern = os.path.join(output_dir, glob.escape(order_id), "*" + MANIFEST_SUFFIX)
+        for manifest in sorted(glob.glob(pattern)):
+            product = manifest[: -len(MANIFEST_SUFFIX)]
+            if os.path.exists(product):
+                return os.path.join(order_id, os.path.basename(product))
+        return None
+
+    def follow_task_events(self):
+        """
+        Follow the task of the order restored after a restart of the API with the events
+        of the scheduler plugin, without a future: the order is completed or failed when
+        its task is.
+        """
+        self._reattached = True
+
+    def reattach(self, task_state):
+        """
+        Update the order restored after a restart of the API with the current
+        ``task_state`` of its task, None if the task is no longer known by the scheduler.
+        The order is completed if its task has finished and its output product is on disk,
+        failed if not.
+        """
+        if self.get_status() in ("completed", "failed"):
+            # already reported by an event
+            return
+        self._reattached = True
+        if task_state in TASK_STATE_TO_API:
+            self.update_task_state(task_state)
+        else:
+            self.complete_from_output_dir(task_state != "erred")
+
+    def complete_from_output_dir(self, finished=True):
+        """Complete the order with the output product on disk, fail it if there is none
+        or if its task has not ``finished``."""
+        output_product_path = self.find_output_product() if finished else None
+        with self._info_lock:
+            if output_product_path:
+                self._output_product_path = output_product_path
+                self.load_output_product_manifest()
+                self.update_output_product_reference()
+                self._info["Status"] = "completed"
+            else:
+                self._info["Status"] = "failed"
+            now = datetime.now().isoformat()
+            self._info.setdefault("SubmissionDate", now)
+            self._info["CompletedDate"] = now
+        self.notify_update()
+
+    @property
+    def task_id(self):
+        return self._task_id
+
+    def set_update_callback(self, callback):
+        """Set the function called with the order when its status or dates change."""
+        self._on_update = callback
+
+    def notify_update(self):
+        if self._on_update is not None:
+            self._on_update(self)
+
+    def get_placement(self):
+        """Return the submit keyword arguments that prefer the workers on the hosts that
+        already hold the input product, if any.
+        """
+        if self._locality is None:
+            return {}
+        product = self._task_parameters["product_reference"]["Reference"]
+        hosts = self._locality.get_hosts(product)
+        if not hosts:
+            return {}
+        logger.info(f"product {product!r} is held by the workers on hosts {hosts!r}")
+        return {"workers": hosts, "allow_other_workers": True}
+
+    def reserve(self, resubmit=False):
+        """
+        Mark the order as in progress before its task is submitted, with a new task key
+        if it is ``resubmit``-ted: the reservation is written in the order store, so that
+        the task can be submitted after the end of the store transaction, see ``submit``.
+        """
+        with self._info_lock:
+            if resubmit:
+                self._future = None
+                self._task_id = (
+                    self._task_parameters["order_id"] + "-" + uuid.uuid4().hex
+                )
+                self._clean_completed_info()
+            self._reattached = False
+            self._reserved = True
+            self._info["SubmissionDate"] = datetime.now().isoformat()
+            self._info["Status"] = "in_progress"
+        self.notify_update()
+
     def resubmit(self):
         if self.get_status == "failed":
             self.client.retry(self.future)
         else:
-            self._future = None
-            self.clean_completed_info()
-            self.submit(id_suffix=uuid.uuid4().hex)
+            self.reserve(resubmit=True)
+            self.submit()
 
-    def maybe_resubmit(self):
+    def needs_resubmission(self):
+        """Return True if the order has failed or if its output product has been removed."""
         status = self.get_status()
         order_id = self._task_parameters["order_id"]
         logger.info(f"oder {order_id!r} status is {status!r}")
@@ -105,60 +302,126 @@ class TransformationOrder(object):
                     f"oder {order_id!r} output product {full_output_path!r} not found: "
                     f"re-submitting order {order_id!r}"
                 )
-                self.resubmit()
+                return True
         elif status == "failed":
             logger.info(f"re-submitting order {order_id!r}")
+            return True
+        return False
+
+    def maybe_resubmit(self):
+        if self.needs_resubmission():
             self.resubmit()
 
+    def load_output_product_manifest(self):
+        """Read size and checksum of the output product from the manifest written by the
+        worker next to the product."""
+        output_dir = os.getenv("OUTPUT_DIR", "./output_dir")
+        path = os.path.join(output_dir, self._output_product_path + MANIFEST_SUFFIX)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as ex:
+            logger.warning(
+                f"not able to read the output product manifest {path!r}: {ex}"
+            )
+            self._output_product_manifest = {}
+            return
+        self._output_product_manifest = {
+            key: manifest[key] for key in ("Size", "Checksum") if key in manifest
+        }
+
     def update_output_product_reference(self):
         basepath, reference = os.path.split(self._output_product_path)
         uri_root = self._uri_root or ""
+        # replaced, not modified, so that the copies of the info are not changed
         self._info["OutputProductReference"] = [
             {
                 "Reference": reference,
                 "DownloadURI": f"{uri_root}download/{basepath}/{reference}",
+                **self._output_product_manifest,
             }
         ]
 
     def add_completed_info(self, future=None):
-        if self._future.status == "cancelled":
-            self.clean_completed_info()
-        else:
-            self.update_status()
-            status = self.get_status()
-
-            if status in ("completed", "failed"):
-                self._info["CompletedDate"] = datetime.now().isoformat()
-            if status == "completed":
-                self._output_product_path = self._future.result()
-                self.update_output_product_reference()
-
-    def clean_completed_info(self):
+        if future is not None and future is not self._future:
+            # callback of the future of a previous submission
+            return
+        # the result is read before taking the lock, it may wait for the scheduler
+        status = STATUS_DASK_TO_API.get(self._future.status, self._future.status)
+        output_product_path = self._future.result() if status == "completed" else None
+        with self._info_lock:
+            if self._future.status == "cancelled":
+                self._clean_completed_info()
+                self._set_future_status()
+            else:
+                self._set_future_status()
+                if status in ("completed", "failed"):
+                    self._info["CompletedDate"] = datetime.now().isoformat()
+                if status == "completed":
+                    self._output_product_path = output_product_path
+                    self.load_output_product_manifest()
+                    self.update_output_product_reference()
+        self.notify_update()
+
+    def _clean_completed_info(self):
         self._info.pop("Status", None)
         self._info.pop("CompletedDate", None)
         self._info.pop("OutputProductReference", None)
         self._output_product_path = ""
+        self._output_product_manifest = {}
+
+    def clean_completed_info(self):
+        with self._info_lock:
+            self._clean_completed_info()
+        self.notify_update()
 
     def get_info(self):
-        self.update_status()
-        if self.get_status() == "completed":
-            self.update_output_product_reference()
-        return self._info
+        """Return a copy of the info of the order. The status is kept up to date by the
+        callback of the future and by the transitions published by the scheduler: the
+        Dask cluster is not queried."""
+        with self._info_lock:
+            return dict(self._info)
 
     def get_log(self):
-        seconds_logs = self._client.get_events(self._future.key)
+        seconds_logs = self._client.get_events(self._task_id)
         logs = []
         for seconds, log in seconds_logs:
             logs.append(log)
         return logs
 
-    def update_status(self):
+    def _set_future_status(self):
         future_status = self._future.status
         self._info["Status"] = STATUS_DASK_TO_API.get(future_status, future_status)
 
+    def update_status(self):
+        with self._info_lock:
+            self._set_future_status()
+        self.notify_update()
+
+    def update_task_state(self, state):
+        """Update the status with the ``state`` of the task published by the scheduler."""
+        if self._reattached and state in FINISHED_TASK_STATES:
+            if self.get_status() not in ("completed", "failed"):
+                self.complete_from_output_dir(state == "memory")
+            return
+        status = TASK_STATE_TO_API.get(state)
+        if status is None:
+            return
+        with self._info_lock:
+            if self._info.get("Status") in ("completed", "failed"):
+                if self._future is not None and self._future.status in (
+                    "finished",
+                    "error",
+                ):
+                    # late event of the task, the completion of the future is kept
+                    return
+                # the task is computed again, e.g. its result has been lost with a worker
+                self._clean_completed_info()
+            self._info["Status"] = status
+        self.notify_update()
+
     def get_status(self):
-        self.update_status()
-        return self._info["Status"]
+        return self._info.get("Status")
 
     def get_dask_orders_status(self):
         def orders_status_on_scheduler(dask_scheduler):
@@ -169,26 +432,311 @@ class TransformationOrder(object):
         return self._client.run_on_scheduler(orders_status_on_scheduler)
 
 
+def register_orders_status_plugin(client):
+    """
+    Register in the scheduler a plugin publishing on the ``ORDERS_STATUS_TOPIC`` topic the
+    transitions of the tasks to the states in ``TASK_STATE_TO_API`` and
+    ``FINISHED_TASK_STATES``.
+    """
+    # definition of the plugin must be internal
+    # to avoid dask to import esa_tf_restapi in the scheduler
+    topic = ORDERS_STATUS_TOPIC
+    states = set(TASK_STATE_TO_API) | set(FINISHED_TASK_STATES)
+
+    class OrdersStatusPlugin(dask.distributed.SchedulerPlugin):
+        name = ORDERS_STATUS_PLUGIN
+
+        async def start(self, scheduler):
+            self.scheduler = scheduler
+
+        def transition(self, key, start, finish, *args, **kwargs):
+            if finish in states:
+                self.scheduler.log_event(topic, {"key": key, "state": finish})
+
+    client.register_plugin(OrdersStatusPlugin())
+
+
 class Queue(object):
-    __slots__ = ("transformation_orders", "user_to_orders", "order_to_users")
+    """
+    Transformation orders submitted and the users that requested them, with the secondary
+    indexes used to filter them. The queue is accessed by the request handlers from
+    several threads: the lock guards the updates and the lookups in the indexes.
+    If an order store is set, the orders, their users and the transitions of their status
+    are written in the store. The store can be shared with other processes of the API: the
+    orders changed by them are copied in the queue by ``sync`` as replicas, which are
+    not written in the store unless they are submitted again by this process.
+    """
+
+    __slots__ = (
+        "transformation_orders",
+        "user_to_orders",
+        "order_to_users",
+        "index",
+        "completed_heap",
+        "running_counts",
+        "store",
+        "replicas",
+        "synced_seq",
+        "_lock",
+    )
 
     def __init__(self):
         self.transformation_orders = {}
         self.user_to_orders = {}
         self.order_to_users = {}
-
-    def add_order(self, transformation_order, user_id=DEFAULT_USER):
+        self.index = OrderIndex()
+        # min-heap of (CompletedDate, order ID) of the completed and failed orders, the
+        # entries of the orders re-submitted or removed are discarded when popped
+        self.completed_heap = []
+        # user ID -> number of running orders required by the user
+        self.running_counts = {}
+        self.store = None
+        # IDs of the orders followed by other processes sharing the store
+        self.replicas = set()
+        # sequence number of the last change of the store copied in the queue
+        self.synced_seq = 0
+        self._lock = threading.RLock()
+
+    def add_order(self, transformation_order, user_id=DEFAULT_USER, write=True):
+        """Add the order required by ``user_id``. If ``write`` is False, the change is
+        not written in the store, e.g. when it is copied from the store."""
         order_id = transformation_order.get_info()["Id"]
-        if order_id not in self.transformation_orders:
-            self.transformation_orders[order_id] = transformation_order
-        self.user_to_orders.setdefault(user_id, set()).add(order_id)
-        self.order_to_users.setdefault(order_id, set()).add(user_id)
-
-    def remove_order(self, order_id):
-        self.transformation_orders.pop(order_id)
-        users_ids = self.order_to_users.pop(order_id, [])
+        with self._lock:
+            if order_id not in self.transformation_orders:
+                self.transformation_orders[order_id] = transformation_order
+                transformation_order.set_update_callback(self.update_index)
+                self._update_index(transformation_order, write=write)
+            users_ids = self.order_to_users.setdefault(order_id, set())
+            if user_id not in users_ids:
+                if self._is_running(order_id):
+                    self._count_running(user_id, 1)
+                if self.store is not None and write:
+                    self.store.add_user(order_id, user_id)
+            self.user_to_orders.setdefault(user_id, set()).add(order_id)
+            users_ids.add(user_id)
+
+    def remove_order(self, order_id, write=True):
+        with self._lock:
+            transformation_order = self.transformation_orders.pop(order_id)
+            transformation_order.set_update_callback(None)
+            running = self._is_running(order_id)
+            self.index.remove(order_id)
+            users_ids = self.order_to_users.pop(order_id, [])
+            for user_id in users_ids:
+                self.user_to_orders[user_id].discard(order_id)
+                if running:
+                    self._count_running(user_id, -1)
+            self.replicas.discard(order_id)
+            if self.store is not None and write:
+                self.store.remove_order(order_id)
+
+    def claim(self, order_id):
+        """Follow the order copied from the store, to be submitted again by this process."""
+        with self._lock:
+            self.replicas.discard(order_id)
+
+    def update_index(self, transformation_order):
+        """Update the indexed values of ``transformation_order`` after a change."""
+        info = transformation_order.get_info()
+        with self._lock:
+            if self.transformation_orders.get(info["Id"]) is transformation_order:
+                self._update_index(transformation_order)
+
+    def _update_index(self, transformation_order, write=True):
+        info = transformation_order.get_info()
+        order_id = info["Id"]
+        previous_values = self.index.values.get(order_id, {})
+        was_running = previous_values.get("Status") in RUNNING_STATUSES
+        self.index.update(order_id, info)
+        if order_id in self.replicas and transformation_order.has_future():
+            # submitted again by this process
+            self.replicas.discard(order_id)
+        if self.store is not None and write and order_id not in self.replicas:
+            self.store.save_order(transformation_order.to_record())
+            status = info.get("Status")
+            if status != previous_values.get("Status"):
+                self.store.add_transition(order_id, status, datetime.now().isoformat())
+        completed_date = self.index.values[order_id]["CompletedDate"]
+        if completed_date and completed_date != previous_values.get("CompletedDate"):
+            heapq.heappush(self.completed_heap, (completed_date, order_id))
+        running = self._is_running(order_id)
+        if running != was_running:
+            for user_id in self.order_to_users.get(order_id, []):
+                self._count_running(user_id, 1 if running else -1)
+
+    def _is_running(self, order_id):
+        return self.index.values[order_id]["Status"] in RUNNING_STATUSES
+
+    def _count_running(self, user_id, delta):
+        count = self.running_counts.get(user_id, 0) + delta
+        if count:
+            self.running_counts[user_id] = count
+        else:
+            self.running_counts.pop(user_id, None)
+
+    def check_running_counts(self, repair=False):
+        """
+        Recompute from scratch the number of running orders of each user and return the
+        users whose counter differs, as a dictionary user ID -> (counter, actual count).
+        If ``repair`` is True, the counters are replaced with the recomputed ones.
+        """
+        with self._lock:
+            running_counts = {}
+            for user_id, order_ids in self.user_to_orders.items():
+                count = sum(self._is_running(order_id) for order_id in order_ids)
+                if count:
+                    running_counts[user_id] = count
+            differences = {
+                user_id: (
+                    self.running_counts.get(user_id, 0),
+                    running_counts.get(user_id, 0),
+                )
+                for user_id in set(running_counts) | set(self.running_counts)
+                if self.running_counts.get(user_id, 0) != running_counts.get(user_id, 0)
+            }
+            if differences:
+                logger.warning(f"inconsistent running orders counters: {differences!r}")
+                if repair:
+                    self.running_counts = running_counts
+        return differences
+
+    def restore(self, store, locality=None):
+        """
+        Load the orders of ``store`` in the queue, rebuilding the indexes, and write the
+        following changes in the store. The orders are restored without their futures,
+        see ``TransformationOrder.reattach``.
+        """
+        seq = store.last_change()
+        records = store.load()
+        with self._lock:
+            self.synced_seq = seq
+            for record, users_ids in records:
+                transformation_order = TransformationOrder.from_record(
+                    record, locality=locality
+                )
+                for user_id in users_ids or [DEFAULT_USER]:
+                    self.add_order(transformation_order, user_id=user_id)
+            self.store = store
+        logger.info(f"{len(records)} transformation orders restored")
+
+    def sync(self, locality=None):
+        """
+        Copy in the queue the orders changed by the other processes sharing the store,
+        updating the indexes and the running counters. The orders followed by this process
+        are updated only if they have been submitted again by another process.
+        """
+        store = self.store
+        if store is None:
+            return
+        seq, changed = store.changes(self.synced_seq)
+        reload = changed is None
+        if reload:
+            records = store.load()
+            changed = {record["order_id"]: (record, users) for record, users in records}
+        with self._lock:
+            if seq <= self.synced_seq:
+                # already copied by a concurrent call
+                return
+            self.synced_seq = seq
+            if reload:
+                for order_id in self.replicas - set(changed):
+                    changed[order_id] = (None, [])
+            # the changes copied from the store are not written again
+            for order_id, (record, users_ids) in changed.items():
+                self._sync_order(order_id, record, users_ids, locality)
+
+    def _sync_order(self, order_id, record, users_ids, locality):
+        transformation_order = self.transformation_orders.get(order_id)
+        if record is None:
+            if transformation_order is not None:
+                self.remove_order(order_id, write=False)
+            return
+        if transformation_order is None:
+            if not users_ids:
+                # the users of the order are not written yet
+                return
+            self.replicas.add(order_id)
+            transformation_order = TransformationOrder.from_record(
+                record, locality=locality
+            )
+        elif (
+            order_id in self.replicas
+            or record["task_id"] != transformation_order.task_id
+        ):
+            self.replicas.add(order_id)
+            transformation_order.load_record(record)
+            self._update_index(transformation_order, write=False)
         for user_id in users_ids:
-            self.user_to_orders[user_id].discard(order_id)
+            self.add_order(transformation_order, user_id=user_id, write=False)
+
+    @contextlib.contextmanager
+    def submission(self, locality=None):
+        """
+        Return a context manager serializing the submissions of all the processes sharing
+        the store, with the queue up to date: the quotas are checked against the orders of
+        all the processes, and the orders submitted are written at the exit.
+        """
+        store = self.store
+        if store is None:
+            yield
+            return
+        with store.transaction():
+            self.sync(locality=locality)
+            yield
+
+    def get_orders_without_future(self):
+        """Return the orders restored from the store and not submitted again."""
+        with self._lock:
+            return [
+                transformation_order
+                for transformation_order in self.transformation_orders.values()
+                if not transformation_order.has_future()
+            ]
+
+    def get_orders_to_reattach(self):
+        """Return the orders in progress without a future, restored from the store: the
+        orders reserved and not submitted yet are skipped."""
+        with self._lock:
+            return [
+                transformation_order
+                for order_id, transformation_order in self.transformation_orders.items()
+                if not transformation_order.has_future()
+                and not transformation_order.is_reserved()
+                and self._is_running(order_id)
+                and order_id not in self.replicas
+            ]
+
+    def attach(self, client):
+        """Subscribe to the transitions of the orders tasks published by the scheduler."""
+        client.subscribe_topic(ORDERS_STATUS_TOPIC, self.handle_event)
+        try:
+            register_orders_status_plugin(client)
+        except Exception:
+            logger.exception(
+                "registration of the orders status plugin failed: "
+                "the status of the orders is updated only on completion"
+            )
+
+    def handle_event(self, event):
+        _, msg = event
+        key = msg["key"]
+        # the task key is the order ID, with a suffix if the order has been re-submitted
+        order = self.get_order(str(key).split("-", 1)[0])
+        if order is not None and order.task_id == key:
+            order.update_task_state(msg["state"])
+
+    def get_order(self, order_id):
+        """Return the transformation order ``order_id``, None if it is not in the queue."""
+        with self._lock:
+            return self.transformation_orders.get(order_id)
+
+    def get_user_orders(self, user_id):
+        """Return a snapshot of the transformation orders requested by ``user_id``."""
+        with self._lock:
+            return {
+                order_id: self.transformation_orders[order_id]
+                for order_id in self.user_to_orders.get(user_id, [])
+            }
 
     def update_orders(self, orders, user_id=DEFAULT_USER):
         for order in orders:
@@ -197,6 +745,7 @@ class Queue(object):
     def remove_old_orders(self, keeping_period, reference_time=None):
         """Update the queue removing only the
         transformations with statuses `completed` or `failed` that are older than the `keeping_period`.
+        The expired orders are popped from the heap of the completed orders.
         It returns the list of order-IDs that have been deleted.
 
         :param int keeping_period: the minimum number of minutes from the CompletedDate that a
@@ -205,18 +754,18 @@ class Queue(object):
         :return list:
         """
         now = datetime.now() if reference_time is None else reference_time
-        # find completed or failed orders that are older than keeping_period
+        threshold = now - timedelta(minutes=keeping_period)
         orders_to_remove = []
-        for order_id, order in self.transformation_orders.items():
-            completed_date = order.get_info().get("CompletedDate", None)
-            if completed_date:
-                elapsed_minutes = (
-                    now - datetime.fromisoformat(completed_date)
-                ).total_seconds() / 60  # in minutes
-                if elapsed_minutes > keeping_period:
-                    orders_to_remove.append(order_id)
-        for order_id in orders_to_remove:
-            self.remove_order(order_id)
+        with self._lock:
+            while self.completed_heap and self.completed_heap[0][0] < threshold:
+                completed_date, order_id = heapq.heappop(self.completed_heap)
+                values = self.index.values.get(order_id)
+                if values is None or values["CompletedDate"] != completed_date:
+                    # the order has been removed or re-submitted
+                    continue
+                self.remove_order(order_id)
+                orders_to_remove.append(order_id)
+        return orders_to_remove
 
     def get_count_uncompleted_orders(self, user_id):
         """Return the number of running processes (i.e. status equal to `in_progress`) among those
@@ -225,11 +774,7 @@ class Queue(object):
         :param str user_id: user identifier
         :return int: count of uncompleted orders
         """
-        running_processes = 0
-        for order_id in self.user_to_orders.get(user_id, []):
-            order_status = self.transformation_orders[order_id].get_status()
-            running_processes += order_status in ("in_progress", "queued")
-        return running_processes
+        return self.running_counts.get(user_id, 0)
 
     def get_transformation_orders(
         self,
@@ -237,32 +782,53 @@ class Queue(object):
         user_id=DEFAULT_USER,
         filter_by_user_id=True,
     ):
-        if not filter_by_user_id:
-            transformation_orders = self.transformation_orders.copy()
-        else:
-            transformation_orders = {
-                order_id: self.transformation_orders[order_id]
-                for order_id in self.user_to_orders.get(user_id, [])
+        """
+        Return the transformation orders matching all the ``filters``, a list of
+        ``(key, operator, value)``, among those required by ``user_id`` (all of them if
+        ``filter_by_user_id`` is False).
+        """
+        filters = [parse_filter(odata_filter) for odata_filter in filters]
+        with self._lock:
+            order_ids = self.user_to_orders.get(user_id, set())
+            order_ids = self.index.select(
+                filters, order_ids=order_ids if filter_by_user_id else None
+            )
+            return {
+                order_id: self.transformation_orders[order_id] for order_id in order_ids
             }
 
-        valid_orders = {}
-        for order_id, order in transformation_orders.items():
-            order_info = self.transformation_orders[order_id].get_info()
-            add_order = True
-            for key, op, value in filters:
-                if key == "CompletedDate" and "CompletedDate" not in order_info:
-                    add_order = False
-                    continue
-                op = getattr(operator, op)
-                if key == "InputProductReference":
-                    order_value = order_info["InputProductReference"]["Reference"]
-                else:
-                    order_value = order_info[key]
-                if key in {"CompletedDate", "SubmissionDate"}:
-                    order_value = datetime.fromisoformat(order_value)
-                    value = datetime.fromisoformat(value)
-                add_order = add_order and op(order_value, value)
-            if add_order:
-                valid_orders[order_id] = order
-
-        return valid_orders
+    def get_transformation_orders_page(
+        self,
+        filters=[],
+        user_id=DEFAULT_USER,
+        filter_by_user_id=True,
+        orderby="SubmissionDate",
+        descending=False,
+        skip=0,
+        limit=None,
+        after=None,
+    ):
+        """
+        Return the list of the transformation orders selected as in
+        ``get_transformation_orders``, sorted by ``orderby`` and then by ID, skipping the
+        first ``skip`` ones and those up to ``after``, the ``(value, order ID)`` of the last
+        order of the previous page, and at most ``limit`` of them.
+        """
+        filters = [parse_filter(odata_filter) for odata_filter in filters]
+        if after is not None:
+            value, order_id = after
+            if value is not None:
+                value = parse_filter((orderby, "eq", value))[2]
+            after = (sort_key(value), order_id)
+        with self._lock:
+            order_ids = self.user_to_orders.get(user_id, set())
+            order_ids = self.index.page(
+                filters,
+                order_ids=order_ids if filter_by_user_id else None,
+                orderby=orderby,
+                descending=descending,
+                skip=skip,
+                limit=limit,
+                after=after,
+            )
+            return [self.transformation_orders[order_id] for order_id in order_ids]
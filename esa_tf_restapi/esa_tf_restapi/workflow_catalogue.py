@@ -0,0 +1,217 @@
+import collections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# topic on which the workers publish the version of their workflows registry
+WORKFLOWS_REGISTRY_TOPIC = "esa_tf-workflows-registry"
+
+
+class WorkflowCatalogue(object):
+    """
+    Catalogue of the workflows installed in the workers, kept in memory so that the
+    requests never wait for the cluster.
+
+    The workers publish the version (content hash) of their workflows registry on the
+    ``WORKFLOWS_REGISTRY_TOPIC`` Dask topic when they start and when the registry is
+    reloaded. The catalogue is loaded again, in background, only when the version shared
+    by most of the workers differs from the loaded one. Workers publishing different
+    versions are reported.
+    """
+
+    __slots__ = (
+        "workflows",
+        "version",
+        "worker_versions",
+        "_client",
+        "_refreshing",
+        "_lock",
+        "_load_lock",
+    )
+
+    def __init__(self):
+        self.workflows = {}
+        self.version = None
+        self.worker_versions = {}
+        self._client = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.version is not None
+
+    def get_workflows(self):
+        """Return the workflows of the loaded catalogue, empty if not loaded yet."""
+        return dict(self.workflows)
+
+    def expected_version(self):
+        """Return the version of the workflows registry of most of the workers."""
+        with self._lock:
+            versions = collections.Counter(self.worker_versions.values())
+        if not versions:
+            return None
+        return versions.most_common(1)[0][0]
+
+    def outdated(self):
+        """Return True if the loaded catalogue is not the one of most of the workers."""
+        expected_version = self.expected_version()
+        return expected_version is not None and expected_version != self.version
+
+    def disagreements(self):
+        """Return the workers of each version, if the workers have different versions."""
+        with self._lock:
+            workers_by_version = {}
+            for worker, version in self.worker_versions.items():
+                workers_by_version.setdefault(version, []).append(worker)
+        if len(workers_by_version) <= 1:
+            return {}
+        return {
+            version: sorted(workers) for version, workers in workers_by_version.items()
+        }
+
+    def update(self, worker, version):
+        """Record the version of the workflows registry of ``worker`` and load the
+        catalogue again if it is outdated."""
+        with self._lock:
+            previous = self.worker_versions.get(worker)
+            self.worker_versions[worker] = version
+        if previous != version:
+            logger.info(f"worker {worker!r} workflows registry version: {version}")
+            self.check_consistency()
+        if self.outdated():
+            self.refresh_in_background()
+
+    def handle_event(self, event):
+        _, msg = event
+        self.update(msg["worker"], msg["version"])
+
+    def prune_workers(self):
+        """Forget the versions of the workers that left the cluster, using the workers
+        list already known by the client."""
+        if self._client is None:
+            return
+        workers = self._client.scheduler_info().get("workers", {})
+        with self._lock:
+            for worker in set(self.worker_versions) - set(workers):
+                self.worker_versions.pop(worker)
+
+    def check_consistency(self):
+        disagreements = self.disagreements()
+        if disagreements:
+            logger.warning(
+                f"the workers have different workflows registries: {disagreements!r}"
+            )
+        return disagreements
+
+    def synchronize(self, client):
+        """Ask the workers the version of their workflows registry and load the
+        catalogue if it is outdated."""
+
+        # definition of the task must be internal
+        # to avoid dask to import esa_tf_restapi in the workers
+        def task():
+            import esa_tf_platform
+
+            version, _ = esa_tf_platform.get_workflows_registry()
+            return version
+
+        worker_versions = client.run(task)
+        with self._lock:
+            self.worker_versions = dict(worker_versions)
+        self.check_consistency()
+        if self.outdated():
+            self.refresh(client)
+
+    def load(self, client):
+        """Load the catalogue waiting for the workers if it has never been loaded, for the
+        requests arriving before the end of the load in background."""
+        with self._load_lock:
+            if not self.loaded:
+                self.synchronize(client)
+
+    def refresh(self, client):
+        """Load the catalogue from a worker with the expected version."""
+
+        # definition of the task must be internal
+        # to avoid dask to import esa_tf_restapi in the workers
+        def task():
+            import esa_tf_platform
+
+            return esa_tf_platform.get_workflows_registry()
+
+        self.prune_workers()
+        expected_version = self.expected_version()
+        with self._lock:
+            workers = [
+                worker
+                for worker, version in self.worker_versions.items()
+                if version == expected_version
+            ]
+        if not workers:
+            return
+        results = client.run(task, workers=workers[:1])
+        worker, (version, workflows) = next(iter(results.items()))
+        with self._lock:
+            self.worker_versions[worker] = version
+            self.workflows = workflows
+            self.version = version
+        logger.info(
+            f"workflows catalogue version {version} loaded: {sorted(workflows)}"
+        )
+
+    def refresh_in_background(self):
+        with self._lock:
+            if self._refreshing or self._client is None:
+                return
+            self._refreshing = True
+        client = self._client
+
+        def refresh():
+            refreshed = False
+            try:
+                self.refresh(client)
+                refreshed = True
+            except Exception:
+                logger.exception("loading of the workflows catalogue failed")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+            # the versions published while loading may require another refresh
+            if refreshed and self.outdated():
+                self.refresh_in_background()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def attach(self, client):
+        """
+        Subscribe to the registry versions published by the workers and load the
+        catalogue in background.
+        """
+        self._client = client
+        client.subscribe_topic(WORKFLOWS_REGISTRY_TOPIC, self.handle_event)
+
+        def synchronize():
+            try:
+                self.synchronize(client)
+            except Exception:
+                logger.exception("synchronization of the workflows catalogue failed")
+
+        threading.Thread(target=synchronize, daemon=True).start()
+
+    def to_dict(self):
+        self.prune_workers()
+        with self._lock:
+            worker_versions = dict(self.worker_versions)
+        return {
+            "Version": self.version,
+            "Loaded": self.loaded,
+            "Workflows": sorted(self.workflows),
+            "Workers": [
+                {"Worker": worker, "Version": version}
+                for worker, version in sorted(worker_versions.items())
+            ],
+            "Disagreements": self.disagreements(),
+        }
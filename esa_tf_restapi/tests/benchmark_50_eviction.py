@@ -0,0 +1,55 @@
+"""
+Timing of the eviction of the old transformation orders with ``ORDERS`` retained orders,
+popping the heap of the completed orders. They are not collected by default, run them
+with:
+
+    python -m pytest -s tests/benchmark_50_eviction.py
+"""
+
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from esa_tf_restapi import transformation_orders
+
+KEEPING_PERIOD = 60  # minutes
+EXPIRED = 100
+
+
+def make_queue(orders):
+    queue = transformation_orders.Queue()
+    start = datetime(2022, 1, 20)
+    for number in range(orders):
+        order = transformation_orders.TransformationOrder(
+            client=None,
+            order_id=f"Id{number}",
+            product_reference={"Reference": f"product_{number}.zip"},
+            workflow_id="workflow_1",
+            workflow_options={},
+        )
+        completed_date = start + timedelta(seconds=number)
+        order._info["Status"] = "completed"
+        order._info["CompletedDate"] = completed_date.isoformat()
+        queue.add_order(order)
+    return queue, start
+
+
+@pytest.mark.parametrize("orders", [10_000, 100_000])
+def test_benchmark_remove_old_orders(orders):
+    queue, start = make_queue(orders)
+    now = start + timedelta(minutes=KEEPING_PERIOD)
+
+    begin = time.perf_counter()
+    assert queue.remove_old_orders(KEEPING_PERIOD, reference_time=now) == []
+    print(
+        f"\n{orders} orders, none expired: {(time.perf_counter() - begin) * 1000:.3f} ms"
+    )
+
+    begin = time.perf_counter()
+    evicted = queue.remove_old_orders(
+        KEEPING_PERIOD, reference_time=now + timedelta(seconds=EXPIRED)
+    )
+    elapsed = (time.perf_counter() - begin) * 1000
+    assert len(evicted) == EXPIRED
+    print(f"{orders} orders, {EXPIRED} expired: {elapsed:.3f} ms")
@@ -0,0 +1,87 @@
+"""
+Load test of ``GET /TransformationOrders`` while transformation orders are submitted
+concurrently, with the submission blocking for ``SUBMIT_TIME`` seconds as a slow Dask
+scheduler would. The latency is measured with the blocking calls pushed to the thread pool
+and with the blocking calls run in the event loop, as before. They are not collected by
+default, run them with:
+
+    python -m pytest -s tests/benchmark_50_load.py
+"""
+
+import statistics
+import time
+from unittest import mock
+
+import anyio
+import httpx
+import pytest
+
+from esa_tf_restapi import api, app
+from esa_tf_restapi.routes import user
+
+from .test_models import register_workflows
+from .test_threadpool import TRANSFORMATION_ORDER
+
+SUBMIT_TIME = 0.02
+POSTERS = 4
+GETS = 100
+GET_INTERVAL = 0.005
+
+
+def submit_workflow(*args, **kwargs):
+    time.sleep(SUBMIT_TIME)
+    return {"Id": "foo"}
+
+
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+async def load():
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        done = anyio.Event()
+
+        async def post_loop():
+            while not done.is_set():
+                response = await client.post(
+                    "/TransformationOrders", json=TRANSFORMATION_ORDER
+                )
+                assert response.status_code == 201
+                # the in-process transport has no network I/O giving back the control
+                await anyio.sleep(0)
+
+        async with anyio.create_task_group() as tg:
+            for _ in range(POSTERS):
+                tg.start_soon(post_loop)
+            for _ in range(GETS):
+                # the latency is measured from the time the request is due, since a
+                # blocked event loop delays also the sending of the request
+                due = time.perf_counter() + GET_INTERVAL
+                await anyio.sleep(GET_INTERVAL)
+                await client.get("/TransformationOrders")
+                latencies.append(time.perf_counter() - due)
+            done.set()
+    return latencies
+
+
+def report(label, latencies):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(
+        f"\n{label}: GET /TransformationOrders p50 {quantiles[49] * 1000:.1f} ms, "
+        f"p99 {quantiles[98] * 1000:.1f} ms"
+    )
+
+
+@pytest.mark.parametrize("blocking", ["threadpool", "event loop"])
+def test_benchmark_get_during_posts(register_workflows, blocking):
+    with mock.patch.object(api, "submit_workflow", submit_workflow), mock.patch.object(
+        api, "get_transformation_orders_page", return_value={"value": []}
+    ):
+        if blocking == "event loop":
+            with mock.patch.object(user, "run_blocking", run_inline):
+                latencies = anyio.run(load)
+        else:
+            latencies = anyio.run(load)
+    report(f"blocking calls in the {blocking}", latencies)
@@ -0,0 +1,101 @@
+"""
+Timing of the filtering of the transformation orders with the secondary indexes and with
+the scan of all the orders used before, parsing the dates of every order. They are not
+collected by default, run them with:
+
+    python -m pytest -s tests/benchmark_50_order_index.py
+"""
+
+import operator
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from esa_tf_restapi import order_index
+
+REPEAT = 3
+FILTERS = {
+    "Id": [("Id", "eq", "Id42")],
+    "Status": [("Status", "eq", "failed")],
+    "Status and WorkflowId": [
+        ("Status", "eq", "in_progress"),
+        ("WorkflowId", "eq", "workflow_3"),
+    ],
+    "recent SubmissionDate": [("SubmissionDate", "ge", "2022-01-20T23:00:00")],
+    "CompletedDate range": [
+        ("CompletedDate", "gt", "2022-01-20T12:00:00"),
+        ("CompletedDate", "lt", "2022-01-20T12:10:00"),
+    ],
+}
+
+
+def make_infos(orders):
+    rng = random.Random(0)
+    start = datetime(2022, 1, 20)
+    step = timedelta(days=1) / orders
+    infos = []
+    for number in range(orders):
+        submission_date = start + number * step
+        info = {
+            "Id": f"Id{number}",
+            "InputProductReference": {"Reference": f"product_{number % 1000}.zip"},
+            "WorkflowId": f"workflow_{number % 10}",
+            "Status": rng.choice(["in_progress", "completed", "completed", "failed"]),
+            "SubmissionDate": submission_date.isoformat(),
+        }
+        if info["Status"] != "in_progress":
+            info["CompletedDate"] = (submission_date + timedelta(minutes=5)).isoformat()
+        infos.append(info)
+    return infos
+
+
+def scan(infos, filters):
+    """Filtering of the transformation orders before the indexes."""
+    valid_orders = []
+    for order_info in infos:
+        add_order = True
+        for key, op, value in filters:
+            if key == "CompletedDate" and "CompletedDate" not in order_info:
+                add_order = False
+                continue
+            op = getattr(operator, op)
+            if key == "InputProductReference":
+                order_value = order_info["InputProductReference"]["Reference"]
+            else:
+                order_value = order_info[key]
+            if key in {"CompletedDate", "SubmissionDate"}:
+                order_value = datetime.fromisoformat(order_value)
+                value = datetime.fromisoformat(value)
+            add_order = add_order and op(order_value, value)
+        if add_order:
+            valid_orders.append(order_info["Id"])
+    return valid_orders
+
+
+def timeit(func):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = func()
+    return (time.perf_counter() - start) / REPEAT * 1000, result
+
+
+@pytest.mark.parametrize("orders", [10_000, 100_000, 1_000_000])
+def test_benchmark_order_index(orders):
+    infos = make_infos(orders)
+    index = order_index.OrderIndex()
+    start = time.perf_counter()
+    for info in infos:
+        index.update(info["Id"], info)
+    print(f"\n{orders} orders indexed in {time.perf_counter() - start:.2f} s")
+
+    for label, filters in FILTERS.items():
+        scan_time, expected = timeit(lambda: scan(infos, filters))
+        parsed_filters = [order_index.parse_filter(f) for f in filters]
+        index_time, selected = timeit(lambda: index.select(parsed_filters))
+        assert sorted(selected) == sorted(expected)
+        print(
+            f"{label}: scan {scan_time:.2f} ms, index {index_time:.2f} ms "
+            f"({len(selected)} orders)"
+        )
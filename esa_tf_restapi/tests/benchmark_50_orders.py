@@ -0,0 +1,54 @@
+"""
+Timing of the listing of ``ORDERS`` transformation orders, reading the status kept up to
+date by the events and polling the status of the futures on every read, as before. They
+are not collected by default, run them with:
+
+    python -m pytest -s tests/benchmark_50_orders.py
+"""
+
+import time
+
+import dask.distributed
+
+from esa_tf_restapi import api, transformation_orders
+
+ORDERS = 50_000
+
+
+def make_queue(client):
+    queue = transformation_orders.Queue()
+    for index in range(ORDERS):
+        order = transformation_orders.TransformationOrder(
+            client=client,
+            order_id=f"{index:032x}",
+            product_reference={"Reference": f"product_{index}.zip"},
+            workflow_id="workflow_1",
+            workflow_options={},
+        )
+        order._future = dask.distributed.Future(order.task_id, client)
+        order._info["SubmissionDate"] = "2022-01-20T16:20:00"
+        order.update_status()
+        queue.add_order(order)
+    return queue
+
+
+def test_benchmark_list_orders(monkeypatch):
+    with dask.distributed.Client(
+        processes=False, n_workers=1, dashboard_address=None
+    ) as client:
+        queue = make_queue(client)
+        monkeypatch.setattr(api, "queue", queue)
+
+        start = time.perf_counter()
+        api.get_transformation_orders(filter_by_user_id=False)
+        print(f"\nstatus kept by the events: {time.perf_counter() - start:.3f} s")
+
+        start = time.perf_counter()
+        for order in queue.transformation_orders.values():
+            order.update_status()
+        api.get_transformation_orders(filter_by_user_id=False)
+        print(f"status polled on every read: {time.perf_counter() - start:.3f} s")
+
+        # release the futures before closing the client
+        monkeypatch.undo()
+        del queue
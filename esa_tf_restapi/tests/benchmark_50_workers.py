@@ -0,0 +1,105 @@
+"""
+Throughput of ``GET /TransformationOrders`` served by ``uvicorn --workers N`` sharing the
+order store, with ``ORDERS`` orders restored by every worker and ``CLIENTS`` client
+processes per worker sending requests for ``DURATION`` seconds. The throughput scales with
+the workers up to the number of CPUs. They are not collected by default, run them with:
+
+    python -m pytest -s tests/benchmark_50_workers.py
+"""
+
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import pytest
+
+from esa_tf_restapi import order_store, transformation_orders
+
+pytest.importorskip("uvicorn")
+
+ORDERS = 1000
+CLIENTS = 2
+DURATION = 5  # sec
+URL = "/TransformationOrders?$filter=Status eq 'failed'"
+HEADERS = {"X-Username": "user1"}
+
+
+def make_store(path):
+    queue = transformation_orders.Queue()
+    queue.restore(order_store.SQLiteOrderStore(path))
+    for number in range(ORDERS):
+        order = transformation_orders.TransformationOrder(
+            client=None,
+            order_id=f"Id{number}",
+            product_reference={"Reference": f"product_{number}.zip"},
+            workflow_id="workflow_1",
+            workflow_options={},
+        )
+        order._info["Status"] = "failed" if number % 10 == 0 else "completed"
+        order._info["SubmissionDate"] = "2022-01-20T16:20:00"
+        order._info["CompletedDate"] = "2022-01-20T16:30:00"
+        queue.add_order(order, user_id="user1")
+    queue.store.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, port, store_path):
+    env = {
+        **os.environ,
+        "ORDER_STORE_URL": f"sqlite:///{store_path}",
+        "SCHEDULER": "",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "esa_tf_restapi:app"]
+        + ["--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    # every worker restores the orders before accepting the requests
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            response = httpx.get(f"http://127.0.0.1:{port}{URL}", headers=HEADERS)
+            if len(response.json()["value"]) == ORDERS // 10:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("the server did not start")
+
+
+def send_requests(port):
+    requests = 0
+    with httpx.Client(base_url=f"http://127.0.0.1:{port}", headers=HEADERS) as client:
+        end = time.monotonic() + DURATION
+        while time.monotonic() < end:
+            assert client.get(URL).status_code == 200
+            requests += 1
+    return requests
+
+
+@pytest.mark.parametrize("workers", [1, 2, 4])
+def test_benchmark_workers(workers, tmpdir):
+    store_path = str(tmpdir.join("orders.db"))
+    make_store(store_path)
+    port = free_port()
+    server = start_server(workers, port, store_path)
+    try:
+        with multiprocessing.Pool(CLIENTS * workers) as pool:
+            requests = sum(pool.map(send_requests, [port] * CLIENTS * workers))
+    finally:
+        server.terminate()
+        server.wait()
+    print(
+        f"\n{workers} workers ({os.cpu_count()} CPUs): "
+        f"{requests / DURATION:.0f} requests/s"
+    )
@@ -62,7 +62,7 @@ def get_workflow_by_id(id, user_id):
     raise api.ItemNotFound(user_id, f"Cannot find {id}")
 
 
-def get_transformation_orders(
+def get_transformation_orders_page(
     filters: T.List[T.Tuple[str, str, str]] = [], uri_root=None, **kwargs
 ):
     entries = [
@@ -73,7 +73,7 @@ def get_transformation_orders(
         name, _op, value = filter
         if name == "Status":
             entries = [e for e in entries if e[name] == value]
-    return entries
+    return {"value": entries, "odata.count": len(entries)}
 
 
 @mock.patch(
@@ -108,8 +108,8 @@ def test_get_workflow(workflow, profile):
     return_value="user",
 )
 @mock.patch(
-    "esa_tf_restapi.api.get_transformation_orders",
-    side_effect=get_transformation_orders,
+    "esa_tf_restapi.api.get_transformation_orders_page",
+    side_effect=get_transformation_orders_page,
 )
 def test_list_tranformation_orders(tr_orders, profile):
     response = client.get("/TransformationOrders")
@@ -126,8 +126,8 @@ def test_list_tranformation_orders(tr_orders, profile):
     side_effect=["user", "manager"],
 )
 @mock.patch(
-    "esa_tf_restapi.api.get_transformation_orders",
-    side_effect=get_transformation_orders,
+    "esa_tf_restapi.api.get_transformation_orders_page",
+    side_effect=get_transformation_orders_page,
 )
 def test_list_admin_tranformation_orders(tr_orders, profile):
     response = client.get("/admin/TransformationOrders")
@@ -141,8 +141,8 @@ def test_list_admin_tranformation_orders(tr_orders, profile):
     return_value="user",
 )
 @mock.patch(
-    "esa_tf_restapi.api.get_transformation_orders",
-    side_effect=get_transformation_orders,
+    "esa_tf_restapi.api.get_transformation_orders_page",
+    side_effect=get_transformation_orders_page,
 )
 def test_list_tranformation_orders_count(tr_orders, profile):
     response = client.get("/TransformationOrders/$count")
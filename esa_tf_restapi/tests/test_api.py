@@ -1,9 +1,14 @@
+import threading
 from unittest import mock
 
+import anyio
+import httpx
 import pytest
 
 import esa_tf_restapi
 
+from .test_config import config_file
+
 WORKFLOW_OPTIONS = {
     "Name1": {
         "Description": "",
@@ -234,3 +239,182 @@ def test_check_filter_validity():
 
     with pytest.raises(esa_tf_restapi.api.RequestError, match=r"allowed operator"):
         esa_tf_restapi.api.check_filter_validity([("Status", "le", "value")])
+
+
+def test_evict_orders_in_background():
+    evicted = threading.Event()
+    with mock.patch.object(
+        esa_tf_restapi.api, "evict_orders", side_effect=evicted.set
+    ) as evict_orders:
+        thread = esa_tf_restapi.api.evict_orders_in_background(interval=0.01)
+        assert esa_tf_restapi.api.evict_orders_in_background() is thread
+        assert evicted.wait(5)
+        esa_tf_restapi.api.stop_evicting_orders()
+
+    assert not thread.is_alive()
+    assert evict_orders.called
+
+
+def test_get_running_orders(monkeypatch):
+    queue = esa_tf_restapi.transformation_orders.Queue()
+    queue.running_counts = {"user_2": 1, "user_1": 3}
+    monkeypatch.setattr(esa_tf_restapi.api, "queue", queue)
+
+    assert esa_tf_restapi.api.get_running_orders() == {
+        "value": [
+            {"UserId": "user_1", "RunningOrders": 3},
+            {"UserId": "user_2", "RunningOrders": 1},
+        ],
+        "Inconsistencies": [
+            {"UserId": "user_1", "Counter": 3, "Actual": 0},
+            {"UserId": "user_2", "Counter": 1, "Actual": 0},
+        ],
+    }
+
+    assert esa_tf_restapi.api.get_running_orders(repair=True)["value"] == []
+
+
+def make_paging_queue(monkeypatch):
+    queue = esa_tf_restapi.transformation_orders.Queue()
+    monkeypatch.setattr(esa_tf_restapi.api, "queue", queue)
+    monkeypatch.setenv("ORDERS_PAGE_SIZE", "2")
+    for order_id, order in TRANSFORMATION_ORDERS.items():
+        transformation_order = esa_tf_restapi.transformation_orders.TransformationOrder(
+            **{**TO_KWARGS, "order_id": order_id}
+        )
+        transformation_order._info = dict(order._info)
+        queue.add_order(transformation_order)
+    return queue
+
+
+def test_get_transformation_orders_page(monkeypatch):
+    make_paging_queue(monkeypatch)
+    get_page = esa_tf_restapi.api.get_transformation_orders_page
+
+    # the orders with the same SubmissionDate are sorted by Id
+    page = get_page(orderby=[("SubmissionDate", "desc")], count=True)
+    assert [order["Id"] for order in page["value"]] == ["Id5", "Id4"]
+    assert page["odata.count"] == 5
+    assert page["next"]["$top"] is None
+    page = get_page(
+        orderby=[("SubmissionDate", "desc")], skiptoken=page["next"]["$skiptoken"]
+    )
+    assert [order["Id"] for order in page["value"]] == ["Id3", "Id2"]
+    page = get_page(
+        orderby=[("SubmissionDate", "desc")], skiptoken=page["next"]["$skiptoken"]
+    )
+    assert [order["Id"] for order in page["value"]] == ["Id1"]
+    assert "next" not in page
+
+    page = get_page(filters=[("Status", "eq", "completed")], top=3)
+    assert [order["Id"] for order in page["value"]] == ["Id1", "Id2"]
+    assert "next" not in page
+    page = get_page(top=3)
+    assert page["next"]["$top"] == 1
+    page = get_page(top=1, skiptoken=page["next"]["$skiptoken"])
+    assert [order["Id"] for order in page["value"]] == ["Id3"]
+    assert "next" not in page
+
+    page = get_page(orderby=[("Status", "asc")], skip=2, top=1)
+    assert [order["Id"] for order in page["value"]] == ["Id5"]
+    page = get_page(orderby=[("CompletedDate", "asc")])
+    assert [order["Id"] for order in page["value"]] == ["Id3", "Id4"]
+
+    with pytest.raises(esa_tf_restapi.api.RequestError, match=r"sorted by"):
+        get_page(orderby=[("WorkflowId", "asc")])
+    with pytest.raises(esa_tf_restapi.api.RequestError, match=r"sorted by"):
+        get_page(orderby=[("Status", "asc"), ("SubmissionDate", "asc")])
+    with pytest.raises(esa_tf_restapi.api.RequestError, match=r"skiptoken"):
+        get_page(skiptoken="foo")
+
+
+def test_transformation_orders_next_link(monkeypatch):
+    make_paging_queue(monkeypatch)
+
+    async def main():
+        transport = httpx.ASGITransport(app=esa_tf_restapi.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            first = await client.get(
+                "/TransformationOrders",
+                params={"$orderby": "SubmissionDate desc", "$top": 3, "$count": True},
+            )
+            second = await client.get(first.json()["@odata.nextLink"])
+            count = await client.get("/TransformationOrders/$count")
+        return first.json(), second.json(), count.json()
+
+    first, second, count = anyio.run(main)
+
+    assert [order["Id"] for order in first["value"]] == ["Id5", "Id4"]
+    assert first["odata.count"] == 5
+    next_link = httpx.URL(first["@odata.nextLink"])
+    assert next_link.params["$orderby"] == "SubmissionDate desc"
+    assert next_link.params["$top"] == "1"
+    assert [order["Id"] for order in second["value"]] == ["Id3"]
+    assert "@odata.nextLink" not in second
+    assert count == 5
+
+
+def test_transformation_orders_empty_orderby(monkeypatch):
+    make_paging_queue(monkeypatch)
+
+    async def main():
+        transport = httpx.ASGITransport(app=esa_tf_restapi.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return [
+                await client.get("/TransformationOrders", params={"$orderby": orderby})
+                for orderby in ("Status,", "")
+            ]
+
+    responses = anyio.run(main)
+
+    assert [response.status_code for response in responses] == [422, 422]
+
+
+def test_submission_on_cold_start(monkeypatch, config_file):
+    workflows = {
+        "sen2cor_l1c_l2a": {
+            "Id": "sen2cor_l1c_l2a",
+            "WorkflowName": "Sen2Cor",
+            "Description": "Sen2Cor processor",
+            "InputProductType": "S2MSI1C",
+            "OutputProductType": "S2MSI2A",
+            "WorkflowVersion": "0.1",
+            "WorkflowOptions": {"Aerosol_Type": {"Type": "string"}},
+        }
+    }
+    client = mock.MagicMock()
+    client.run.side_effect = lambda task, workers=None: (
+        {"tcp://10.0.0.1:4000": ("v1", workflows)}
+        if workers
+        else {"tcp://10.0.0.1:4000": "v1"}
+    )
+    client.scheduler_info.return_value = {"workers": {"tcp://10.0.0.1:4000": {}}}
+    catalogue = esa_tf_restapi.workflow_catalogue.WorkflowCatalogue()
+    monkeypatch.setattr(esa_tf_restapi.api, "workflow_catalogue", catalogue)
+    monkeypatch.setattr(esa_tf_restapi.api, "instantiate_client", lambda _: client)
+    submit_workflow = mock.MagicMock(return_value={"Id": "Id1"})
+    monkeypatch.setattr(esa_tf_restapi.api, "submit_workflow", submit_workflow)
+
+    async def main():
+        transport = httpx.ASGITransport(app=esa_tf_restapi.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as http_client:
+            return await http_client.post(
+                "/TransformationOrders",
+                json={
+                    "WorkflowId": "sen2cor_l1c_l2a",
+                    "InputProductReference": {"Reference": "product.zip"},
+                    "WorkflowOptions": {"Aerosol_Type": "MARITIME"},
+                },
+            )
+
+    # the catalogue has never been loaded: the request waits for its load
+    response = anyio.run(main)
+    assert response.status_code == 201
+    assert catalogue.loaded
+    assert submit_workflow.call_args.args == ("sen2cor_l1c_l2a",)
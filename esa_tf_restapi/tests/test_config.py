@@ -0,0 +1,78 @@
+import os
+import signal
+
+import pytest
+
+from esa_tf_restapi import api, config
+
+CONFIG = """
+keeping_period: 60
+enable_quota_check: false
+roles:
+    admin:
+        quota: 10
+        profile: manager
+"""
+
+
+@pytest.fixture
+def config_file(tmpdir, monkeypatch):
+    path = tmpdir.join("esa_tf.config")
+    path.write(CONFIG)
+    monkeypatch.setenv("ESA_TF_CONFIG_FILE", path.strpath)
+    config.invalidate_esa_tf_config()
+    yield path
+    config.invalidate_esa_tf_config()
+
+
+def test_read_esa_tf_config(config_file):
+    esa_tf_config = config.read_esa_tf_config()
+
+    assert esa_tf_config.keeping_period == 60
+    assert esa_tf_config.enable_quota_check is False
+    assert esa_tf_config.roles["admin"]["profile"] == "manager"
+    assert esa_tf_config.default_role == {"quota": 1, "profile": "user"}
+    assert config.read_esa_tf_config() is esa_tf_config
+    with pytest.raises(TypeError):
+        esa_tf_config.keeping_period = 10
+
+
+def test_read_esa_tf_config_invalidation(config_file):
+    esa_tf_config = config.read_esa_tf_config()
+
+    config_file.write(CONFIG.replace("60", "120"))
+    stat = os.stat(config_file.strpath)
+    os.utime(config_file.strpath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert config.read_esa_tf_config().keeping_period == 120
+
+    esa_tf_config = config.read_esa_tf_config()
+    config.invalidate_esa_tf_config()
+    assert config.read_esa_tf_config() is not esa_tf_config
+
+
+def test_read_esa_tf_config_sighup(config_file):
+    previous_handler = signal.getsignal(signal.SIGHUP)
+    try:
+        config.install_reload_signal_handler()
+        esa_tf_config = config.read_esa_tf_config()
+        os.kill(os.getpid(), signal.SIGHUP)
+        assert config.read_esa_tf_config() is not esa_tf_config
+    finally:
+        signal.signal(signal.SIGHUP, previous_handler)
+
+
+def test_read_esa_tf_config_errors(tmpdir, monkeypatch):
+    monkeypatch.setenv("ESA_TF_CONFIG_FILE", tmpdir.join("missing").strpath)
+    with pytest.raises(FileNotFoundError):
+        config.read_esa_tf_config()
+
+    path = tmpdir.join("esa_tf.config")
+    path.write("keeping_period: forever")
+    monkeypatch.setenv("ESA_TF_CONFIG_FILE", path.strpath)
+    with pytest.raises(config.ConfigurationError):
+        config.read_esa_tf_config()
+
+
+def test_get_profile(config_file):
+    assert api.get_profile(user_roles=["admin"]) == "manager"
+    assert api.get_profile(user_roles=["unknown"]) == "user"
@@ -0,0 +1,90 @@
+import concurrent.futures
+from unittest import mock
+
+from esa_tf_restapi import locality, transformation_orders
+
+
+def test_product_locality_update():
+    product_locality = locality.ProductLocality()
+
+    product_locality.update("10.0.0.1", ["product_a.zip", "product_b"])
+    product_locality.handle_event(
+        (0.0, {"host": "10.0.0.2", "products": ["product_a"], "held": True})
+    )
+    assert product_locality.get_hosts("product_a.SAFE") == ["10.0.0.1", "10.0.0.2"]
+    assert product_locality.get_hosts("product_b.zip") == ["10.0.0.1"]
+    assert product_locality.get_hosts("product_c") == []
+
+    product_locality.handle_event(
+        (
+            0.0,
+            {"host": "10.0.0.1", "products": ["product_a", "product_b"], "held": False},
+        )
+    )
+    assert product_locality.get_hosts("product_a") == ["10.0.0.2"]
+    assert product_locality.product_to_hosts == {"product_a": {"10.0.0.2"}}
+
+
+def test_product_locality_concurrent_updates():
+    product_locality = locality.ProductLocality()
+    hosts = [f"10.0.1.{number}" for number in range(100)]
+
+    def update():
+        for _ in range(200):
+            for held in (True, False):
+                product_locality.update(hosts[0], ["product_a"], held=True)
+                for host in hosts[1:]:
+                    product_locality.update(host, ["product_a"], held=held)
+
+    def read():
+        return [product_locality.get_hosts("product_a") for _ in range(2000)]
+
+    # the hosts are read while the events of the workers change them
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        updating = pool.submit(update)
+        assert all(hosts[0] in read_hosts for read_hosts in pool.submit(read).result())
+        updating.result()
+
+
+def test_product_locality_synchronize():
+    client = mock.MagicMock()
+    client.run.return_value = {
+        "tcp://10.0.0.1:4000": ["product_a"],
+        "tcp://10.0.0.1:4001": ["product_a"],
+        "tcp://10.0.0.2:4000": ["product_a", "product_b"],
+    }
+    product_locality = locality.ProductLocality()
+    product_locality.update("10.0.0.3", ["product_c"])
+
+    product_locality.synchronize(client)
+
+    assert product_locality.product_to_hosts == {
+        "product_a": {"10.0.0.1", "10.0.0.2"},
+        "product_b": {"10.0.0.2"},
+    }
+
+
+def test_transformation_order_submit_placement():
+    client = mock.MagicMock()
+    product_locality = locality.ProductLocality()
+    product_locality.update("10.0.0.1", ["product_a"])
+
+    for product, placement in [
+        ("product_a.zip", {"workers": ["10.0.0.1"], "allow_other_workers": True}),
+        ("product_b.zip", {}),
+    ]:
+        order = transformation_orders.TransformationOrder(
+            client=client,
+            order_id="order_id",
+            product_reference={"Reference": product},
+            workflow_id="workflow_id",
+            workflow_options={},
+            locality=product_locality,
+        )
+        order.submit()
+        _, kwargs = client.submit.call_args
+        assert {
+            key: kwargs[key]
+            for key in ("workers", "allow_other_workers")
+            if key in kwargs
+        } == placement
@@ -1,6 +1,11 @@
 import pytest
 
-from esa_tf_restapi.odata import parse_qs
+from esa_tf_restapi.odata import (
+    ODataSyntaxError,
+    decode_skiptoken,
+    encode_skiptoken,
+    parse_qs,
+)
 
 
 def test_parse_qs_empty():
@@ -57,3 +62,28 @@ def test_count():
     parsed = parse_qs(filter="name eq 'John'", count=True)
     assert parsed.filter[0]._asdict() == dict(name="name", operator="eq", value="John")
     assert parsed.count == True
+
+
+def test_orderby():
+    parsed = parse_qs(filter=None, orderby="SubmissionDate desc, Status")
+    assert [o._asdict() for o in parsed.orderby] == [
+        dict(name="SubmissionDate", direction="desc"),
+        dict(name="Status", direction="asc"),
+    ]
+    assert parsed.skip == 0
+
+    with pytest.raises(ODataSyntaxError):
+        parse_qs(filter=None, orderby="SubmissionDate down")
+    for orderby in ("Status,", "", " "):
+        with pytest.raises(ODataSyntaxError):
+            parse_qs(filter=None, orderby=orderby)
+
+
+def test_skiptoken():
+    skiptoken = encode_skiptoken("2022-01-20T16:20:00", "Id1")
+    assert decode_skiptoken(skiptoken) == ("2022-01-20T16:20:00", "Id1")
+    assert decode_skiptoken(encode_skiptoken(None, "Id2")) == (None, "Id2")
+
+    for skiptoken in ("foo", encode_skiptoken("value", 1)[:-2]):
+        with pytest.raises(ValueError):
+            decode_skiptoken(skiptoken)
@@ -0,0 +1,234 @@
+import itertools
+import operator
+import random
+from datetime import datetime, timedelta
+
+from esa_tf_restapi import order_index
+
+
+def make_info(order_id, status="in_progress", submission_date=None, **kwargs):
+    info = {
+        "Id": order_id,
+        "InputProductReference": {"Reference": f"product_{order_id}.zip"},
+        "WorkflowId": "workflow_1",
+        "Status": status,
+        "SubmissionDate": submission_date or "2022-01-20T16:20:00",
+        **kwargs,
+    }
+    return info
+
+
+def scan(infos, filters):
+    """Reference implementation: check all the filters on all the orders."""
+    selected = []
+    for info in infos:
+        values = order_index.indexed_values(info)
+        add_order = True
+        for key, op, value in filters:
+            key, op, value = order_index.parse_filter((key, op, value))
+            order_value = info["Id"] if key == "Id" else values[key]
+            if order_value is None:
+                add_order = False
+            else:
+                add_order = add_order and getattr(operator, op)(order_value, value)
+        if add_order:
+            selected.append(info["Id"])
+    return selected
+
+
+def test_sorted_index():
+    index = order_index.SortedIndex()
+    dates = [datetime(2022, 1, day) for day in (3, 1, 2, 2)]
+    for order_id, date in zip("abcd", dates):
+        index.add(date, order_id)
+
+    assert index.keys == sorted(dates)
+    assert index.lookup("lt", datetime(2022, 1, 2)) == ["b"]
+    assert index.lookup("le", datetime(2022, 1, 2)) == ["b", "c", "d"]
+    assert index.lookup("eq", datetime(2022, 1, 2)) == ["c", "d"]
+    assert index.lookup("gt", datetime(2022, 1, 2)) == ["a"]
+    assert index.count("ge", datetime(2022, 1, 2)) == 3
+
+    index.remove(datetime(2022, 1, 2), "d")
+    assert index.lookup("eq", datetime(2022, 1, 2)) == ["c"]
+    assert len(index) == 3
+
+
+def test_order_index_update():
+    index = order_index.OrderIndex()
+    index.update("Id1", make_info("Id1"))
+    index.update("Id2", make_info("Id2"))
+
+    assert index.hash_indexes["Status"] == {"in_progress": {"Id1", "Id2"}}
+    assert len(index.sorted_indexes["CompletedDate"]) == 0
+
+    index.update(
+        "Id1", make_info("Id1", status="completed", CompletedDate="2022-01-20T16:30:00")
+    )
+    assert index.hash_indexes["Status"] == {
+        "in_progress": {"Id2"},
+        "completed": {"Id1"},
+    }
+    assert index.sorted_indexes["CompletedDate"].order_ids == ["Id1"]
+
+    index.update("Id1", make_info("Id1"))
+    assert index.hash_indexes["Status"] == {"in_progress": {"Id1", "Id2"}}
+    assert len(index.sorted_indexes["CompletedDate"]) == 0
+
+    index.remove("Id1")
+    index.remove("Id3")
+    assert list(index.values) == ["Id2"]
+    assert index.hash_indexes["WorkflowId"] == {"workflow_1": {"Id2"}}
+    assert index.sorted_indexes["SubmissionDate"].order_ids == ["Id2"]
+
+
+def test_order_index_plan():
+    index = order_index.OrderIndex()
+    for number in range(10):
+        status = "completed" if number else "failed"
+        index.update(f"Id{number}", make_info(f"Id{number}", status=status))
+
+    filters = [("Status", "eq", "completed"), ("Status", "eq", "failed")]
+    candidates, residual = index.plan(filters)
+    assert set(candidates) == {"Id0"}
+    assert residual == [("Status", "eq", "completed")]
+
+    # the orders of the user are fewer than those selected by the index
+    candidates, residual = index.plan(filters[:1], order_ids={"Id1", "Id2"})
+    assert candidates == {"Id1", "Id2"}
+    assert residual == filters[:1]
+
+    candidates, residual = index.plan([])
+    assert list(candidates) == [f"Id{number}" for number in range(10)]
+
+    # the filters on the same date are merged in a single range
+    filters = [
+        order_index.parse_filter(("SubmissionDate", "ge", "2022-01-20T16:00:00")),
+        order_index.parse_filter(("SubmissionDate", "lt", "2022-01-20T16:20:00")),
+        ("WorkflowId", "eq", "workflow_1"),
+    ]
+    candidates, residual = index.plan(filters)
+    assert candidates == []
+    assert residual == filters[2:]
+
+
+def test_order_index_select():
+    rng = random.Random(0)
+    start = datetime(2022, 1, 20)
+    infos = []
+    for number in range(500):
+        submission_date = start + timedelta(minutes=rng.randrange(100))
+        info = make_info(
+            f"Id{number}",
+            status=rng.choice(["in_progress", "completed", "failed"]),
+            submission_date=submission_date.isoformat(),
+            WorkflowId=rng.choice(["workflow_1", "workflow_2"]),
+        )
+        if info["Status"] != "in_progress":
+            completed_date = submission_date + timedelta(minutes=rng.randrange(100))
+            info["CompletedDate"] = completed_date.isoformat()
+        infos.append(info)
+    index = order_index.OrderIndex()
+    for info in infos:
+        index.update(info["Id"], info)
+
+    middle = (start + timedelta(minutes=50)).isoformat()
+    filters_list = [
+        [],
+        [("Id", "eq", "Id7")],
+        [("Status", "eq", "completed")],
+        [("Status", "eq", "failed"), ("WorkflowId", "eq", "workflow_2")],
+        [("SubmissionDate", "ge", middle), ("Status", "eq", "in_progress")],
+        [("CompletedDate", "lt", middle)],
+        [("CompletedDate", "eq", infos[1].get("CompletedDate", middle))],
+        [("InputProductReference", "eq", "product_Id3.zip")],
+    ]
+    for filters in filters_list:
+        parsed_filters = [order_index.parse_filter(f) for f in filters]
+        selected = index.select(parsed_filters)
+        assert sorted(selected) == sorted(scan(infos, filters))
+
+        order_ids = {f"Id{number}" for number in range(0, 500, 7)}
+        selected = index.select(parsed_filters, order_ids=order_ids)
+        expected = [
+            order_id for order_id in scan(infos, filters) if order_id in order_ids
+        ]
+        assert sorted(selected) == sorted(expected)
+
+
+def test_order_index_page():
+    rng = random.Random(1)
+    start = datetime(2022, 1, 20)
+    infos = []
+    for number in range(300):
+        status = rng.choice(["in_progress", "completed", "failed"])
+        # few distinct dates, to have ties sorted by ID
+        submission_date = start + timedelta(minutes=rng.randrange(20))
+        info = make_info(
+            f"Id{number}", status=status, submission_date=submission_date.isoformat()
+        )
+        if status != "in_progress":
+            info["CompletedDate"] = (submission_date + timedelta(hours=1)).isoformat()
+        infos.append(info)
+    index = order_index.OrderIndex()
+    for info in infos:
+        index.update(info["Id"], info)
+
+    user_order_ids = {f"Id{number}" for number in range(0, 300, 3)}
+    cases = [
+        ([], None),
+        ([("Status", "eq", "failed")], None),
+        ([("Id", "eq", "Id5")], None),
+        ([], user_order_ids),
+        ([("Status", "eq", "completed")], user_order_ids),
+    ]
+    for orderby in order_index.ORDERBY_KEYS:
+        for descending in (False, True):
+            for filters, order_ids in cases:
+                parsed_filters = [order_index.parse_filter(f) for f in filters]
+                expected = sorted(
+                    index.select(parsed_filters, order_ids=order_ids),
+                    key=lambda order_id: (
+                        order_index.sort_key(index.values[order_id][orderby]),
+                        order_id,
+                    ),
+                    reverse=descending,
+                )
+                kwargs = dict(
+                    order_ids=order_ids, orderby=orderby, descending=descending
+                )
+                assert index.page(parsed_filters, **kwargs) == expected
+                assert index.page(parsed_filters, skip=7, limit=5, **kwargs) == (
+                    expected[7:12]
+                )
+
+                # the pages continue after the last order of the previous one, read
+                # both walking the ordering and sorting the selected orders
+                for read in (index._walk, index._sort):
+                    pages, after = [], None
+                    while True:
+                        page = list(
+                            itertools.islice(
+                                read(
+                                    parsed_filters,
+                                    order_ids,
+                                    orderby,
+                                    descending,
+                                    after,
+                                ),
+                                25,
+                            )
+                        )
+                        if not page:
+                            break
+                        pages += page
+                        last = page[-1]
+                        after = (
+                            order_index.sort_key(index.values[last][orderby]),
+                            last,
+                        )
+                    assert pages == expected
+
+    index.remove("Id0")
+    assert "Id0" not in index.page([])
+    assert len(index.orderings["Status"]) == 299
@@ -0,0 +1,420 @@
+import os
+import sqlite3
+import threading
+import time
+
+import dask.distributed
+import pytest
+
+from esa_tf_restapi import api, order_store, transformation_orders
+
+from .test_config import config_file
+
+TO_KWARGS = {
+    "client": None,
+    "product_reference": {"Reference": "product.zip"},
+    "workflow_id": "workflow_1",
+    "workflow_options": {},
+}
+
+
+def make_order(order_id, status="in_progress", **info):
+    transformation_order = transformation_orders.TransformationOrder(
+        **TO_KWARGS, order_id=order_id
+    )
+    transformation_order._info.update(
+        Status=status, SubmissionDate="2022-01-20T16:20:00", **info
+    )
+    return transformation_order
+
+
+def test_sqlite_order_store(tmpdir):
+    store = order_store.open_order_store(f"sqlite:///{tmpdir}/orders.db")
+    record = make_order("Id1").to_record()
+    store.save_order(record)
+    store.add_user("Id1", "user1")
+    store.add_user("Id1", "user1")
+    store.add_transition("Id1", "in_progress", "2022-01-20T16:20:00")
+    # only the last record of the order is written
+    store.save_order({**record, "info": {**record["info"], "Status": "completed"}})
+    store.add_transition("Id1", "completed", "2022-01-20T16:30:00")
+    store.save_order(make_order("Id2").to_record())
+    store.remove_order("Id2")
+    store.close()
+
+    store = order_store.open_order_store(f"sqlite:///{tmpdir}/orders.db")
+    [(loaded_record, users)] = store.load()
+    assert loaded_record["info"]["Status"] == "completed"
+    assert users == ["user1"]
+    assert store.load_transitions("Id1") == [
+        ("in_progress", "2022-01-20T16:20:00"),
+        ("completed", "2022-01-20T16:30:00"),
+    ]
+    assert store.load_transitions("Id2") == []
+    store.close()
+
+
+def test_order_store_interface():
+    class PartialOrderStore(order_store.OrderStore):
+        def save_order(self, record):
+            pass
+
+    # a backend missing a method fails when it is opened, not in the middle of a write
+    with pytest.raises(TypeError):
+        PartialOrderStore()
+
+
+def test_open_order_store(monkeypatch):
+    monkeypatch.setenv("ORDER_STORE_URL", "none")
+    assert order_store.open_order_store() is None
+
+    try:
+        order_store.open_order_store("redis://localhost")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unsupported order store opened")
+
+
+def test_queue_restore(tmpdir):
+    store = order_store.SQLiteOrderStore(str(tmpdir.join("orders.db")))
+    queue = transformation_orders.Queue()
+    queue.store = store
+    queue.add_order(make_order("Id3"), user_id="user1")
+    transformation_order = make_order("Id4")
+    queue.add_order(transformation_order, user_id="user2")
+    transformation_order._info["Status"] = "completed"
+    transformation_order._info["CompletedDate"] = "2022-01-20T16:30:00"
+    transformation_order.notify_update()
+    store.close()
+
+    store = order_store.SQLiteOrderStore(str(tmpdir.join("orders.db")))
+    assert [status for status, _ in store.load_transitions("Id4")] == [
+        "in_progress",
+        "completed",
+    ]
+    restored_queue = transformation_orders.Queue()
+    restored_queue.restore(store)
+
+    assert restored_queue.user_to_orders == {"user1": {"Id3"}, "user2": {"Id4"}}
+    assert restored_queue.get_count_uncompleted_orders("user1") == 1
+    assert restored_queue.get_order("Id4").get_info() == transformation_order.get_info()
+    assert list(
+        restored_queue.get_transformation_orders(
+            filters=[("Status", "eq", "completed")], filter_by_user_id=False
+        )
+    ) == ["Id4"]
+    assert [
+        order.get_info()["Id"] for order in restored_queue.get_orders_to_reattach()
+    ] == ["Id3"]
+
+    # the changes after the restore are written in the store
+    restored_queue.remove_order("Id3")
+    assert [record["order_id"] for record, _ in store.load()] == ["Id4"]
+    store.close()
+
+
+def test_reattach_without_task(tmpdir, monkeypatch):
+    monkeypatch.setenv("OUTPUT_DIR", tmpdir.strpath)
+    output_dir = tmpdir.mkdir("Id5")
+    output_dir.join("product.zip").write("")
+    output_dir.join("product.zip.manifest.json").write('{"Size": 0}')
+
+    transformation_order = make_order("Id5")
+    transformation_order.reattach(None)
+    assert transformation_order.get_status() == "completed"
+    assert transformation_order.get_info()["OutputProductReference"][0] == {
+        "Reference": "product.zip",
+        "DownloadURI": "download/Id5/product.zip",
+        "Size": 0,
+    }
+
+    transformation_order = make_order("Id6")
+    transformation_order.reattach(None)
+    assert transformation_order.get_status() == "failed"
+    assert "CompletedDate" in transformation_order.get_info()
+
+
+def run_workflow(output_dir, duration):
+    time.sleep(duration)
+    product = os.path.join(output_dir, "Id7", "product.zip")
+    os.makedirs(os.path.dirname(product))
+    with open(product, "w"):
+        pass
+    with open(product + ".manifest.json", "w") as f:
+        f.write('{"Size": 0}')
+    return "Id7/product.zip"
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_reattach_orders(tmpdir, monkeypatch):
+    monkeypatch.setenv("OUTPUT_DIR", tmpdir.strpath)
+    queue = transformation_orders.Queue()
+    monkeypatch.setattr(api, "queue", queue)
+    queue.add_order(make_order("Id7"))
+    queue.add_order(make_order("Id8"))
+
+    with dask.distributed.Client(
+        processes=False, n_workers=1, threads_per_worker=1, dashboard_address=None
+    ) as client:
+        # task submitted before the restart of the API
+        future = client.submit(run_workflow, tmpdir.strpath, 0.3, key="Id7")
+        dask.distributed.fire_and_forget(future)
+        wait_for(lambda: any(client.processing().values()))
+        del future
+        queue.attach(client)
+
+        api.reattach_orders(client)
+        assert queue.get_order("Id8").get_status() == "failed"
+        assert queue.get_order("Id7").get_status() == "in_progress"
+
+        wait_for(lambda: queue.get_order("Id7").get_status() != "in_progress")
+        assert queue.get_order("Id7").get_status() == "completed"
+        assert queue.get_order("Id7").get_info()["OutputProductReference"]
+
+
+def test_order_store_changes(tmpdir):
+    path = str(tmpdir.join("orders.db"))
+    store1 = order_store.SQLiteOrderStore(path)
+    store2 = order_store.SQLiteOrderStore(path)
+    store1.save_order(make_order("Id9").to_record())
+    store1.add_user("Id9", "user1")
+    store1.save_order(make_order("Id10").to_record())
+    store1.add_user("Id10", "user1")
+    store1.flush()
+    store2.save_order(make_order("Id11").to_record())
+    store2.add_user("Id11", "user2")
+    store2.flush()
+
+    # the changes written by the store itself are skipped
+    seq, changed = store2.changes(0)
+    assert seq == store1.last_change() == 6
+    assert {order_id: users for order_id, (_, users) in changed.items()} == {
+        "Id9": ["user1"],
+        "Id10": ["user1"],
+    }
+
+    store1.remove_order("Id10")
+    store1.flush()
+    seq, changed = store2.changes(seq)
+    assert seq == 7
+    assert changed == {"Id10": (None, [])}
+    assert store2.changes(seq) == (seq, {})
+
+    store1.prune_changes(retention=-1)
+    assert store2.changes(0) == (seq, None)
+    store1.close()
+    store2.close()
+
+
+def test_queue_sync(tmpdir):
+    path = str(tmpdir.join("orders.db"))
+    queue1 = transformation_orders.Queue()
+    queue1.restore(order_store.SQLiteOrderStore(path))
+    queue2 = transformation_orders.Queue()
+    queue2.restore(order_store.SQLiteOrderStore(path))
+
+    transformation_order = make_order("Id12")
+    queue1.add_order(transformation_order, user_id="user1")
+    queue1.store.flush()
+    queue2.sync()
+    replica = queue2.get_order("Id12")
+    assert queue2.replicas == {"Id12"}
+    assert queue2.get_count_uncompleted_orders("user1") == 1
+    assert queue2.get_orders_to_reattach() == []
+
+    transformation_order._info["Status"] = "completed"
+    transformation_order._info["CompletedDate"] = "2022-01-20T16:30:00"
+    transformation_order.notify_update()
+    queue1.store.flush()
+    queue2.sync()
+    assert replica.get_status() == "completed"
+    assert queue2.get_count_uncompleted_orders("user1") == 0
+
+    # the updates of the replicas are not written
+    replica.update_task_state("processing")
+    queue2.store.flush()
+    queue1.sync()
+    assert transformation_order.get_status() == "completed"
+    assert queue1.replicas == set()
+
+    queue1.remove_order("Id12")
+    queue1.store.flush()
+    queue2.sync()
+    assert queue2.get_order("Id12") is None
+    assert queue2.replicas == set()
+    queue1.store.close()
+    queue2.store.close()
+
+
+def test_queue_submission(tmpdir):
+    path = str(tmpdir.join("orders.db"))
+    queue1 = transformation_orders.Queue()
+    queue1.restore(order_store.SQLiteOrderStore(path))
+    queue2 = transformation_orders.Queue()
+    queue2.restore(order_store.SQLiteOrderStore(path))
+    counts = []
+
+    def submit():
+        with queue2.submission():
+            counts.append(queue2.get_count_uncompleted_orders("user1"))
+
+    with queue1.submission():
+        thread = threading.Thread(target=submit)
+        thread.start()
+        time.sleep(0.1)
+        # the submission of the other process waits for this one
+        assert counts == []
+        queue1.add_order(make_order("Id13"), user_id="user1")
+    thread.join()
+
+    assert counts == [1]
+    queue1.store.close()
+    queue2.store.close()
+
+
+def test_queue_submission_during_sync(tmpdir, monkeypatch):
+    path = str(tmpdir.join("orders.db"))
+    queue1 = transformation_orders.Queue()
+    queue1.restore(order_store.SQLiteOrderStore(path))
+    queue2 = transformation_orders.Queue()
+    queue2.restore(order_store.SQLiteOrderStore(path))
+    queue1.add_order(make_order("Id14"), user_id="user1")
+    queue1.store.flush()
+
+    transaction = order_store.SQLiteOrderStore.transaction
+    in_transaction = threading.Event()
+
+    def tracked_transaction(self):
+        in_transaction.set()
+        return transaction(self)
+
+    monkeypatch.setattr(
+        order_store.SQLiteOrderStore, "transaction", tracked_transaction
+    )
+    sync_order = transformation_orders.Queue._sync_order
+    threads = []
+
+    def submission():
+        with queue2.submission():
+            pass
+
+    def tracked_sync_order(self, *args):
+        # a submission arriving while the changes are copied
+        thread = threading.Thread(target=submission)
+        thread.start()
+        threads.append(thread)
+        in_transaction.wait(1)
+        sync_order(self, *args)
+
+    monkeypatch.setattr(transformation_orders.Queue, "_sync_order", tracked_sync_order)
+    queue2.sync()
+    threads[0].join()
+
+    # the submission is serialized with the other processes
+    assert in_transaction.is_set()
+    assert queue2.store is not None
+    assert queue2.get_count_uncompleted_orders("user1") == 1
+    queue1.store.close()
+    queue2.store.close()
+
+
+class FakeFuture:
+    status = "pending"
+
+    def add_done_callback(self, callback):
+        pass
+
+
+WORKFLOW = {
+    "InputProductType": "S2MSI1C",
+    "WorkflowName": "workflow_1",
+    "WorkflowOptions": {},
+}
+
+
+@pytest.fixture
+def submission_queue(tmpdir, monkeypatch, config_file):
+    queue = transformation_orders.Queue()
+    queue.restore(order_store.SQLiteOrderStore(str(tmpdir.join("orders.db"))))
+    monkeypatch.setattr(api, "queue", queue)
+    monkeypatch.setattr(api, "get_workflow_by_id", lambda *args, **kwargs: WORKFLOW)
+    monkeypatch.setattr(api, "check_product_type", lambda *args, **kwargs: None)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmpdir.join("output")))
+    yield queue
+    queue.store.close()
+
+
+def test_submit_workflow_after_reservation(tmpdir, monkeypatch, submission_queue):
+    path = str(tmpdir.join("orders.db"))
+    other_queue = transformation_orders.Queue()
+    other_queue.restore(order_store.SQLiteOrderStore(path))
+    submitted = []
+
+    class Client:
+        def submit(self, task, key, **kwargs):
+            # the store is not locked while the task is submitted
+            connection = sqlite3.connect(path, timeout=0)
+            connection.execute("BEGIN IMMEDIATE")
+            connection.rollback()
+            connection.close()
+            # the reservation is visible to the other processes
+            other_queue.sync()
+            submitted.append(other_queue.get_order(key).get_status())
+            return FakeFuture()
+
+    monkeypatch.setattr(api, "instantiate_client", lambda: Client())
+
+    info = api.submit_workflow(
+        "workflow_1",
+        input_product_reference={"Reference": "product.zip"},
+        user_id="user1",
+    )
+
+    assert submitted == ["in_progress"]
+    assert info["Status"] == "in_progress"
+    assert submission_queue.get_count_uncompleted_orders("user1") == 1
+    other_queue.store.close()
+
+
+def test_submit_workflow_concurrent_submissions(monkeypatch, submission_queue):
+    submitting = threading.Barrier(2, timeout=5)
+    reattached = []
+
+    def submit(transformation_order):
+        # both the submissions wait for each other
+        submitting.wait()
+        reattached.extend(submission_queue.get_orders_to_reattach())
+        transformation_order._future = FakeFuture()
+
+    monkeypatch.setattr(api, "instantiate_client", lambda: None)
+    monkeypatch.setattr(transformation_orders.TransformationOrder, "submit", submit)
+    infos = []
+
+    def submit_workflow(reference):
+        infos.append(
+            api.submit_workflow(
+                "workflow_1",
+                input_product_reference={"Reference": reference},
+                user_id="user1",
+            )
+        )
+
+    threads = [
+        threading.Thread(target=submit_workflow, args=(reference,))
+        for reference in ("product1.zip", "product2.zip")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [info["Status"] for info in infos] == ["in_progress", "in_progress"]
+    # the reserved orders are not taken for orders restored from the store
+    assert reattached == []
+    assert submission_queue.get_count_uncompleted_orders("user1") == 2
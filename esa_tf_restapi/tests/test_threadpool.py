@@ -0,0 +1,106 @@
+import threading
+import time
+from unittest import mock
+
+import anyio
+import httpx
+
+from esa_tf_restapi import api, app, threadpool
+
+from .test_models import register_workflows
+
+TRANSFORMATION_ORDER = {
+    "WorkflowId": "workflow_1",
+    "InputProductReference": {
+        "Reference": "S2B_MSIL1C_20211109T110159_N0301_R094_T29QQB_20211109T114303.zip"
+    },
+    "WorkflowOptions": {},
+}
+
+
+def test_run_blocking():
+    def task(a, b=0):
+        return a + b, threading.get_ident()
+
+    async def main():
+        return await threadpool.run_blocking(task, 1, b=2)
+
+    result, thread_id = anyio.run(main)
+
+    assert result == 3
+    assert thread_id != threading.get_ident()
+
+
+def test_run_blocking_does_not_block_the_event_loop():
+    ticks = []
+
+    async def tick():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await anyio.sleep(0.01)
+
+    async def main():
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(threadpool.run_blocking, time.sleep, 0.3)
+            tg.start_soon(tick)
+        return time.perf_counter()
+
+    start = time.perf_counter()
+    end = anyio.run(main)
+
+    assert len(ticks) == 5
+    assert ticks[-1] - start < 0.2
+    assert end - start >= 0.3
+
+
+def test_get_limiter(monkeypatch):
+    monkeypatch.setenv("REST_THREADPOOL_SIZE", "3")
+    monkeypatch.setattr(threadpool, "_limiter", None)
+
+    async def main():
+        return threadpool.get_limiter()
+
+    limiter = anyio.run(main)
+
+    assert limiter.total_tokens == 3
+
+
+def test_get_not_blocked_by_post(register_workflows):
+    submitted = threading.Event()
+
+    def submit_workflow(*args, **kwargs):
+        submitted.set()
+        time.sleep(0.5)
+        return {"Id": "foo"}
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            post = None
+
+            async def send_post():
+                nonlocal post
+                post = await client.post(
+                    "/TransformationOrders", json=TRANSFORMATION_ORDER
+                )
+
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(send_post)
+                while not submitted.is_set():
+                    await anyio.sleep(0.01)
+                start = time.perf_counter()
+                get = await client.get("/TransformationOrders")
+                elapsed = time.perf_counter() - start
+        return post, get, elapsed
+
+    with mock.patch.object(api, "submit_workflow", submit_workflow), mock.patch.object(
+        api, "get_transformation_orders_page", return_value={"value": []}
+    ):
+        post, get, elapsed = anyio.run(main)
+
+    assert post.status_code == 201
+    assert get.status_code == 200
+    assert get.json() == {"value": []}
+    assert elapsed < 0.25
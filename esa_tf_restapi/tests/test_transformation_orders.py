@@ -1,6 +1,10 @@
+import concurrent.futures
 import datetime
+import time
 from unittest import mock
 
+import dask.distributed
+
 import esa_tf_restapi
 
 TO_KWARGS = {
@@ -162,3 +166,265 @@ def test_queue_remove_old_orders(function):
         "Id4": {"user_2"},
         "Id5": {"user_3"},
     }
+
+
+@mock.patch(
+    "esa_tf_restapi.api.TransformationOrder.update_status",
+    side_effect=None,
+)
+def test_queue_concurrent_access(function):
+    queue = esa_tf_restapi.transformation_orders.Queue()
+    orders = list(TRANSFORMATION_ORDERS_USER1.values()) + list(
+        TRANSFORMATION_ORDERS_USER2.values()
+    )
+
+    def add_and_read(user_id):
+        for _ in range(100):
+            queue.update_orders(orders, user_id=user_id)
+            queue.get_transformation_orders(filter_by_user_id=False)
+            queue.get_count_uncompleted_orders(user_id)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(add_and_read, [f"user_{i}" for i in range(8)]))
+
+    assert len(queue.transformation_orders) == 4
+    assert len(queue.user_to_orders) == 8
+    assert all(len(users) == 8 for users in queue.order_to_users.values())
+
+
+def test_output_product_reference_manifest(tmpdir, monkeypatch):
+    monkeypatch.setenv("OUTPUT_DIR", tmpdir.strpath)
+    tmpdir.mkdir("Id6").join("product.zip.manifest.json").write(
+        '{"Reference": "product.zip", "Size": 10, '
+        '"Checksum": [{"Algorithm": "SHA256", "Value": "abc"}], "Members": []}'
+    )
+    transformation_order = esa_tf_restapi.transformation_orders.TransformationOrder(
+        **TO_KWARGS, uri_root="http://localhost/"
+    )
+    transformation_order._output_product_path = "Id6/product.zip"
+
+    transformation_order.load_output_product_manifest()
+    transformation_order.update_output_product_reference()
+
+    assert transformation_order._info["OutputProductReference"] == [
+        {
+            "Reference": "product.zip",
+            "DownloadURI": "http://localhost/download/Id6/product.zip",
+            "Size": 10,
+            "Checksum": [{"Algorithm": "SHA256", "Value": "abc"}],
+        }
+    ]
+
+    transformation_order._output_product_path = "Id7/product.zip"
+    transformation_order.load_output_product_manifest()
+    transformation_order.update_output_product_reference()
+
+    assert "Size" not in transformation_order._info["OutputProductReference"][0]
+
+
+def test_get_info_does_not_query_the_future():
+    transformation_order = esa_tf_restapi.transformation_orders.TransformationOrder(
+        **{**TO_KWARGS, "order_id": "Id8"}
+    )
+    transformation_order._future = mock.Mock()
+    type(transformation_order._future).status = mock.PropertyMock(
+        side_effect=AssertionError("the future has been queried")
+    )
+    transformation_order._info["Status"] = "in_progress"
+
+    assert transformation_order.get_info()["Status"] == "in_progress"
+    assert transformation_order.get_status() == "in_progress"
+
+
+def test_get_info_concurrent_updates():
+    transformation_order = esa_tf_restapi.transformation_orders.TransformationOrder(
+        **{**TO_KWARGS, "order_id": "Id8"}
+    )
+    transformation_order._info["Status"] = "in_progress"
+    info = transformation_order.get_info()
+    transformation_order.complete_from_output_dir(finished=False)
+    # the info returned is a copy, not changed by the updates of the order
+    assert info["Status"] == "in_progress"
+    assert "CompletedDate" not in info
+
+    def update():
+        for _ in range(2000):
+            transformation_order.update_task_state("processing")
+            transformation_order.complete_from_output_dir(finished=False)
+
+    def read():
+        infos = [transformation_order.get_info() for _ in range(2000)]
+        # never a failed order without CompletedDate
+        return all(
+            "CompletedDate" in info for info in infos if info["Status"] == "failed"
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        updating = pool.submit(update)
+        assert pool.submit(read).result()
+        updating.result()
+
+
+def test_update_task_state():
+    transformation_order = esa_tf_restapi.transformation_orders.TransformationOrder(
+        **{**TO_KWARGS, "order_id": "Id9"}
+    )
+    transformation_order._info["Status"] = "in_progress"
+
+    transformation_order.update_task_state("memory")
+    assert transformation_order.get_status() == "in_progress"
+
+    transformation_order._info["Status"] = "completed"
+    transformation_order._info["CompletedDate"] = "2022-01-20T16:20:00"
+    transformation_order.update_task_state("processing")
+    assert transformation_order.get_status() == "in_progress"
+    assert "CompletedDate" not in transformation_order.get_info()
+
+
+def test_update_task_state_after_completion(tmpdir, monkeypatch):
+    monkeypatch.setenv("OUTPUT_DIR", str(tmpdir))
+    transformation_order = esa_tf_restapi.transformation_orders.TransformationOrder(
+        **{**TO_KWARGS, "order_id": "Id9"}
+    )
+    future = mock.Mock(status="finished")
+    future.result.return_value = "Id9/product.zip"
+    transformation_order._future = future
+    transformation_order.add_completed_info(future)
+
+    # the event published before the completion is received after the callback
+    transformation_order.update_task_state("processing")
+    assert transformation_order.get_status() == "completed"
+    assert "CompletedDate" in transformation_order.get_info()
+
+    # the task is computed again: the future is pending
+    future.status = "pending"
+    transformation_order.update_task_state("processing")
+    assert transformation_order.get_status() == "in_progress"
+    assert "CompletedDate" not in transformation_order.get_info()
+
+
+def test_queue_handle_event():
+    queue = esa_tf_restapi.transformation_orders.Queue()
+    transformation_order = esa_tf_restapi.transformation_orders.TransformationOrder(
+        **{**TO_KWARGS, "order_id": "Id10"}
+    )
+    transformation_order._info["Status"] = "failed"
+    transformation_order._task_id = "Id10-abc"
+    queue.add_order(transformation_order)
+
+    # events of the tasks of previous submissions are ignored
+    queue.handle_event((0, {"key": "Id10", "state": "processing"}))
+    assert transformation_order.get_status() == "failed"
+
+    queue.handle_event((0, {"key": "Id10-abc", "state": "processing"}))
+    assert transformation_order.get_status() == "in_progress"
+
+    queue.handle_event((0, {"key": "Id11", "state": "processing"}))
+
+
+def test_orders_status_plugin():
+    events = []
+    with dask.distributed.Client(
+        processes=False, n_workers=1, threads_per_worker=1, dashboard_address=None
+    ) as client:
+        client.subscribe_topic(
+            esa_tf_restapi.transformation_orders.ORDERS_STATUS_TOPIC, events.append
+        )
+        esa_tf_restapi.transformation_orders.register_orders_status_plugin(client)
+        client.submit(time.sleep, 0.1, key="Id12").result()
+
+        deadline = time.monotonic() + 5
+        while len(events) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert [msg for _, msg in events] == [
+        {"key": "Id12", "state": "waiting"},
+        {"key": "Id12", "state": "processing"},
+        {"key": "Id12", "state": "memory"},
+    ]
+
+
+def test_queue_index_follows_status():
+    queue = esa_tf_restapi.transformation_orders.Queue()
+    transformation_order = esa_tf_restapi.transformation_orders.TransformationOrder(
+        **{**TO_KWARGS, "order_id": "Id13"}
+    )
+    transformation_order._info["Status"] = "completed"
+    transformation_order._info["CompletedDate"] = "2022-01-20T16:20:00"
+    queue.add_order(transformation_order, user_id="user_1")
+    filters = [("Status", "eq", "in_progress")]
+
+    assert queue.get_transformation_orders(filters, user_id="user_1") == {}
+    assert queue.get_count_uncompleted_orders("user_1") == 0
+
+    transformation_order.update_task_state("processing")
+
+    assert queue.get_transformation_orders(filters, user_id="user_1") == {
+        "Id13": transformation_order
+    }
+    assert queue.get_count_uncompleted_orders("user_1") == 1
+    assert queue.index.sorted_indexes["CompletedDate"].order_ids == []
+
+    queue.remove_order("Id13")
+    transformation_order.update_task_state("queued")
+    assert len(queue.index) == 0
+
+
+def test_queue_remove_old_orders_heap():
+    queue = esa_tf_restapi.transformation_orders.Queue()
+    orders = {}
+    for number, minute in enumerate([30, 10, 20]):
+        order_id = f"Id{20 + number}"
+        orders[order_id] = esa_tf_restapi.transformation_orders.TransformationOrder(
+            **{**TO_KWARGS, "order_id": order_id}
+        )
+        orders[order_id]._info["Status"] = "completed"
+        orders[order_id]._info["CompletedDate"] = f"2022-01-20T16:{minute}:00"
+        queue.add_order(orders[order_id])
+    assert [order_id for _, order_id in queue.completed_heap][:1] == ["Id21"]
+
+    # the re-submitted order is not evicted
+    orders["Id22"].update_task_state("processing")
+
+    now = datetime.datetime(2022, 1, 20, 16, 35)
+    assert queue.remove_old_orders(10, reference_time=now) == ["Id21"]
+    assert set(queue.transformation_orders) == {"Id20", "Id22"}
+    assert queue.completed_heap == [(datetime.datetime(2022, 1, 20, 16, 30), "Id20")]
+
+    now = datetime.datetime(2022, 1, 20, 17, 0)
+    assert queue.remove_old_orders(10, reference_time=now) == ["Id20"]
+    assert set(queue.transformation_orders) == {"Id22"}
+    assert queue.completed_heap == []
+
+
+def test_queue_running_counts():
+    queue = esa_tf_restapi.transformation_orders.Queue()
+    orders = {}
+    for order_id in ("Id30", "Id31"):
+        orders[order_id] = esa_tf_restapi.transformation_orders.TransformationOrder(
+            **{**TO_KWARGS, "order_id": order_id}
+        )
+        orders[order_id]._info["Status"] = "in_progress"
+    queue.add_order(orders["Id30"], user_id="user_1")
+    queue.add_order(orders["Id31"], user_id="user_1")
+    queue.add_order(orders["Id30"], user_id="user_2")
+    queue.add_order(orders["Id30"], user_id="user_2")
+
+    assert queue.running_counts == {"user_1": 2, "user_2": 1}
+
+    orders["Id30"]._info["Status"] = "completed"
+    orders["Id30"].notify_update()
+    assert queue.get_count_uncompleted_orders("user_1") == 1
+    assert queue.get_count_uncompleted_orders("user_2") == 0
+
+    orders["Id30"].update_task_state("processing")
+    assert queue.running_counts == {"user_1": 2, "user_2": 1}
+
+    queue.remove_order("Id30")
+    assert queue.running_counts == {"user_1": 1}
+    assert queue.check_running_counts() == {}
+
+    queue.running_counts["user_3"] = 4
+    assert queue.check_running_counts() == {"user_3": (4, 0)}
+    assert queue.check_running_counts(repair=True) == {"user_3": (4, 0)}
+    assert queue.running_counts == {"user_1": 1}
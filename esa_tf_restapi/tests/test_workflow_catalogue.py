@@ -0,0 +1,99 @@
+import time
+from unittest import mock
+
+from esa_tf_restapi import workflow_catalogue
+
+WORKFLOWS = {"sen2cor_l1c_l2a": {"Id": "sen2cor_l1c_l2a"}}
+
+
+def make_client(worker_versions, registries):
+    client = mock.MagicMock()
+
+    def run(task, workers=None):
+        if workers is None:
+            return dict(worker_versions)
+        return {worker: registries[worker_versions[worker]] for worker in workers}
+
+    client.run.side_effect = run
+    client.scheduler_info.return_value = {
+        "workers": {worker: {} for worker in worker_versions}
+    }
+    return client
+
+
+def test_workflow_catalogue_synchronize():
+    client = make_client(
+        {"tcp://10.0.0.1:4000": "v1", "tcp://10.0.0.2:4000": "v1"},
+        {"v1": ("v1", WORKFLOWS)},
+    )
+    catalogue = workflow_catalogue.WorkflowCatalogue()
+    assert catalogue.get_workflows() == {}
+    assert not catalogue.loaded
+
+    catalogue.synchronize(client)
+
+    assert catalogue.loaded
+    assert catalogue.version == "v1"
+    assert catalogue.get_workflows() == WORKFLOWS
+    assert catalogue.disagreements() == {}
+
+    # the catalogue is not loaded again if the version does not change
+    client.run.reset_mock()
+    catalogue.synchronize(client)
+    assert client.run.call_count == 1
+
+
+def test_workflow_catalogue_disagreements():
+    catalogue = workflow_catalogue.WorkflowCatalogue()
+    catalogue.update("tcp://10.0.0.1:4000", "v1")
+    catalogue.handle_event((0.0, {"worker": "tcp://10.0.0.2:4000", "version": "v2"}))
+    catalogue.update("tcp://10.0.0.3:4000", "v2")
+
+    assert catalogue.expected_version() == "v2"
+    assert catalogue.disagreements() == {
+        "v1": ["tcp://10.0.0.1:4000"],
+        "v2": ["tcp://10.0.0.2:4000", "tcp://10.0.0.3:4000"],
+    }
+
+
+def test_workflow_catalogue_push_refresh():
+    worker_versions = {"tcp://10.0.0.1:4000": "v1"}
+    client = make_client(
+        worker_versions,
+        {"v1": ("v1", WORKFLOWS), "v2": ("v2", {})},
+    )
+    catalogue = workflow_catalogue.WorkflowCatalogue()
+    catalogue.attach(client)
+    client.subscribe_topic.assert_called_once_with(
+        workflow_catalogue.WORKFLOWS_REGISTRY_TOPIC, catalogue.handle_event
+    )
+    wait_for(lambda: catalogue.version == "v1")
+
+    worker_versions["tcp://10.0.0.1:4000"] = "v2"
+    catalogue.handle_event((0.0, {"worker": "tcp://10.0.0.1:4000", "version": "v2"}))
+
+    wait_for(lambda: catalogue.version == "v2")
+    assert catalogue.get_workflows() == {}
+
+
+def test_workflow_catalogue_prune_workers():
+    client = make_client({"tcp://10.0.0.1:4000": "v1"}, {"v1": ("v1", WORKFLOWS)})
+    catalogue = workflow_catalogue.WorkflowCatalogue()
+    catalogue._client = client
+    catalogue.worker_versions = {
+        "tcp://10.0.0.1:4000": "v1",
+        "tcp://10.0.0.2:4000": "v2",
+    }
+
+    info = catalogue.to_dict()
+
+    assert info["Workers"] == [{"Worker": "tcp://10.0.0.1:4000", "Version": "v1"}]
+    assert info["Disagreements"] == {}
+    assert info["Loaded"] is False
+
+
+def wait_for(condition, timeout=5):
+    start = time.monotonic()
+    while not condition():
+        assert time.monotonic() - start < timeout
+        time.sleep(0.01)